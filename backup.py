@@ -0,0 +1,138 @@
+"""
+Резервное копирование БД без остановки приложения
+
+Копия снимается через sqlite3 backup API небольшими порциями страниц:
+между порциями БД доступна остальным соединениям, поэтому работу можно
+вести в фоне, пока приложение открыто. Каждая копия проверяется
+PRAGMA integrity_check; хранятся последние KEEP_GENERATIONS копий.
+
+Запуск без интерфейса (например, из планировщика по ночам):
+    python backup.py [--dir backups] [--keep 7]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Optional
+
+import database
+
+BACKUP_DIR = "backups"
+KEEP_GENERATIONS = 7
+
+# Страниц за шаг (при странице 4 КБ — 1 МБ) и пауза между шагами,
+# чтобы записи из приложения успевали проходить
+PAGES_PER_STEP = 256
+STEP_PAUSE_SEC = 0.005
+
+BACKUP_PREFIX = "shelter-"
+BACKUP_SUFFIX = ".db"
+PART_SUFFIX = ".part"
+
+
+class BackupError(Exception):
+    """Копия не создана или не прошла проверку"""
+
+
+class BackupCancelled(BackupError):
+    """Копирование остановлено (закрытие приложения)"""
+
+
+def list_backups(dest_dir: str = BACKUP_DIR) -> list:
+    """Пути готовых копий от старых к новым"""
+    if not os.path.isdir(dest_dir):
+        return []
+    names = sorted(name for name in os.listdir(dest_dir)
+                   if name.startswith(BACKUP_PREFIX) and name.endswith(BACKUP_SUFFIX))
+    return [os.path.join(dest_dir, name) for name in names]
+
+
+def rotate_backups(dest_dir: str = BACKUP_DIR, keep: int = KEEP_GENERATIONS) -> list:
+    """Удаляет копии сверх keep последних; возвращает удалённые пути"""
+    backups = list_backups(dest_dir)
+    removed = backups[:max(0, len(backups) - keep)]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def check_backup(path: str):
+    """PRAGMA integrity_check копии (BackupError, если она повреждена)"""
+    conn = sqlite3.connect(path)
+    try:
+        result = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    finally:
+        conn.close()
+    if result != ["ok"]:
+        raise BackupError(f"Копия {path} повреждена: {'; '.join(result[:5])}")
+
+
+def create_backup(dest_dir: str = BACKUP_DIR, keep: int = KEEP_GENERATIONS,
+                  progress: Optional[Callable[[int, int], None]] = None,
+                  stop=None, pages: int = PAGES_PER_STEP) -> str:
+    """
+    Снимает копию database.DB_NAME в dest_dir и возвращает её путь.
+    progress(скопировано_страниц, всего_страниц) вызывается после каждого
+    шага в том же потоке; stop — threading.Event для отмены.
+    Копия пишется во временный файл и получает имя только после проверки.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    path = os.path.join(dest_dir, f"{BACKUP_PREFIX}{stamp}{BACKUP_SUFFIX}")
+    part = path + PART_SUFFIX
+
+    def on_step(_status, remaining, total):
+        if stop is not None and stop.is_set():
+            raise BackupCancelled("Резервное копирование остановлено")
+        if progress is not None:
+            progress(total - remaining, total)
+        time.sleep(STEP_PAUSE_SEC)
+
+    # отдельные соединения: копирование не занимает соединение потока
+    # и не мешает остальным запросам приложения
+    source = sqlite3.connect(database.DB_NAME, timeout=database.BUSY_TIMEOUT_MS / 1000)
+    target = sqlite3.connect(part)
+    try:
+        # исключение из on_step прерывает копирование и выходит отсюда
+        source.backup(target, pages=pages, progress=on_step)
+        # копия — самостоятельный файл, без -wal рядом
+        target.execute("PRAGMA journal_mode = DELETE")
+    except BaseException:
+        target.close()
+        os.remove(part)
+        raise
+    finally:
+        source.close()
+    target.close()
+
+    try:
+        check_backup(part)
+    except BackupError:
+        os.remove(part)
+        raise
+    os.replace(part, path)
+    rotate_backups(dest_dir, keep)
+    return path
+
+
+def main(argv=None) -> int:
+    """Точка входа командной строки"""
+    parser = argparse.ArgumentParser(description="Резервная копия БД ShelterApp")
+    parser.add_argument("--dir", default=BACKUP_DIR, help="папка для копий")
+    parser.add_argument("--keep", type=int, default=KEEP_GENERATIONS,
+                        help="сколько последних копий хранить")
+    args = parser.parse_args(argv)
+
+    try:
+        path = create_backup(args.dir, args.keep)
+    except (BackupError, sqlite3.Error) as e:
+        print(f"Ошибка резервного копирования: {e}", file=sys.stderr)
+        return 1
+    print(f"Резервная копия: {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
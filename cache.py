@@ -0,0 +1,85 @@
+"""
+Кэш чтения для менеджеров моделей (LRU со счётчиками попаданий)
+
+Записи сбрасываются не по времени, а по уведомлениям database
+об изменениях (см. changes.bus и models._invalidate).
+"""
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_SIZE = 512
+
+
+class LRUCache:
+    """
+    Потокобезопасный LRU-кэш с ограничением по числу записей.
+    Ключи — любые хешируемые значения (в models — кортежи ('animal', id) и т.п.).
+    """
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # растёт при каждой инвалидации: результат чтения, начатого
+        # до изменения, в кэш уже не кладём
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_or_load(self, key, loader):
+        """Значение из кэша или loader() с сохранением результата"""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            generation = self._generation
+
+        value = loader()
+
+        with self._lock:
+            if generation == self._generation:
+                self._data[key] = value
+                self._data.move_to_end(key)
+                while len(self._data) > self.max_size:
+                    self._data.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def invalidate(self, *keys):
+        """Сбрасывает перечисленные ключи"""
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                if key in self._data:
+                    del self._data[key]
+                    self.invalidations += 1
+
+    def clear(self):
+        """Сбрасывает весь кэш (счётчики сохраняются)"""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += len(self._data)
+            self._data.clear()
+
+    def stats(self) -> dict:
+        """Счётчики для наблюдения за эффективностью кэша"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+    def reset_stats(self):
+        """Обнуляет счётчики"""
+        with self._lock:
+            self.hits = self.misses = self.evictions = self.invalidations = 0
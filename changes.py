@@ -0,0 +1,68 @@
+"""
+Шина изменений данных (publish/subscribe)
+
+database публикует изменения после COMMIT транзакции, в которой они
+сделаны; вкладки интерфейса и кэш чтения подписываются и обновляют
+только затронутые записи вместо полной перезагрузки.
+"""
+import threading
+from typing import NamedTuple, Optional
+
+# Темы изменений
+ANIMAL_ADDED = 'animal_added'          # id
+ANIMAL_UPDATED = 'animal_updated'      # id, fields
+ANIMAL_ADOPTED = 'animal_adopted'      # id
+ANIMAL_DELETED = 'animal_deleted'      # id
+EVENT_ADDED = 'event_added'            # id, animal_id
+EVENT_UPDATED = 'event_updated'        # id, animal_id, fields ('docs' — документы)
+EVENT_DELETED = 'event_deleted'        # id, animal_id
+DOCUMENTS_CHANGED = 'documents_changed'  # animal_id (файлы в docs/<id>)
+RESET = 'reset'                        # всё (смена базы, миграция)
+
+ANIMAL_TOPICS = (ANIMAL_ADDED, ANIMAL_UPDATED, ANIMAL_ADOPTED, ANIMAL_DELETED)
+EVENT_TOPICS = (EVENT_ADDED, EVENT_UPDATED, EVENT_DELETED)
+
+
+class Change(NamedTuple):
+    """Одно изменение данных"""
+    topic: str
+    id: Optional[int] = None
+    animal_id: Optional[int] = None
+    fields: tuple = ()
+
+
+class ChangeBus:
+    """
+    Синхронная шина: publish вызывает подписчиков в потоке, сделавшем COMMIT.
+    Подписчик получает список изменений одной транзакции (только своих тем).
+    """
+
+    def __init__(self):
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback, topics=None):
+        """callback(changes); topics=None — все темы. RESET приходит всем."""
+        topics = None if topics is None else frozenset(topics) | {RESET}
+        with self._lock:
+            self._subscribers.append((callback, topics))
+
+    def unsubscribe(self, callback):
+        """Отписка callback от всех тем"""
+        with self._lock:
+            self._subscribers = [(cb, t) for cb, t in self._subscribers if cb != callback]
+
+    def publish(self, changes):
+        """Рассылает изменения одной транзакции подписчикам"""
+        changes = list(changes)
+        if not changes:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback, topics in subscribers:
+            selected = changes if topics is None else [c for c in changes if c.topic in topics]
+            if selected:
+                callback(selected)
+
+
+bus = ChangeBus()
@@ -1,73 +1,285 @@
 import sqlite3
 import os
+import re
 import glob
 import json
+import threading
+from contextlib import contextmanager
+from datetime import date
+
+import changes
+from changes import Change
+from utils import CAGE_SERIES, canonical_cage_number, format_cage_number, parse_cage_number
 
 DB_NAME = "shelter.db"
 
+# Параметры долгоживущих соединений
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 256
+
+# Одно соединение на поток: sqlite3.Connection нельзя делить между потоками
+_local = threading.local()
+
+# База, к которой открывались соединения (при смене — changes.RESET)
+_opened_db_name = None
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Возвращает долгоживущее соединение текущего потока.
+    Соединение открывается один раз (WAL, busy_timeout, кэш выражений)
+    и переоткрывается, только если сменился DB_NAME.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.db_name == DB_NAME:
+        return conn
+    if conn is not None:
+        conn.close()
+
+    conn = sqlite3.connect(
+        DB_NAME,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        isolation_level=None,  # транзакциями управляет transaction()
+    )
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+
+    _local.conn = conn
+    _local.db_name = DB_NAME
+    _local.depth = 0
+    _local.pending = []
+
+    global _opened_db_name
+    if _opened_db_name not in (None, DB_NAME):
+        # другая база — всё, что о ней знали подписчики, недействительно
+        changes.bus.publish([Change(changes.RESET)])
+    _opened_db_name = DB_NAME
+    return conn
+
+
+def close_connection():
+    """Закрывает соединение текущего потока (если оно было открыто)."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+        _local.depth = 0
+        _local.pending = []
+
+
+@contextmanager
+def transaction():
+    """
+    Контекст записи: BEGIN IMMEDIATE ... COMMIT/ROLLBACK.
+    Вложенные вызовы оформляются как SAVEPOINT, поэтому ошибка
+    во внутреннем блоке откатывает только его.
+    """
+    conn = get_connection()
+    depth = _local.depth
+    # изменения, накопленные до этого блока: откат SAVEPOINT отбрасывает только его
+    pending_mark = len(_local.pending)
+    if depth == 0:
+        conn.execute("BEGIN IMMEDIATE")
+    else:
+        conn.execute(f"SAVEPOINT sp_{depth}")
+    _local.depth = depth + 1
+    try:
+        yield conn.cursor()
+    except BaseException:
+        _local.depth = depth
+        if depth == 0:
+            conn.execute("ROLLBACK")
+            _local.pending = []
+        else:
+            conn.execute(f"ROLLBACK TO sp_{depth}")
+            conn.execute(f"RELEASE sp_{depth}")
+            del _local.pending[pending_mark:]
+        raise
+    else:
+        _local.depth = depth
+        if depth == 0:
+            conn.execute("COMMIT")
+            pending, _local.pending = _local.pending, []
+            # повторы (несколько правок одной записи) отправляем один раз
+            changes.bus.publish(dict.fromkeys(pending))
+        else:
+            conn.execute(f"RELEASE sp_{depth}")
+
+
+def in_transaction() -> bool:
+    """Открыта ли в текущем потоке транзакция transaction()"""
+    return getattr(_local, 'depth', 0) > 0
+
+
+def _changed(topic: str, row_id=None, animal_id=None, fields=()):
+    """Отмечает изменение в текущей транзакции; шина changes разошлёт его после COMMIT"""
+    _local.pending.append(Change(topic, row_id, animal_id, tuple(fields)))
+
+
+def _event_changed(cur, event_id: int, fields, topic=changes.EVENT_UPDATED):
+    """
+    То же для события: animal_id берётся из БД (поиск по первичному ключу).
+    Правка перевода или карантина перестраивает историю клеток животного.
+    """
+    row = cur.execute("SELECT animal_id, type FROM events WHERE id = ?", (event_id,)).fetchone()
+    animal_id = row[0] if row else None
+    if row and 'docs' not in fields and (row[1] in _MOVE_EVENT_TYPES or 'type' in fields):
+        _rebuild_cage_stays(cur, animal_id)
+    _changed(topic, event_id, animal_id, fields)
+
+
 def add_event_doc(event_id: int, filename: str):
-    """Сохраняет в БД, что к событию прикреплён уже существующий файл filename."""
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute('''
-        INSERT OR IGNORE INTO event_docs(event_id, filename)
-        VALUES (?, ?)
-    ''', (event_id, filename))
-    conn.commit()
-    conn.close()
+    """
+    Сохраняет в БД, что к событию прикреплён уже существующий файл filename.
+    Если файл уже в индексе документов, запоминается и хеш его содержимого.
+    """
+    with transaction() as cur:
+        cur.execute('''
+            INSERT OR IGNORE INTO event_docs(event_id, filename, hash)
+            VALUES (?, ?, (SELECT d.hash FROM documents d JOIN events e ON e.animal_id = d.animal_id
+                            WHERE e.id = ? AND d.filename = ?))
+        ''', (event_id, filename, event_id, filename))
+        _event_changed(cur, event_id, ('docs',))
 
 def delete_event_doc(event_id: int, filename: str):
     """Удаляет только ссылку из БД, сам файл на диске остаётся."""
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute('''
-        DELETE FROM event_docs
-          WHERE event_id = ? AND filename = ?
-    ''', (event_id, filename))
-    conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute('''
+            DELETE FROM event_docs
+              WHERE event_id = ? AND filename = ?
+        ''', (event_id, filename))
+        _event_changed(cur, event_id, ('docs',))
 
 def get_event_docs(event_id: int):
     """Возвращает список имён файлов, сохранённых в БД для этого события."""
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute('''
+    cur = get_connection().execute('''
         SELECT filename
           FROM event_docs
          WHERE event_id = ?
          ORDER BY filename
     ''', (event_id,))
-    rows = [row[0] for row in cur.fetchall()]
-    conn.close()
-    return rows
+    return [row[0] for row in cur.fetchall()]
+
+# Колонки, которые разрешено менять через update_*_field(s)
+EVENT_FIELDS = ('type', 'date_start', 'date_end', 'conclusion', 'results')
+ANIMAL_FIELDS = ('name', 'species', 'birth_date', 'age_estimated', 'arrival_date',
+                 'cage_number', 'quarantine_until',
+                 'adoption_date', 'owner_name', 'owner_contact')
+
+
+def _update_fields(cur, table: str, row_id: int, fields: dict, allowed):
+    """Один UPDATE по набору колонок; имена колонок проверяются по allowed."""
+    bad = [name for name in fields if name not in allowed]
+    if bad:
+        raise ValueError(f"Недопустимое поле: {', '.join(bad)}")
+    if not fields:
+        return
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    cur.execute(f"UPDATE {table} SET {assignments} WHERE id = ?",
+                (*fields.values(), row_id))
+
 
 def update_event_field(event_id: int, field: str, value):
     """
     Обновляет одно поле в таблице events.
     field — 'type', 'date_start', 'date_end' или 'conclusion'.
     """
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    if field not in ('type','date_start','date_end','conclusion','results'):
-        conn.close()
+    if field not in EVENT_FIELDS:
         raise ValueError("Недопустимое поле")
-    cur.execute(f"UPDATE events SET {field} = ? WHERE id = ?", (value, event_id))
-    conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute(f"UPDATE events SET {field} = ? WHERE id = ?", (value, event_id))
+        _event_changed(cur, event_id, (field,))
+
+
+def update_event_fields(event_id: int, fields: dict):
+    """
+    Обновляет несколько полей события одним UPDATE.
+    fields — {колонка: значение}, колонки из EVENT_FIELDS.
+    """
+    with transaction() as cur:
+        _update_fields(cur, 'events', event_id, fields, EVENT_FIELDS)
+        _event_changed(cur, event_id, fields)
 
 def update_event_results(event_id: int, results_json: str):
     """
     Перезаписывает колонку results для события event_id.
     """
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute('''
-        UPDATE events
-           SET results = ?
-         WHERE id = ?
-    ''', (results_json, event_id))
-    conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute('''
+            UPDATE events
+               SET results = ?
+             WHERE id = ?
+        ''', (results_json, event_id))
+        _event_changed(cur, event_id, ('results',))
+
+
+def update_event_result_field(event_id: int, field: str, value):
+    """
+    Меняет одно поле результатов события прямо в SQL (json_set),
+    без чтения и перезаписи всего JSON на стороне Python.
+    event_results обновляется триггером.
+    """
+    # json.dumps по умолчанию экранирует кириллицу ("\u0422..."), а json_set
+    # сравнивает ключи побайтно — поэтому сначала убираем экранированный вариант
+    escaped_path = '$.' + json.dumps(field)
+    plain_path = '$.' + json.dumps(field, ensure_ascii=False)
+    with transaction() as cur:
+        cur.execute('''
+            UPDATE events
+               SET results = json_set(
+                       json_remove(
+                           CASE WHEN json_valid(results) AND json_type(results) = 'object'
+                                THEN results ELSE '{}' END,
+                           ?),
+                       ?, json(?))
+             WHERE id = ?
+        ''', (escaped_path, plain_path, json.dumps(value, ensure_ascii=False), event_id))
+        _event_changed(cur, event_id, ('results',))
+
+
+RESULT_OPERATORS = ('=', '!=', '<', '<=', '>', '>=')
+
+
+def find_events_by_result(field: str, op: str, value,
+                          date_from=None, date_to=None, event_type=None):
+    """
+    Ищет неудалённые события по значению поля результатов средствами SQL.
+    Числовое value сравнивается с value_num, строковое — с value_text.
+    Пример: find_events_by_result('Температура', '>', 39.5, '2024-05-01').
+    Возвращает [(event_id, animal_id, type, date_start, value_text), ...].
+    """
+    if op not in RESULT_OPERATORS:
+        raise ValueError(f"Недопустимый оператор: {op}")
+    numeric = isinstance(value, (int, float)) and not isinstance(value, bool)
+    column = "r.value_num" if numeric else "r.value_text"
+    where = ["r.field = ?", f"{column} {op} ?", "e.deleted = 0"]
+    params = [field, value if numeric else str(value)]
+    if date_from:
+        where.append("e.date_start >= ?")
+        params.append(date_from)
+    if date_to:
+        where.append("e.date_start <= ?")
+        params.append(date_to)
+    if event_type:
+        where.append("e.type = ?")
+        params.append(event_type)
+    cur = get_connection().execute(f'''
+        SELECT e.id, e.animal_id, e.type, e.date_start, r.value_text
+          FROM event_results r
+          JOIN events e ON e.id = r.event_id
+         WHERE {" AND ".join(where)}
+         ORDER BY e.date_start, e.id
+    ''', params)
+    return cur.fetchall()
+
+
+def get_event_result_values(event_id: int) -> dict:
+    """Возвращает {поле: текстовое значение} результатов события из event_results."""
+    cur = get_connection().execute(
+        "SELECT field, value_text FROM event_results WHERE event_id = ?", (event_id,))
+    return dict(cur.fetchall())
 
 
 def add_event(animal_id: int,
@@ -79,55 +291,116 @@ def add_event(animal_id: int,
     """
     Добавляет новое событие для животного.
     """
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
     # results — либо строка JSON, либо None
     r = results if isinstance(results, str) else (json.dumps(results) if results else None)
-    cur.execute('''
-        INSERT INTO events
-            (animal_id, type, date_start, date_end, conclusion, results)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (animal_id, etype, date_start, date_end, conclusion, r))
-    conn.commit()
-    new_id = cur.lastrowid
-    conn.close()
-    return new_id
+    with transaction() as cur:
+        cur.execute('''
+            INSERT INTO events
+                (animal_id, type, date_start, date_end, conclusion, results)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (animal_id, etype, date_start, date_end, conclusion, r))
+        new_id = cur.lastrowid
+        _event_changed(cur, new_id, (), changes.EVENT_ADDED)
+        return new_id
+
+
+# Общая выборка событий вместе с документами: одна строка на пару (событие, файл)
+_EVENTS_WITH_DOCS_SQL = '''
+    SELECT e.animal_id, e.type, e.date_start, e.date_end,
+           e.conclusion, e.results, e.id, d.filename
+      FROM events e
+      LEFT JOIN event_docs d ON d.event_id = e.id
+     WHERE e.animal_id IN ({placeholders})
+       AND e.deleted = 0
+     ORDER BY e.animal_id, e.date_start, e.id, d.filename
+'''
+
+# Ограничение SQLite на число параметров в одном запросе
+_MAX_IN_PARAMS = 500
+
+
+def _group_event_rows(rows):
+    """
+    Сворачивает строки LEFT JOIN events/event_docs в словарь
+    {animal_id: [(type, date_start, date_end, conclusion, docs, results, id), ...]}.
+    Строки должны быть упорядочены по животному и событию.
+    """
+    grouped = {}
+    current_id = None
+    docs = None
+    for animal_id, etype, ds, de, concl, results, eid, filename in rows:
+        if eid != current_id:
+            current_id = eid
+            docs = []
+            grouped.setdefault(animal_id, []).append((
+                etype,
+                ds,
+                de,
+                concl or "",
+                docs,
+                results or "",
+                eid
+            ))
+        if filename is not None:
+            # Исправлено: нормализация путей для кроссплатформенности
+            docs.append(os.path.normpath(os.path.join('docs', str(animal_id), filename)))
+    return grouped
 
 
 def get_animal_events(animal_id: int):
     """
-    Возвращает только неудалённые события
+    Возвращает только неудалённые события вместе с путями документов
+    (один запрос с JOIN вместо отдельного запроса на каждое событие)
     """
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute('''
-        SELECT type, date_start, date_end, conclusion, results, id
-        FROM events
-        WHERE animal_id = ? 
-          AND deleted = 0
-        ORDER BY date_start
+    return get_events_for_animals([animal_id]).get(animal_id, [])
+
+
+def get_events_for_animals(animal_ids):
+    """
+    Пакетная загрузка событий для нескольких животных за один проход.
+    Возвращает {animal_id: [события в формате get_animal_events]};
+    для животных без событий — пустой список.
+    """
+    ids = list(dict.fromkeys(animal_ids))
+    result = {aid: [] for aid in ids}
+    conn = get_connection()
+    for i in range(0, len(ids), _MAX_IN_PARAMS):
+        chunk = ids[i:i + _MAX_IN_PARAMS]
+        sql = _EVENTS_WITH_DOCS_SQL.format(placeholders=", ".join("?" * len(chunk)))
+        result.update(_group_event_rows(conn.execute(sql, chunk)))
+    return result
+
+
+def get_event_summaries(animal_id: int):
+    """
+    Лёгкий список событий для ленты медкарты, без результатов и путей документов:
+    [(id, type, date_start, date_end, conclusion, число документов), ...]
+    """
+    cur = get_connection().execute('''
+        SELECT e.id, e.type, e.date_start, e.date_end, coalesce(e.conclusion, ''),
+               (SELECT count(*) FROM event_docs d WHERE d.event_id = e.id)
+          FROM events e
+         WHERE e.animal_id = ? AND e.deleted = 0
+         ORDER BY e.date_start, e.id
     ''', (animal_id,))
-    rows = cur.fetchall()
-    conn.close()
+    return cur.fetchall()
 
-    docs_dir = os.path.join('docs', str(animal_id))
-    
-    events = []
-    for etype, ds, de, concl, results, eid in rows:
-        event_docs = get_event_docs(eid)
-        # Исправлено: нормализация путей для кроссплатформенности
-        event_docs = [os.path.normpath(os.path.join(docs_dir, fn)) for fn in event_docs]
-        
-        events.append((
-            etype,
-            ds,
-            de,
-            concl or "",
-            event_docs,
-            results or "",
-            eid
-        ))
-    return events
+
+def get_event_details(event_ids) -> dict:
+    """
+    Документы и результаты событий, раскрытых в ленте, одним запросом:
+    {event_id: (пути документов, results)}
+    """
+    ids = list(dict.fromkeys(event_ids))
+    result = {}
+    conn = get_connection()
+    for i in range(0, len(ids), _MAX_IN_PARAMS):
+        chunk = ids[i:i + _MAX_IN_PARAMS]
+        sql = _EVENTS_WITH_DOCS_SQL.replace("e.animal_id IN", "e.id IN").format(
+            placeholders=", ".join("?" * len(chunk)))
+        for events in _group_event_rows(conn.execute(sql, chunk)).values():
+            result.update((event[6], (event[4], event[5])) for event in events)
+    return result
 
 
 def update_adoption_field(animal_id, field, value):
@@ -147,24 +420,22 @@ def update_adoption_field(animal_id, field, value):
     if field not in allowed_fields:
         raise ValueError(f"Недопустимое поле для усыновления: {field}")
 
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute(f'''
-        UPDATE animals
-        SET {field} = ?
-        WHERE id = ? AND adopted = 1
-    ''', (value, animal_id))
-    conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute(f'''
+            UPDATE animals
+            SET {field} = ?
+            WHERE id = ? AND adopted = 1
+        ''', (value, animal_id))
+        if field in _STAY_FIELDS:
+            _rebuild_cage_stays(cur, animal_id)
+        _changed(changes.ANIMAL_UPDATED, animal_id, fields=(field,))
 
-def init_db():
-    """
-    Создаёт таблицы с поддержкой мягкого удаления и добавляет колонки
-    к существующим таблицам при необходимости.
-    """
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
+# === Миграции схемы ===
+# Версия схемы хранится в PRAGMA user_version. Каждая миграция применяется
+# ровно один раз и получает курсор внутри общей транзакции.
 
+def _migration_base_schema(cur):
+    """1: базовые таблицы + колонки, которых нет в старых файлах БД."""
     # --- animals ---
     cur.execute('''
         CREATE TABLE IF NOT EXISTS animals (
@@ -231,30 +502,384 @@ def init_db():
         )
     ''')
 
-    conn.commit()
-    conn.close()
+
+def _create_sort_indexes(cur, name, where, columns):
+    """
+    Индексы под постраничный список с сортировкой по колонке
+    (_keyset_page: ORDER BY coalesce(колонка, ''), id). Частичные, с тем же
+    условием, что у списка, — страница читается из индекса без сортировки.
+    """
+    for column in columns:
+        cur.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_animals_{name}_by_{column}
+                ON animals(coalesce({column}, ''), id)
+             WHERE {where}
+        ''')
+
+
+def _migration_hot_indexes(cur):
+    """
+    2: частичные и покрывающие индексы под запросы списков. SQLite считает
+    частичный индекс покрывающим, только если в нём есть и колонки его
+    условия (deleted, adopted), иначе за ними ходит в таблицу по каждой строке.
+    """
+    # get_all_animals / get_all_animals_ids — покрывающий индекс только по активным
+    cur.execute('''
+        CREATE INDEX IF NOT EXISTS idx_animals_active
+            ON animals(id, name, species, birth_date, age_estimated,
+                       arrival_date, cage_number, quarantine_until, deleted, adopted)
+         WHERE deleted = 0 AND adopted = 0
+    ''')
+    # get_all_cage_numbers
+    cur.execute('''
+        CREATE INDEX IF NOT EXISTS idx_animals_active_cages
+            ON animals(cage_number, deleted, adopted)
+         WHERE cage_number IS NOT NULL AND deleted = 0 AND adopted = 0
+    ''')
+    # get_animals_page: сортировки по колонкам
+    _create_sort_indexes(cur, 'active', "deleted = 0 AND adopted = 0",
+                         ('name', 'species', 'birth_date', 'arrival_date',
+                          'cage_number', 'quarantine_until'))
+    # get_animal_events / get_events_for_animals: фильтр и сортировка по индексу
+    cur.execute('''
+        CREATE INDEX IF NOT EXISTS idx_events_animal_date
+            ON events(animal_id, date_start)
+         WHERE deleted = 0
+    ''')
+
+
+# Разбор events.results в строки event_results. {src} — выражение с JSON;
+# невалидный JSON и не-объекты дают пустой набор. Числа, записанные
+# строкой (в т.ч. с запятой: "39,5"), дополнительно попадают в value_num.
+_RESULTS_ROWS_SQL = '''
+    SELECT {event_id}, j.key,
+           CASE j.type WHEN 'true' THEN '1' WHEN 'false' THEN '0'
+                ELSE CAST(j.atom AS TEXT) END,
+           CASE
+               WHEN j.type IN ('integer', 'real') THEN j.atom
+               WHEN j.type = 'true' THEN 1
+               WHEN j.type = 'false' THEN 0
+               WHEN j.type = 'text'
+                    AND replace(trim(j.atom), ',', '.') GLOB '*[0-9]*'
+                    AND replace(trim(j.atom), ',', '.') NOT GLOB '*[^0-9.+-]*'
+                   THEN CAST(replace(trim(j.atom), ',', '.') AS REAL)
+           END
+      FROM json_each(CASE WHEN json_valid({src}) AND json_type({src}) = 'object'
+                          THEN {src} ELSE '{{}}' END) AS j
+     WHERE j.type NOT IN ('object', 'array', 'null')
+'''
+
+
+def _migration_event_results(cur):
+    """3: типизированная таблица результатов событий, синхронизируемая триггерами."""
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS event_results (
+            event_id    INTEGER NOT NULL,
+            field       TEXT    NOT NULL,
+            value_text  TEXT,
+            value_num   REAL,
+            PRIMARY KEY(event_id, field)
+        ) WITHOUT ROWID
+    ''')
+    cur.execute('''
+        CREATE INDEX IF NOT EXISTS idx_event_results_num
+            ON event_results(field, value_num)
+         WHERE value_num IS NOT NULL
+    ''')
+    cur.execute('''
+        CREATE INDEX IF NOT EXISTS idx_event_results_text
+            ON event_results(field, value_text)
+    ''')
+
+    rows_for_new = _RESULTS_ROWS_SQL.format(event_id="NEW.id", src="NEW.results")
+    cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_event_results_insert
+        AFTER INSERT ON events BEGIN
+            INSERT OR REPLACE INTO event_results(event_id, field, value_text, value_num)
+            {rows_for_new};
+        END
+    ''')
+    cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_event_results_update
+        AFTER UPDATE OF results ON events BEGIN
+            DELETE FROM event_results WHERE event_id = NEW.id;
+            INSERT OR REPLACE INTO event_results(event_id, field, value_text, value_num)
+            {rows_for_new};
+        END
+    ''')
+
+    # Заполняем по уже существующим событиям
+    cur.execute('''
+        INSERT OR REPLACE INTO event_results(event_id, field, value_text, value_num)
+    ''' + _RESULTS_ROWS_SQL.format(event_id="e.id", src="e.results").replace(
+        "FROM json_each", "FROM events e, json_each"))
+
+
+# Текст животного и события для полнотекстового индекса.
+# rowid в search_index: id*2 — животное, id*2+1 — событие.
+_ANIMAL_SEARCH_BODY = (
+    "coalesce({a}.species, '') || ' ' || coalesce({a}.owner_name, '') || ' ' || "
+    "coalesce({a}.owner_contact, '')"
+)
+_EVENT_SEARCH_BODY = (
+    "coalesce({e}.conclusion, '') || ' ' || coalesce(("
+    "SELECT group_concat(j.atom, ' ') FROM json_each("
+    "CASE WHEN json_valid({e}.results) AND json_type({e}.results) = 'object' "
+    "THEN {e}.results ELSE '{{}}' END) AS j "
+    "WHERE j.type NOT IN ('object', 'array', 'null')), '')"
+)
+
+
+def _fold_yo_sql(expr: str) -> str:
+    """unicode61 не считает «ё» вариантом «е» — сворачиваем сами (и в запросе тоже)."""
+    return f"replace(replace({expr}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _migration_search_index(cur):
+    """4: полнотекстовый индекс FTS5 по животным и событиям + триггеры синхронизации."""
+    # unicode61 сворачивает регистр кириллицы, remove_diacritics 2 — латинские
+    # диакритики; prefix ускоряет поиск по началу слова («Иван*»)
+    cur.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+            kind UNINDEXED, ref_id UNINDEXED, animal_id UNINDEXED,
+            title, body,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    ''')
+
+    animal_body = _ANIMAL_SEARCH_BODY.format(a="NEW")
+    event_body = _EVENT_SEARCH_BODY.format(e="NEW")
+    insert_animal = f'''
+        INSERT INTO search_index(rowid, kind, ref_id, animal_id, title, body)
+        SELECT NEW.id * 2, 'animal', NEW.id, NEW.id, {_fold_yo_sql("NEW.name")},
+               {_fold_yo_sql(animal_body)}
+         WHERE NEW.deleted = 0;
+    '''
+    insert_event = f'''
+        INSERT INTO search_index(rowid, kind, ref_id, animal_id, title, body)
+        SELECT NEW.id * 2 + 1, 'event', NEW.id, NEW.animal_id, {_fold_yo_sql("NEW.type")},
+               {_fold_yo_sql(event_body)}
+         WHERE NEW.deleted = 0;
+    '''
+    cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_search_animal_insert
+        AFTER INSERT ON animals BEGIN {insert_animal} END
+    ''')
+    cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_search_animal_update
+        AFTER UPDATE OF name, species, owner_name, owner_contact, deleted ON animals BEGIN
+            DELETE FROM search_index WHERE rowid = OLD.id * 2;
+            {insert_animal}
+        END
+    ''')
+    cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_search_event_insert
+        AFTER INSERT ON events BEGIN {insert_event} END
+    ''')
+    cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_search_event_update
+        AFTER UPDATE OF type, conclusion, results, deleted ON events BEGIN
+            DELETE FROM search_index WHERE rowid = OLD.id * 2 + 1;
+            {insert_event}
+        END
+    ''')
+
+    # Заполняем индекс по существующим данным (с нуля — миграция может повторяться)
+    cur.execute("DELETE FROM search_index")
+    cur.execute(f'''
+        INSERT INTO search_index(rowid, kind, ref_id, animal_id, title, body)
+        SELECT a.id * 2, 'animal', a.id, a.id, {_fold_yo_sql("a.name")},
+               {_fold_yo_sql(_ANIMAL_SEARCH_BODY.format(a="a"))}
+          FROM animals a WHERE a.deleted = 0
+    ''')
+    cur.execute(f'''
+        INSERT INTO search_index(rowid, kind, ref_id, animal_id, title, body)
+        SELECT e.id * 2 + 1, 'event', e.id, e.animal_id, {_fold_yo_sql("e.type")},
+               {_fold_yo_sql(_EVENT_SEARCH_BODY.format(e="e"))}
+          FROM events e WHERE e.deleted = 0
+    ''')
+
+
+def _migration_adoption_index(cur):
+    """5: частичные индексы усыновлённых — постраничный список и счётчик."""
+    cur.execute('''
+        CREATE INDEX IF NOT EXISTS idx_animals_adopted
+            ON animals(id)
+         WHERE adopted = 1 AND deleted = 0
+    ''')
+    _create_sort_indexes(cur, 'adopted', "adopted = 1 AND deleted = 0",
+                         ('name', 'species', 'birth_date', 'arrival_date',
+                          'owner_name', 'owner_contact', 'adoption_date'))
+
+
+def _migration_cage_registry(cur):
+    """
+    6: реестр клеток серий К и О со статусом (см. «Реестр клеток»).
+    Заполняется по активным животным; при дублях в старых данных клетку
+    получает животное с меньшим ID, нестандартные номера пропускаются.
+    """
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS cages (
+            series    TEXT    NOT NULL CHECK (series IN ('К', 'О')),
+            num       INTEGER NOT NULL CHECK (num BETWEEN 0 AND 65535),
+            code      TEXT    NOT NULL,
+            status    TEXT    NOT NULL DEFAULT 'free'
+                              CHECK (status IN ('free', 'occupied')),
+            animal_id INTEGER UNIQUE REFERENCES animals(id),
+            PRIMARY KEY (series, num),
+            CHECK ((status = 'occupied') = (animal_id IS NOT NULL))
+        ) WITHOUT ROWID
+    ''')
+    # список свободных: первая свободная клетка серии — один поиск по индексу
+    cur.execute('''
+        CREATE INDEX IF NOT EXISTS idx_cages_free
+            ON cages(series, num)
+         WHERE status = 'free'
+    ''')
+    rows = cur.execute('''
+        SELECT id, cage_number FROM animals
+         WHERE deleted = 0 AND adopted = 0 AND cage_number IS NOT NULL
+         ORDER BY id
+    ''').fetchall()
+    for animal_id, cage_number in rows:
+        _occupy_cage(cur, cage_number, animal_id, strict=False)
+
+
+def _migration_cage_stays(cur):
+    """
+    7: история пребывания в клетках + R*Tree по (клетка, дни) для поиска
+    контактов. Заполняется по поступлениям, переводам, карантинам и передачам.
+    """
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS cage_stays (
+            id          INTEGER PRIMARY KEY,
+            animal_id   INTEGER NOT NULL REFERENCES animals(id),
+            cage_number TEXT    NOT NULL,
+            date_from   TEXT    NOT NULL,
+            date_to     TEXT
+        )
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_cage_stays_animal ON cage_stays(animal_id)")
+    # id — id строки cage_stays; клетка и дни — целые (см. _cage_key, _day)
+    cur.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS cage_stays_rtree
+            USING rtree_i32(id, cage_lo, cage_hi, day_lo, day_hi)
+    ''')
+    rows = cur.execute("SELECT id FROM animals WHERE deleted = 0 ORDER BY id").fetchall()
+    for (animal_id,) in rows:
+        _rebuild_cage_stays(cur, animal_id)
+
+
+def _migration_documents(cur):
+    """
+    8: индекс файлов docs/<id> (см. documents.py). Заполняется сверкой
+    с диском при запуске приложения, а не миграцией.
+    """
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS documents (
+            animal_id INTEGER NOT NULL,
+            filename  TEXT    NOT NULL,
+            size      INTEGER NOT NULL,
+            mtime_ns  INTEGER NOT NULL,
+            ctime_ns  INTEGER NOT NULL,
+            hash      TEXT,
+            mime      TEXT,
+            PRIMARY KEY (animal_id, filename)
+        ) WITHOUT ROWID
+    ''')
+    # mtime папки на момент последней сверки: неизменённые папки не читаются
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS document_dirs (
+            animal_id INTEGER PRIMARY KEY,
+            mtime_ns  INTEGER NOT NULL
+        )
+    ''')
+
+
+def _migration_event_doc_hashes(cur):
+    """
+    9: event_docs.hash — содержимое, к которому прикреплён документ
+    (блоб в docstore). Пока файл не проиндексирован, hash пустой.
+    """
+    columns = {row[1] for row in cur.execute("PRAGMA table_info(event_docs)")}
+    if 'hash' not in columns:
+        cur.execute("ALTER TABLE event_docs ADD COLUMN hash TEXT")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_event_docs_hash ON event_docs(hash)")
+    cur.execute('''
+        UPDATE event_docs
+           SET hash = (SELECT d.hash FROM documents d JOIN events e ON e.animal_id = d.animal_id
+                        WHERE e.id = event_docs.event_id AND d.filename = event_docs.filename)
+         WHERE hash IS NULL
+    ''')
+
+
+# (версия, функция) — добавлять только в конец, номера не переиспользовать
+MIGRATIONS = [
+    (1, _migration_base_schema),
+    (2, _migration_hot_indexes),
+    (3, _migration_event_results),
+    (4, _migration_search_index),
+    (5, _migration_adoption_index),
+    (6, _migration_cage_registry),
+    (7, _migration_cage_stays),
+    (8, _migration_documents),
+    (9, _migration_event_doc_hashes),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version() -> int:
+    """Возвращает текущую версию схемы (PRAGMA user_version)."""
+    return get_connection().execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate() -> int:
+    """
+    Применяет недостающие миграции одной транзакцией и возвращает
+    итоговую версию схемы. Если схема актуальна — ничего не делает.
+    """
+    if get_schema_version() >= SCHEMA_VERSION:
+        return SCHEMA_VERSION
+
+    with transaction() as cur:
+        # перечитываем под блокировкой: другая рабочая станция могла успеть раньше
+        current = cur.execute("PRAGMA user_version").fetchone()[0]
+        for version, apply in MIGRATIONS:
+            if version > current:
+                apply(cur)
+                cur.execute(f"PRAGMA user_version = {version}")
+                _changed(changes.RESET)
+    return get_schema_version()
+
+
+def init_db():
+    """
+    Приводит схему БД к актуальной версии (см. MIGRATIONS).
+    """
+    migrate()
 
 def add_adoption(animal_id, owner_name, owner_contact, adoption_date):
     """
     Помечает животное как усыновленное и сохраняет данные владельца
     """
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute('''
-        UPDATE animals
-        SET adopted = 1,
-            adoption_date = ?,
-            owner_name = ?,
-            owner_contact = ?
-        WHERE id = ? AND deleted = 0 AND adopted = 0
-    ''', (adoption_date, owner_name, owner_contact, animal_id))
-    conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute('''
+            UPDATE animals
+            SET adopted = 1,
+                adoption_date = ?,
+                owner_name = ?,
+                owner_contact = ?
+            WHERE id = ? AND deleted = 0 AND adopted = 0
+        ''', (adoption_date, owner_name, owner_contact, animal_id))
+        if cur.rowcount:
+            _release_cage(cur, animal_id)
+            _rebuild_cage_stays(cur, animal_id)
+            _changed(changes.ANIMAL_ADOPTED, animal_id)
 
 def get_animal_by_id(animal_id):
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute('''
+    cur = get_connection().execute('''
         SELECT 
             id, name, species, birth_date, 
             age_estimated, arrival_date, 
@@ -264,105 +889,773 @@ def get_animal_by_id(animal_id):
         FROM animals
         WHERE id = ? AND deleted = 0 AND adopted = 0
     ''', (animal_id,))
-    row = cur.fetchone()
-    conn.close()
-    return row
+    return cur.fetchone()
+
+def get_adoption_by_id(animal_id):
+    """Усыновлённое животное в формате get_all_adoptions (None — не найдено)"""
+    cur = get_connection().execute('''
+        SELECT id, name, species, birth_date, age_estimated,
+               arrival_date, adoption_date, owner_name, owner_contact
+        FROM animals
+        WHERE id = ? AND adopted = 1 AND deleted = 0
+    ''', (animal_id,))
+    return cur.fetchone()
 
 def get_all_adoptions():
     """
     Возвращает всех усыновленных животных
     """
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute('''
+    cur = get_connection().execute('''
         SELECT id, name, species, birth_date, age_estimated,
                arrival_date, adoption_date, owner_name, owner_contact
         FROM animals
         WHERE adopted = 1 AND deleted = 0
     ''')
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    return cur.fetchall()
 
 def get_all_animals():
     """
     Возвращает только неудалённых животных
     """
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute('''
+    cur = get_connection().execute('''
         SELECT id, name, species, birth_date, age_estimated,
                arrival_date, cage_number, quarantine_until
         FROM animals
         WHERE deleted = 0 AND adopted = 0
     ''')
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    return cur.fetchall()
 
 def get_all_cage_numbers():
     """
     Возвращает клетки только неудалённых животных
     """
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute('''
+    cur = get_connection().execute('''
         SELECT cage_number 
         FROM animals 
         WHERE cage_number IS NOT NULL 
           AND deleted = 0 AND adopted = 0
     ''')
-    rows = [row[0] for row in cur.fetchall()]
-    conn.close()
-    return rows
+    return [row[0] for row in cur.fetchall()]
 
 def add_animal(name, species, birth_date, age_estimated,
                arrival_date, cage_number, quarantine_until):
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute('''
-        INSERT INTO animals
-            (name, species, birth_date, age_estimated,
-             arrival_date, cage_number, quarantine_until)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (name, species, birth_date, age_estimated,
-          arrival_date, cage_number, quarantine_until))
-    conn.commit()
-    new_id = cur.lastrowid
-    conn.close()
-    return new_id  # Исправлено: убрано дублирование return
+    with transaction() as cur:
+        cur.execute('''
+            INSERT INTO animals
+                (name, species, birth_date, age_estimated,
+                 arrival_date, cage_number, quarantine_until)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (name, species, birth_date, age_estimated,
+              arrival_date, cage_number, quarantine_until))
+        new_id = cur.lastrowid
+        _occupy_cage(cur, cage_number, new_id)
+        _rebuild_cage_stays(cur, new_id)
+        _changed(changes.ANIMAL_ADDED, new_id)
+        return new_id
+
+
+def add_animals(rows) -> list:
+    """
+    Пакетная вставка животных одним executemany.
+    rows — кортежи в порядке аргументов add_animal.
+    Возвращает список новых ID в порядке rows.
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+    with transaction() as cur:
+        cur.executemany('''
+            INSERT INTO animals
+                (name, species, birth_date, age_estimated,
+                 arrival_date, cage_number, quarantine_until)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        # под блокировкой записи AUTOINCREMENT выдаёт ID подряд
+        last_id = cur.execute("SELECT last_insert_rowid()").fetchone()[0]
+        new_ids = list(range(last_id - len(rows) + 1, last_id + 1))
+        for new_id, row in zip(new_ids, rows):
+            _occupy_cage(cur, row[5], new_id)
+            _rebuild_cage_stays(cur, new_id)
+            _changed(changes.ANIMAL_ADDED, new_id)
+    return new_ids
 
 
 def delete_animal(animal_id):
     """Мягкое удаление животного (устанавливает флаг deleted)"""
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute('UPDATE animals SET deleted = 1 WHERE id = ?', (animal_id,))
-    conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute('UPDATE animals SET deleted = 1 WHERE id = ?', (animal_id,))
+        _release_cage(cur, animal_id)
+        _rebuild_cage_stays(cur, animal_id)
+        _changed(changes.ANIMAL_DELETED, animal_id)
 
 def delete_event(event_id: int):
     """Мягкое удаление события (устанавливает флаг deleted)"""
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute('UPDATE events SET deleted = 1 WHERE id = ?', (event_id,))
-    conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute('UPDATE events SET deleted = 1 WHERE id = ?', (event_id,))
+        _event_changed(cur, event_id, (), changes.EVENT_DELETED)
 
 def update_animal_field(animal_id, field, value):
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
     # осторожно: field берётся из доверенной мапы, не из пользовательского ввода
     query = f'UPDATE animals SET {field} = ? WHERE id = ?'
-    cur.execute(query, (value, animal_id))
-    conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute(query, (value, animal_id))
+        if field in _CAGE_FIELDS:
+            _sync_animal_cage(cur, animal_id)
+        if field in _STAY_FIELDS:
+            _rebuild_cage_stays(cur, animal_id)
+        _changed(changes.ANIMAL_UPDATED, animal_id, fields=(field,))
+
+def update_animal_fields(animal_id, fields: dict):
+    """
+    Обновляет несколько полей животного одним UPDATE.
+    fields — {колонка: значение}, колонки из ANIMAL_FIELDS.
+    """
+    with transaction() as cur:
+        _update_fields(cur, 'animals', animal_id, fields, ANIMAL_FIELDS)
+        if _CAGE_FIELDS.intersection(fields):
+            _sync_animal_cage(cur, animal_id)
+        if _STAY_FIELDS.intersection(fields):
+            _rebuild_cage_stays(cur, animal_id)
+        _changed(changes.ANIMAL_UPDATED, animal_id, fields=fields)
 
 def get_all_animals_ids():
     """Возвращает ID и имена только неудалённых животных"""
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute("SELECT id, name FROM animals WHERE deleted = 0 AND adopted = 0")
-    out = cur.fetchall()
-    conn.close()
-    return out
+    cur = get_connection().execute("SELECT id, name FROM animals WHERE deleted = 0 AND adopted = 0")
+    return cur.fetchall()
+
+
+# === Потоковые выборки для экспорта ===
+# Курсор читается пачками по FETCH_SIZE, поэтому память не зависит от объёма истории.
+
+FETCH_SIZE = 500
+
+ANIMAL_STATUSES = ('all', 'active', 'adopted')
+
+
+def _iter_query(sql: str, params=()):
+    """Генератор строк запроса, читающий курсор через fetchmany."""
+    cur = get_connection().execute(sql, params)
+    try:
+        while True:
+            rows = cur.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cur.close()
+
+
+def _export_filters(date_column: str, date_from=None, date_to=None,
+                    species=None, status='all'):
+    """Собирает условия WHERE (для таблицы animals с псевдонимом a) и параметры."""
+    if status not in ANIMAL_STATUSES:
+        raise ValueError(f"Недопустимый статус: {status}")
+    where = ["a.deleted = 0"]
+    params = []
+    if status == 'active':
+        where.append("a.adopted = 0")
+    elif status == 'adopted':
+        where.append("a.adopted = 1")
+    if species:
+        # вид хранится как «Вид» или «Вид / Порода»
+        where.append("(a.species = ? OR a.species LIKE ? || ' / %')")
+        params += [species, species]
+    if date_from:
+        where.append(f"{date_column} >= ?")
+        params.append(date_from)
+    if date_to:
+        where.append(f"{date_column} <= ?")
+        params.append(date_to)
+    return " AND ".join(where), params
+
+
+def iter_animals(date_from=None, date_to=None, species=None, status='all'):
+    """
+    Потоково выдаёт животных (фильтр дат — по дате поступления):
+    (id, name, species, birth_date, age_estimated, arrival_date, cage_number,
+     quarantine_until, adopted, adoption_date, owner_name, owner_contact)
+    """
+    where, params = _export_filters("a.arrival_date", date_from, date_to, species, status)
+    return _iter_query(f'''
+        SELECT a.id, a.name, a.species, a.birth_date, a.age_estimated,
+               a.arrival_date, a.cage_number, a.quarantine_until,
+               a.adopted, a.adoption_date, a.owner_name, a.owner_contact
+          FROM animals a
+         WHERE {where}
+         ORDER BY a.id
+    ''', params)
+
+
+def iter_adoptions(date_from=None, date_to=None, species=None):
+    """
+    Потоково выдаёт усыновления (фильтр дат — по дате передачи)
+    в формате get_all_adoptions.
+    """
+    where, params = _export_filters("a.adoption_date", date_from, date_to, species, 'adopted')
+    return _iter_query(f'''
+        SELECT a.id, a.name, a.species, a.birth_date, a.age_estimated,
+               a.arrival_date, a.adoption_date, a.owner_name, a.owner_contact
+          FROM animals a
+         WHERE {where}
+         ORDER BY a.adoption_date, a.id
+    ''', params)
+
+
+def iter_events(date_from=None, date_to=None, species=None, status='all',
+                event_types=None):
+    """
+    Потоково выдаёт неудалённые события (фильтр дат — по дате начала):
+    (id, animal_id, animal_name, species, type, date_start, date_end,
+     conclusion, results)
+    """
+    where, params = _export_filters("e.date_start", date_from, date_to, species, status)
+    if event_types:
+        where += f" AND e.type IN ({', '.join('?' * len(event_types))})"
+        params += list(event_types)
+    return _iter_query(f'''
+        SELECT e.id, e.animal_id, a.name, a.species, e.type,
+               e.date_start, e.date_end, e.conclusion, e.results
+          FROM events e
+          JOIN animals a ON a.id = e.animal_id
+         WHERE e.deleted = 0 AND {where}
+         ORDER BY e.id
+    ''', params)
+
+
+# === Полнотекстовый поиск ===
+
+SEARCH_LIMIT = 50
+
+
+def _fts_query(text: str) -> str:
+    """Превращает ввод пользователя в запрос FTS5: все слова, поиск по префиксу."""
+    words = re.findall(r"\w+", text.replace('ё', 'е').replace('Ё', 'Е'))
+    return " ".join(f'"{w}"*' for w in words)
+
+
+def search(text: str, limit: int = SEARCH_LIMIT):
+    """
+    Ищет по именам, видам, владельцам, заключениям и результатам событий.
+    Возвращает до limit совпадений по релевантности (bm25):
+    [(kind, ref_id, animal_id, animal_name, adopted, title, snippet), ...],
+    где kind — 'animal' или 'event'.
+    """
+    query = _fts_query(text)
+    if not query:
+        return []
+    cur = get_connection().execute('''
+        SELECT s.kind, s.ref_id, s.animal_id, a.name, a.adopted, s.title,
+               snippet(search_index, 4, '[', ']', '…', 8)
+          FROM search_index s
+          JOIN animals a ON a.id = s.animal_id
+         WHERE search_index MATCH ?
+           AND a.deleted = 0
+         ORDER BY bm25(search_index, 0.0, 0.0, 0.0, 5.0, 1.0)
+         LIMIT ?
+    ''', (query, limit))
+    return cur.fetchall()
+
+
+# === Постраничная выборка списков (keyset) ===
+# Страница продолжается от ключа последней строки предыдущей страницы,
+# поэтому стоимость не растёт с номером страницы, в отличие от OFFSET.
+
+PAGE_SIZE = 200
+
+# Допустимые колонки сортировки списков
+ANIMAL_SORT_COLUMNS = ('id', 'name', 'species', 'birth_date', 'arrival_date',
+                       'cage_number', 'quarantine_until')
+ADOPTION_SORT_COLUMNS = ('id', 'name', 'species', 'birth_date', 'arrival_date',
+                         'owner_name', 'owner_contact', 'adoption_date')
+
+
+def _keyset_page(columns: str, where: str, sort: str, allowed, after, limit: int):
+    """
+    Общая часть постраничных выборок из animals.
+    Возвращает (rows, next_after); next_after = None, если строк больше нет.
+    """
+    if sort not in allowed:
+        raise ValueError(f"Недопустимая колонка сортировки: {sort}")
+    params = []
+    if sort == 'id':
+        sort_expr = "id"
+        if after is not None:
+            where += " AND id > ?"
+            params.append(after[1])
+        order = "id"
+    else:
+        # NULL в сравнении кортежей выпал бы из выборки — приводим к ''.
+        # Сортировку и поиск начала страницы даёт индекс idx_animals_*_by_<колонка>;
+        # сравнение кортежей SQLite по индексу не ищет — отдельное условие «>=»
+        sort_expr = f"coalesce({sort}, '')"
+        if after is not None:
+            where += f" AND {sort_expr} >= ? AND ({sort_expr}, id) > (?, ?)"
+            params += [after[0], *after]
+        order = f"{sort_expr}, id"
+
+    cur = get_connection().execute(f'''
+        SELECT {columns}, {sort_expr}
+          FROM animals
+         WHERE {where}
+         ORDER BY {order}
+         LIMIT ?
+    ''', (*params, limit))
+    raw = cur.fetchall()
+    rows = [row[:-1] for row in raw]
+    next_after = (raw[-1][-1], raw[-1][0]) if len(raw) == limit else None
+    return rows, next_after
+
+
+def get_animals_page(after=None, limit: int = PAGE_SIZE, sort: str = 'id'):
+    """
+    Страница активных животных в формате get_all_animals.
+    after — next_after из предыдущего вызова (None для первой страницы).
+    Возвращает (rows, next_after).
+    """
+    return _keyset_page(
+        "id, name, species, birth_date, age_estimated, "
+        "arrival_date, cage_number, quarantine_until",
+        "deleted = 0 AND adopted = 0", sort, ANIMAL_SORT_COLUMNS, after, limit)
+
+
+def get_adoptions_page(after=None, limit: int = PAGE_SIZE, sort: str = 'id'):
+    """
+    Страница усыновлённых животных в формате get_all_adoptions.
+    Возвращает (rows, next_after).
+    """
+    return _keyset_page(
+        "id, name, species, birth_date, age_estimated, "
+        "arrival_date, adoption_date, owner_name, owner_contact",
+        "adopted = 1 AND deleted = 0", sort, ADOPTION_SORT_COLUMNS, after, limit)
+
+
+def count_animals() -> int:
+    """Число активных животных"""
+    return get_connection().execute(
+        "SELECT count(*) FROM animals WHERE deleted = 0 AND adopted = 0").fetchone()[0]
+
+
+def count_adoptions() -> int:
+    """Число усыновлённых животных"""
+    return get_connection().execute(
+        "SELECT count(*) FROM animals WHERE adopted = 1 AND deleted = 0").fetchone()[0]
+
+
+# === Реестр клеток ===
+# Таблица cages хранит клетки серий К и О от 0 до «верхней отметки» серии:
+# занятые (с animal_id) и свободные. Свободные найдутся по частичному индексу
+# idx_cages_free, следующая новая — после max(num) по первичному ключу.
+# Занятие клетки идёт в той же транзакции, что и запись животного,
+# поэтому две рабочие станции не получат одну клетку.
+
+# Колонки animals, от которых зависит занятость клетки
+_CAGE_FIELDS = {'cage_number', 'deleted', 'adopted'}
+
+_NO_FREE_CAGES = {
+    'К': "Нет свободных карантинных клеток",
+    'О': "Нет свободных обычных клеток",
+}
+
+
+def _extend_cage_series(cur, series: str, num: int):
+    """Дописывает свободные клетки серии от верхней отметки до num (не включая)"""
+    high = cur.execute("SELECT max(num) FROM cages WHERE series = ?", (series,)).fetchone()[0]
+    start = 0 if high is None else high + 1
+    if num > start:
+        cur.execute('''
+            WITH RECURSIVE n(x) AS (SELECT ? UNION ALL SELECT x + 1 FROM n WHERE x + 1 < ?)
+            INSERT INTO cages(series, num, code)
+            SELECT ?, x, ? || printf('%04X', x) FROM n
+        ''', (start, num, series, series))
+
+
+def _occupy_cage(cur, cage_number, animal_id: int, strict: bool = True):
+    """
+    Отмечает клетку занятой животным animal_id.
+    strict — ValueError, если клетка уже занята другим животным.
+    Пустые и нестандартные номера в реестр не попадают.
+    """
+    parsed = parse_cage_number(cage_number)
+    if parsed is None:
+        return
+    series, num = parsed
+    _extend_cage_series(cur, series, num)
+    cur.execute('''
+        INSERT INTO cages(series, num, code, status, animal_id)
+        VALUES (?, ?, ?, 'occupied', ?)
+        ON CONFLICT(series, num) DO UPDATE
+           SET status = 'occupied', animal_id = excluded.animal_id
+         WHERE cages.status = 'free'
+    ''', (series, num, format_cage_number(series, num), animal_id))
+    if strict and cur.rowcount == 0:
+        raise ValueError(f"Клетка {cage_number} уже занята")
+
+
+def _release_cage(cur, animal_id: int):
+    """Освобождает клетку животного (удаление, передача, переселение)"""
+    cur.execute('''
+        UPDATE cages SET status = 'free', animal_id = NULL
+         WHERE animal_id = ?
+    ''', (animal_id,))
+
+
+def _sync_animal_cage(cur, animal_id: int):
+    """Приводит реестр в соответствие с текущей строкой животного"""
+    _release_cage(cur, animal_id)
+    row = cur.execute(
+        "SELECT cage_number FROM animals WHERE id = ? AND deleted = 0 AND adopted = 0",
+        (animal_id,)).fetchone()
+    if row:
+        _occupy_cage(cur, row[0], animal_id)
+
+
+def allocate_cages(series: str = 'К', count: int = 1, exclude=()) -> list:
+    """
+    count свободных клеток серии по возрастанию номера: сначала освобождённые,
+    затем новые после верхней отметки. exclude — канонические номера,
+    которые уже разобраны (например, другими строками импорта).
+    Клетки не занимаются: это делает запись животного в той же транзакции.
+    """
+    if series not in CAGE_SERIES:
+        raise ValueError(f"Неизвестная серия клеток: {series}")
+    conn = get_connection()
+    result = []
+    if count <= 0:
+        return result
+
+    free = conn.execute('''
+        SELECT code FROM cages INDEXED BY idx_cages_free
+         WHERE series = ? AND status = 'free'
+         ORDER BY num
+    ''', (series,))
+    for (code,) in free:
+        if code not in exclude:
+            result.append(code)
+            if len(result) == count:
+                return result
+
+    high = conn.execute("SELECT max(num) FROM cages WHERE series = ?", (series,)).fetchone()[0]
+    num = 0 if high is None else high + 1
+    while len(result) < count and num <= 0xFFFF:
+        code = format_cage_number(series, num)
+        if code not in exclude:
+            result.append(code)
+        num += 1
+    if len(result) < count:
+        raise RuntimeError(_NO_FREE_CAGES[series])
+    return result
+
+
+def next_free_cage(series: str = 'К') -> str:
+    """Первая свободная клетка серии (RuntimeError, если свободных нет)"""
+    return allocate_cages(series, 1)[0]
+
+
+def is_cage_free(cage_number: str, animal_id=None) -> bool:
+    """Свободна ли клетка (или занята самим animal_id)"""
+    parsed = parse_cage_number(cage_number)
+    if parsed is None:
+        return True
+    row = get_connection().execute('''
+        SELECT animal_id FROM cages
+         WHERE series = ? AND num = ? AND status = 'occupied'
+    ''', parsed).fetchone()
+    return row is None or row[0] == animal_id
+
+
+# === История клеток и поиск контактов ===
+# cage_stays — интервалы «животное в клетке с date_from по date_to»
+# (date_to NULL — до сих пор). История не редактируется напрямую, а
+# перестраивается по данным животного при каждой правке, от которой она
+# зависит: поступление, события «Перевод» и «Карантин», передача, удаление.
+# Текущая клетка активного животного (animals.cage_number) считается
+# клеткой последнего интервала — правка в таблице исправляет его, а не
+# создаёт перевод без даты.
+# Стандартные клетки дополнительно лежат в R*Tree cage_stays_rtree:
+# пересечение по клетке и дням — поиск по дереву, а не перебор истории.
+
+_MOVE_EVENT_TYPES = ('Перевод', 'Карантин')
+
+# Колонки animals, от которых зависит история клеток
+_STAY_FIELDS = {'arrival_date', 'cage_number', 'deleted', 'adopted', 'adoption_date'}
+
+# Конец открытого интервала в R*Tree
+_OPEN_DAY = date.max.toordinal()
+
+CONTACT_COLUMNS = [
+    'animal_id', 'name', 'species', 'cage_number', 'date_from', 'date_to',
+    'adopted', 'owner_name', 'owner_contact',
+]
+
+
+def _day(iso_date: str) -> int:
+    """Дата YYYY-MM-DD -> номер дня (ValueError для некорректной)"""
+    return date.fromisoformat(iso_date).toordinal()
+
+
+def _valid_date(value) -> bool:
+    try:
+        _day(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def _cage_key(series: str, num: int) -> int:
+    """Клетка -> целое: соседние номера одной серии — соседние числа"""
+    return CAGE_SERIES.index(series) * 0x10000 + num
+
+
+def _cage_moves(etype, date_start, date_end, results):
+    """Переселения из события «Перевод»/«Карантин»: [(дата, откуда, куда), ...]"""
+    try:
+        data = json.loads(results) if results else {}
+    except ValueError:
+        data = {}
+    if not isinstance(data, dict):
+        data = {}
+    if etype == 'Перевод':
+        moves = [(date_start, data.get('Клетка_из'), data.get('Клетка_в'))]
+    else:
+        quarantine_cage = data.get('Клетка_отсиживания')
+        moves = [(date_start, None, quarantine_cage)]
+        if data.get('Клетка_по_окончанию'):
+            end = date_end or data.get('Назначенная_дата_завершения')
+            moves.append((end, quarantine_cage, data['Клетка_по_окончанию']))
+    return [(when, src or None, dst) for when, src, dst in moves
+            if dst and _valid_date(when)]
+
+
+def _rebuild_cage_stays(cur, animal_id: int):
+    """Перестраивает историю клеток животного по его текущим данным"""
+    cur.execute('''
+        DELETE FROM cage_stays_rtree
+         WHERE id IN (SELECT id FROM cage_stays WHERE animal_id = ?)
+    ''', (animal_id,))
+    cur.execute("DELETE FROM cage_stays WHERE animal_id = ?", (animal_id,))
+
+    animal = cur.execute('''
+        SELECT arrival_date, cage_number, adopted, adoption_date
+          FROM animals WHERE id = ? AND deleted = 0
+    ''', (animal_id,)).fetchone()
+    if animal is None or not _valid_date(animal[0]):
+        return
+    arrival, current_cage, adopted, adoption_date = animal
+    end = adoption_date if adopted and _valid_date(adoption_date) else None
+
+    events = cur.execute(f'''
+        SELECT type, date_start, date_end, results FROM events
+         WHERE animal_id = ? AND deleted = 0
+           AND type IN ({", ".join("?" * len(_MOVE_EVENT_TYPES))})
+         ORDER BY date_start, id
+    ''', (animal_id, *_MOVE_EVENT_TYPES)).fetchall()
+    moves = sorted((move for event in events for move in _cage_moves(*event)),
+                   key=lambda move: move[0])
+
+    # клетка при поступлении — «откуда» первого переселения
+    cage = moves[0][1] if moves else current_cage
+    start = arrival
+    stays = []
+    for when, _src, dst in moves:
+        when = max(when, arrival)
+        if end is not None and when > end:
+            break
+        if cage and when > start:
+            stays.append((cage, start, when))
+        cage, start = dst, when
+    if not adopted and current_cage:
+        cage = current_cage
+    if cage:
+        stays.append((cage, start, end))
+
+    for cage, date_from, date_to in stays:
+        cage = canonical_cage_number(cage)
+        cur.execute('''
+            INSERT INTO cage_stays(animal_id, cage_number, date_from, date_to)
+            VALUES (?, ?, ?, ?)
+        ''', (animal_id, cage, date_from, date_to))
+        parsed = parse_cage_number(cage)
+        if parsed is not None:
+            key = _cage_key(*parsed)
+            cur.execute('''
+                INSERT INTO cage_stays_rtree(id, cage_lo, cage_hi, day_lo, day_hi)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (cur.lastrowid, key, key, _day(date_from),
+                  _OPEN_DAY if date_to is None else _day(date_to)))
+
+
+def get_cage_stays(animal_id: int):
+    """История клеток животного: [(cage_number, date_from, date_to), ...]"""
+    cur = get_connection().execute('''
+        SELECT cage_number, date_from, date_to FROM cage_stays
+         WHERE animal_id = ?
+         ORDER BY date_from, id
+    ''', (animal_id,))
+    return cur.fetchall()
+
+
+def iter_cage_contacts(cage_number: str, date_from: str, date_to: str = None,
+                       radius: int = 0, exclude_animal=None):
+    """
+    Потоково выдаёт пребывания в клетке cage_number и соседних (±radius
+    номеров той же серии), пересекающиеся с периодом date_from..date_to
+    включительно (date_to=None — без верхней границы). Строки — CONTACT_COLUMNS.
+    Пример: iter_cage_contacts('К00A3', '2024-03-01', '2024-03-20', radius=1).
+    """
+    parsed = parse_cage_number(cage_number)
+    if parsed is None:
+        raise ValueError(f"Некорректный номер клетки: {cage_number}")
+    series, num = parsed
+    base = _cage_key(series, 0)
+    params = [base + min(0xFFFF, num + radius), base + max(0, num - radius),
+              _OPEN_DAY if date_to is None else _day(date_to), _day(date_from)]
+    exclude = ""
+    if exclude_animal is not None:
+        exclude = "AND s.animal_id != ?"
+        params.append(exclude_animal)
+    return _iter_query(f'''
+        SELECT a.id, a.name, a.species, s.cage_number, s.date_from, s.date_to,
+               a.adopted, a.owner_name, a.owner_contact
+          FROM cage_stays_rtree r
+          JOIN cage_stays s ON s.id = r.id
+          JOIN animals a ON a.id = s.animal_id
+         WHERE r.cage_lo <= ? AND r.cage_hi >= ?
+           AND r.day_lo <= ? AND r.day_hi >= ?
+           AND a.deleted = 0 {exclude}
+         ORDER BY s.cage_number, s.date_from, a.id
+    ''', params)
+
+
+def find_cage_contacts(cage_number: str, date_from: str, date_to: str = None,
+                       radius: int = 0, exclude_animal=None) -> list:
+    """То же, что iter_cage_contacts, списком"""
+    return list(iter_cage_contacts(cage_number, date_from, date_to, radius, exclude_animal))
+
+
+# === Индекс документов ===
+# Таблицы documents и document_dirs заполняет documents.reconcile_*;
+# карточка животного читает только их.
+
+def get_documents(animal_id: int) -> list:
+    """Пути документов животного (docs/<id>/<файл>) в порядке добавления"""
+    cur = get_connection().execute('''
+        SELECT filename FROM documents
+         WHERE animal_id = ?
+         ORDER BY ctime_ns, filename
+    ''', (animal_id,))
+    return [os.path.normpath(os.path.join('docs', str(animal_id), row[0]))
+            for row in cur.fetchall()]
+
+
+def get_document_entries(animal_id: int) -> list:
+    """
+    Документы животного с ключом миниатюры: (путь, hash, mtime_ns, mime)
+    в том же порядке, что get_documents. hash пустой, пока файл не захеширован.
+    """
+    cur = get_connection().execute('''
+        SELECT filename, hash, mtime_ns, mime FROM documents
+         WHERE animal_id = ?
+         ORDER BY ctime_ns, filename
+    ''', (animal_id,))
+    return [(os.path.normpath(os.path.join('docs', str(animal_id), filename)), digest, mtime_ns, mime)
+            for filename, digest, mtime_ns, mime in cur.fetchall()]
+
+
+def get_document_stats(animal_id: int) -> dict:
+    """{файл: (size, mtime_ns)} из индекса — для сверки с диском"""
+    cur = get_connection().execute(
+        "SELECT filename, size, mtime_ns FROM documents WHERE animal_id = ?", (animal_id,))
+    return {name: (size, mtime_ns) for name, size, mtime_ns in cur.fetchall()}
+
+
+def get_document_dirs() -> dict:
+    """{animal_id: mtime_ns папки} на момент последней сверки"""
+    return dict(get_connection().execute("SELECT animal_id, mtime_ns FROM document_dirs"))
+
+
+def _upsert_documents(cur, animal_id: int, rows):
+    """Запись файлов в индекс (строки — как в sync_documents.upserts)"""
+    cur.executemany('''
+        INSERT INTO documents(animal_id, filename, size, mtime_ns, ctime_ns, hash, mime)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(animal_id, filename) DO UPDATE
+           SET size = excluded.size, mtime_ns = excluded.mtime_ns,
+               hash = excluded.hash, mime = excluded.mime
+    ''', [(animal_id, *row) for row in rows])
+    # прикреплённые до индексации документы получают хеш; уже известный
+    # хеш не меняется — событие ссылается на то содержимое, что прикрепили
+    cur.executemany('''
+        UPDATE event_docs SET hash = ?
+         WHERE hash IS NULL AND filename = ?
+           AND event_id IN (SELECT id FROM events WHERE animal_id = ?)
+    ''', [(row[4], row[0], animal_id) for row in rows])
+
+
+def sync_documents(animal_id: int, upserts, removed, dir_mtime=None) -> bool:
+    """
+    Записывает результат сверки папки животного одной транзакцией.
+    upserts — (filename, size, mtime_ns, ctime_ns, hash, mime), removed — имена.
+    dir_mtime=None — папки нет. ctime_ns у уже известных файлов не меняется:
+    это время появления файла, порядок в карточке.
+    Возвращает True, если список файлов изменился.
+    """
+    with transaction() as cur:
+        _upsert_documents(cur, animal_id, upserts)
+        cur.executemany("DELETE FROM documents WHERE animal_id = ? AND filename = ?",
+                        [(animal_id, name) for name in removed])
+        if dir_mtime is None:
+            cur.execute("DELETE FROM document_dirs WHERE animal_id = ?", (animal_id,))
+        else:
+            cur.execute('''
+                INSERT INTO document_dirs(animal_id, mtime_ns) VALUES (?, ?)
+                ON CONFLICT(animal_id) DO UPDATE SET mtime_ns = excluded.mtime_ns
+            ''', (animal_id, dir_mtime))
+        updated = bool(upserts or removed)
+        if updated:
+            _changed(changes.DOCUMENTS_CHANGED, animal_id=animal_id)
+    return updated
+
+
+def add_documents(animal_id: int, rows):
+    """
+    Файлы, которые программа сама положила в папку животного (ingest):
+    в индекс сразу, без ожидания сверки. Строки — как в sync_documents.upserts.
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    with transaction() as cur:
+        _upsert_documents(cur, animal_id, rows)
+        _changed(changes.DOCUMENTS_CHANGED, animal_id=animal_id)
+
+
+def iter_documents():
+    """Потоково: (animal_id, filename, size, mtime_ns, hash) всего индекса"""
+    return _iter_query('''
+        SELECT animal_id, filename, size, mtime_ns, hash FROM documents
+         ORDER BY animal_id, filename
+    ''')
+
+
+def set_document_stats(rows):
+    """Новые размер и mtime файлов без смены содержимого: (size, mtime_ns, animal_id, filename)"""
+    with transaction() as cur:
+        cur.executemany('''
+            UPDATE documents SET size = ?, mtime_ns = ?
+             WHERE animal_id = ? AND filename = ?
+        ''', rows)
+
+
+def get_referenced_hashes() -> set:
+    """Хеши, на которые ссылаются индекс документов или прикрепления к событиям"""
+    cur = get_connection().execute('''
+        SELECT hash FROM documents WHERE hash IS NOT NULL
+        UNION
+        SELECT hash FROM event_docs WHERE hash IS NOT NULL
+    ''')
+    return {row[0] for row in cur.fetchall()}
+
+
+def get_documents_size() -> int:
+    """Суммарный размер проиндексированных документов"""
+    return get_connection().execute("SELECT coalesce(sum(size), 0) FROM documents").fetchone()[0]
@@ -0,0 +1,143 @@
+"""
+Хранилище документов по содержимому (необязательное)
+
+Файл с SHA-256 <hash> хранится один раз: docs/.store/<hash[:2]>/<hash>,
+а docs/<id>/<имя> — жёсткая ссылка на него. Одинаковые справки у
+однопомётников занимают место один раз, и резервная копия папки docs
+тоже получается меньше.
+
+Хранилище включено, если существует папка docs/.store (см. enable);
+тогда documents.reconcile_* переносят в него новые файлы. Если файловая
+система не умеет жёстких ссылок, блоб сохраняется копией, а файл в папке
+животного остаётся обычным — ссылкой служит хеш в индексе.
+
+Внимание: все ссылки на блоб — один и тот же файл. Программы, которые
+правят документ на месте (а не сохраняют новый файл), меняют его у всех
+животных сразу; verify() находит такие блобы.
+"""
+import os
+import shutil
+
+import database
+
+STORE_NAME = ".store"
+LINK_SUFFIX = ".link-tmp"
+
+
+def store_dir(docs_root: str) -> str:
+    return os.path.join(docs_root, STORE_NAME)
+
+
+def enabled(docs_root: str) -> bool:
+    """Включено ли хранилище для docs_root"""
+    return os.path.isdir(store_dir(docs_root))
+
+
+def enable(docs_root: str):
+    """Включает хранилище (создаёт docs/.store)"""
+    os.makedirs(store_dir(docs_root), exist_ok=True)
+
+
+def blob_path(digest: str, docs_root: str) -> str:
+    """Путь блоба с содержимым digest"""
+    return os.path.join(store_dir(docs_root), digest[:2], digest)
+
+
+def adopt(path: str, digest: str, docs_root: str) -> bool:
+    """
+    Переносит файл path (с уже посчитанным хешем digest) в хранилище.
+    Возвращает True, если path теперь жёсткая ссылка на блоб.
+    """
+    blob = blob_path(digest, docs_root)
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    if not os.path.exists(blob):
+        try:
+            os.link(path, blob)   # первый экземпляр сам становится блобом
+            return True
+        except FileExistsError:
+            pass                  # блоб успели создать параллельно
+        except OSError:
+            shutil.copy2(path, blob)
+            return False
+    if os.path.samefile(path, blob):
+        return True
+
+    tmp = path + LINK_SUFFIX
+    try:
+        os.link(blob, tmp)
+        os.replace(tmp, path)     # атомарная подмена файла ссылкой
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return False
+    return True
+
+
+def adopt_indexed(docs_root: str) -> int:
+    """
+    Переносит в хранилище уже проиндексированные файлы (первое включение).
+    Файлы, изменившиеся после индексации, пропускаются — их подхватит сверка.
+    Возвращает число файлов, ставших ссылками.
+    """
+    linked = []
+    for animal_id, filename, size, mtime_ns, digest in database.iter_documents():
+        path = os.path.join(docs_root, str(animal_id), filename)
+        try:
+            st = os.stat(path)
+            if (st.st_size, st.st_mtime_ns) != (size, mtime_ns) or not digest:
+                continue
+            if adopt(path, digest, docs_root):
+                st = os.stat(path)
+                linked.append((st.st_size, st.st_mtime_ns, animal_id, filename))
+        except OSError:
+            continue
+    # ссылка получает mtime блоба — запоминаем, чтобы сверка не хешировала заново
+    database.set_document_stats(linked)
+    return len(linked)
+
+
+def iter_blobs(docs_root: str):
+    """(hash, путь) всех блобов хранилища"""
+    root = store_dir(docs_root)
+    if not os.path.isdir(root):
+        return
+    with os.scandir(root) as shards:
+        for shard in shards:
+            if shard.is_dir():
+                with os.scandir(shard.path) as blobs:
+                    for blob in blobs:
+                        if blob.is_file() and not blob.name.endswith(LINK_SUFFIX):
+                            yield blob.name, blob.path
+
+
+def collect_garbage(docs_root: str) -> tuple:
+    """
+    Удаляет блобы, на которые не ссылаются ни индекс документов, ни
+    event_docs, и у которых нет других жёстких ссылок на диске.
+    Возвращает (число удалённых, освобождено байт).
+    """
+    referenced = database.get_referenced_hashes()
+    count = freed = 0
+    for digest, path in list(iter_blobs(docs_root)):
+        if digest in referenced:
+            continue
+        st = os.stat(path)
+        if st.st_nlink > 1:
+            continue  # файл ещё лежит в папке животного, но не проиндексирован
+        os.remove(path)
+        count += 1
+        freed += st.st_size
+    return count, freed
+
+
+def verify(docs_root: str, hash_file) -> list:
+    """Блобы, содержимое которых не совпадает с именем (hash_file — функция хеширования)"""
+    return [path for digest, path in iter_blobs(docs_root) if hash_file(path) != digest]
+
+
+def usage(docs_root: str) -> dict:
+    """Место в хранилище и объём документов по индексу"""
+    stored = sum(os.stat(path).st_size for _digest, path in iter_blobs(docs_root))
+    logical = database.get_documents_size()
+    return {'blobs_bytes': stored, 'documents_bytes': logical,
+            'saved_bytes': max(0, logical - stored)}
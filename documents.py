@@ -0,0 +1,192 @@
+"""
+Индекс документов животных (папки docs/<id>) и сверка с файловой системой
+
+Карточка читает список файлов из таблицы documents, а не обходит папку.
+Сверка идёт в фоне: папки, у которых не изменилось время модификации,
+пропускаются без чтения содержимого; в изменённых файлы перечисляются
+через os.scandir (на Windows размер и даты приходят вместе со списком,
+без отдельного stat на файл), а хеш пересчитывается только у файлов
+с новым размером или mtime. Если включено хранилище docstore, новые
+файлы сразу переносятся в него.
+
+Запуск без интерфейса:
+    python documents.py reconcile [--force]   # обновить индекс
+    python documents.py dedupe                # включить хранилище и перенести файлы
+    python documents.py gc                    # удалить неиспользуемые блобы
+    python documents.py stats | verify
+"""
+import argparse
+import hashlib
+import mimetypes
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import database
+import docstore
+
+DOCS_ROOT = "docs"
+
+HASH_CHUNK = 1 << 20
+
+# С какого числа файлов хешировать в пуле процессов (большие пакеты, первая сверка)
+PARALLEL_HASH_MIN_FILES = 32
+
+
+def file_hash(path: str) -> str:
+    """SHA-256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _hash_or_none(path: str):
+    """file_hash без исключений (для пула): None — файл удалили или он занят"""
+    try:
+        return file_hash(path)
+    except OSError:
+        return None
+
+
+def hash_files(paths, workers=None) -> dict:
+    """
+    {путь: SHA-256 или None}. Большие пакеты хешируются в пуле процессов
+    (spawn: процесс с Tk и потоками безопаснее не форкать).
+    """
+    paths = list(paths)
+    if len(paths) >= PARALLEL_HASH_MIN_FILES and workers != 1:
+        context = multiprocessing.get_context("spawn")
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                return dict(zip(paths, pool.map(_hash_or_none, paths, chunksize=8)))
+        except (BrokenProcessPool, OSError):
+            pass  # процессы не запустились (например, в собранном exe) — считаем здесь
+    return {path: _hash_or_none(path) for path in paths}
+
+
+def scan_dir(folder: str) -> dict:
+    """
+    {имя файла: (size, mtime_ns, ctime_ns)} для файлов папки (без вложенных).
+    Скрытые файлы (в т.ч. недокопированные .*.part) и временные ссылки
+    docstore пропускаются.
+    """
+    result = {}
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.name.startswith(".") or entry.name.endswith(docstore.LINK_SUFFIX):
+                continue
+            if entry.is_file():
+                st = entry.stat()
+                result[entry.name] = (st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+    return result
+
+
+def _scan_animal(animal_id: int, docs_root: str, dir_mtime=None):
+    """
+    Что изменилось в папке животного: (dir_mtime, files, known, to_hash).
+    dir_mtime снимается до чтения папки: всё, что добавят позже, попадёт
+    в следующую сверку.
+    """
+    folder = os.path.join(docs_root, str(animal_id))
+    try:
+        if dir_mtime is None:
+            dir_mtime = os.stat(folder).st_mtime_ns
+        files = scan_dir(folder)
+    except FileNotFoundError:
+        dir_mtime, files = None, {}
+    known = database.get_document_stats(animal_id)
+    to_hash = [os.path.join(folder, name) for name, (size, mtime_ns, _ctime) in files.items()
+               if known.get(name) != (size, mtime_ns)]
+    return dir_mtime, files, known, to_hash
+
+
+def _sync_animal(animal_id: int, docs_root: str, scanned, digests: dict) -> bool:
+    """Записывает в индекс результат _scan_animal с посчитанными хешами"""
+    dir_mtime, files, known, to_hash = scanned
+    use_store = docstore.enabled(docs_root)
+    upserts = []
+    for path in to_hash:
+        digest = digests.get(path)
+        if digest is None:
+            continue  # разберёмся при следующей сверке
+        name = os.path.basename(path)
+        size, mtime_ns, ctime_ns = files[name]
+        if use_store and docstore.adopt(path, digest, docs_root):
+            # файл стал ссылкой на блоб — в индекс его новые размер и mtime
+            st = os.stat(path)
+            size, mtime_ns = st.st_size, st.st_mtime_ns
+        upserts.append((name, size, mtime_ns, ctime_ns, digest, mimetypes.guess_type(name)[0]))
+    removed = [name for name in known if name not in files]
+    return database.sync_documents(animal_id, upserts, removed, dir_mtime)
+
+
+def reconcile_animal(animal_id: int, docs_root: str = DOCS_ROOT, dir_mtime=None) -> bool:
+    """
+    Приводит индекс документов животного к содержимому docs_root/<id>.
+    dir_mtime — mtime папки, снятый до чтения (если уже известен).
+    Возвращает True, если индекс изменился.
+    """
+    scanned = _scan_animal(animal_id, docs_root, dir_mtime)
+    return _sync_animal(animal_id, docs_root, scanned, hash_files(scanned[3]))
+
+
+def reconcile_all(docs_root: str = DOCS_ROOT, force: bool = False, workers=None) -> list:
+    """
+    Сверка всех папок docs_root/<id>. Папки с прежним mtime пропускаются
+    (force — проверить все). Новые файлы всех папок хешируются одним
+    пакетом. Возвращает ID животных, чей индекс изменился.
+    """
+    indexed = database.get_document_dirs()
+    try:
+        with os.scandir(docs_root) as entries:
+            dirs = {int(entry.name): entry.stat().st_mtime_ns for entry in entries
+                    if entry.is_dir() and entry.name.isdigit()}
+    except FileNotFoundError:
+        dirs = {}
+    # папки, удалённые целиком, сверяются как пустые
+    dirs.update((animal_id, None) for animal_id in indexed.keys() - dirs.keys())
+
+    scans = {animal_id: _scan_animal(animal_id, docs_root, dir_mtime)
+             for animal_id, dir_mtime in dirs.items()
+             if force or dir_mtime is None or indexed.get(animal_id) != dir_mtime}
+    digests = hash_files([path for scanned in scans.values() for path in scanned[3]], workers)
+    return [animal_id for animal_id, scanned in scans.items()
+            if _sync_animal(animal_id, docs_root, scanned, digests)]
+
+
+def main(argv=None) -> int:
+    """Точка входа командной строки"""
+    parser = argparse.ArgumentParser(description="Индекс и хранилище документов ShelterApp")
+    parser.add_argument("command", choices=("reconcile", "dedupe", "gc", "stats", "verify"))
+    parser.add_argument("--root", default=DOCS_ROOT, help="папка документов")
+    parser.add_argument("--force", action="store_true", help="проверить все папки")
+    args = parser.parse_args(argv)
+
+    database.init_db()
+    if args.command == "reconcile":
+        changed = reconcile_all(args.root, force=args.force)
+        print(f"Обновлён индекс папок: {len(changed)}")
+    elif args.command == "dedupe":
+        docstore.enable(args.root)
+        reconcile_all(args.root, force=True)
+        print(f"Файлов заменено ссылками: {docstore.adopt_indexed(args.root)}")
+    elif args.command == "gc":
+        count, freed = docstore.collect_garbage(args.root)
+        print(f"Удалено блобов: {count}, освобождено байт: {freed}")
+    elif args.command == "stats":
+        for key, value in docstore.usage(args.root).items():
+            print(f"{key}: {value}")
+    else:
+        broken = docstore.verify(args.root, file_hash)
+        for path in broken:
+            print(f"Не совпадает с хешем: {path}")
+        return 1 if broken else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+Потоковый экспорт истории приюта в CSV/JSONL (аудит, отчёты для муниципалитета)
+
+Строки читаются из БД пачками и сразу пишутся в файл, поэтому
+потребление памяти не зависит от объёма истории.
+
+Запуск без интерфейса:
+    python exporter.py events out.csv [--from 2024-01-01] [--to 2024-12-31]
+                       [--species Cat] [--status all|active|adopted]
+    python exporter.py contacts out.csv --cage К00A3 --from 2024-03-01
+                       [--to 2024-03-20] [--radius 1]
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from typing import Iterable, Optional
+
+import database
+from config import config
+
+EXPORT_KINDS = ('animals', 'adoptions', 'events', 'contacts')
+
+ANIMAL_COLUMNS = [
+    'id', 'name', 'species', 'birth_date', 'age_estimated', 'arrival_date',
+    'cage_number', 'quarantine_until', 'adopted', 'adoption_date',
+    'owner_name', 'owner_contact',
+]
+
+ADOPTION_COLUMNS = [
+    'id', 'name', 'species', 'birth_date', 'age_estimated', 'arrival_date',
+    'adoption_date', 'owner_name', 'owner_contact',
+]
+
+EVENT_COLUMNS = [
+    'event_id', 'animal_id', 'animal_name', 'species', 'type',
+    'date_start', 'date_end', 'conclusion',
+]
+
+# Ключи results, которых нет в event_config.txt, попадают сюда одной JSON-строкой
+RESULTS_OTHER_COLUMN = 'results_other'
+
+
+def detect_format(path: str) -> str:
+    """Определяет формат по расширению файла"""
+    ext = os.path.splitext(path)[1].lower()
+    return "jsonl" if ext in (".jsonl", ".ndjson") else "csv"
+
+
+def write_rows(path: str, columns: list, rows: Iterable, fmt: Optional[str] = None) -> int:
+    """Пишет строки (последовательности в порядке columns) по одной; возвращает их число"""
+    fmt = fmt or detect_format(path)
+    count = 0
+    if fmt == "jsonl":
+        with open(path, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n")
+                count += 1
+    else:
+        # utf-8-sig — чтобы Excel корректно открыл кириллицу
+        with open(path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+    return count
+
+
+def result_field_names(event_types: Optional[list] = None) -> list:
+    """Колонки результатов по event_config.txt (без повторов, в порядке конфига)"""
+    types = event_types or config.get_event_types()
+    names = {}
+    for etype in types:
+        for fname, _ftype in config.get_event_fields(etype):
+            names.setdefault(fname, None)
+    return list(names)
+
+
+def expand_results(results: Optional[str], fields: list) -> list:
+    """Разворачивает JSON results в значения колонок fields + results_other"""
+    try:
+        data = json.loads(results) if results else {}
+    except ValueError:
+        data = {}
+    if not isinstance(data, dict):
+        data = {}
+    values = [data.pop(name, "") for name in fields]
+    values.append(json.dumps(data, ensure_ascii=False) if data else "")
+    return values
+
+
+def export_animals(path: str, fmt: Optional[str] = None, date_from=None,
+                   date_to=None, species=None, status='all') -> int:
+    """Экспорт животных (фильтр дат — по дате поступления)"""
+    rows = database.iter_animals(date_from, date_to, species, status)
+    return write_rows(path, ANIMAL_COLUMNS, rows, fmt)
+
+
+def export_adoptions(path: str, fmt: Optional[str] = None, date_from=None,
+                     date_to=None, species=None) -> int:
+    """Экспорт усыновлений (фильтр дат — по дате передачи)"""
+    rows = database.iter_adoptions(date_from, date_to, species)
+    return write_rows(path, ADOPTION_COLUMNS, rows, fmt)
+
+
+def export_events(path: str, fmt: Optional[str] = None, date_from=None,
+                  date_to=None, species=None, status='all',
+                  event_types: Optional[list] = None) -> int:
+    """Экспорт событий с развёрнутыми в колонки результатами"""
+    fields = result_field_names(event_types)
+    columns = EVENT_COLUMNS + fields + [RESULTS_OTHER_COLUMN]
+    rows = (
+        [*row[:8], *expand_results(row[8], fields)]
+        for row in database.iter_events(date_from, date_to, species, status, event_types)
+    )
+    return write_rows(path, columns, rows, fmt)
+
+
+def export_contacts(path: str, cage_number: str, date_from: str, date_to=None,
+                    radius: int = 0, fmt: Optional[str] = None) -> int:
+    """Список контактов: кто был в клетке (и в соседних ±radius) за период"""
+    rows = database.iter_cage_contacts(cage_number, date_from, date_to, radius)
+    return write_rows(path, database.CONTACT_COLUMNS, rows, fmt)
+
+
+def main(argv=None) -> int:
+    """Точка входа командной строки"""
+    parser = argparse.ArgumentParser(description="Экспорт данных ShelterApp")
+    parser.add_argument("kind", choices=EXPORT_KINDS)
+    parser.add_argument("path", help="файл .csv или .jsonl")
+    parser.add_argument("--format", choices=("csv", "jsonl"), default=None)
+    parser.add_argument("--from", dest="date_from", default=None, help="YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", default=None, help="YYYY-MM-DD")
+    parser.add_argument("--species", default=None)
+    parser.add_argument("--status", choices=database.ANIMAL_STATUSES, default='all')
+    parser.add_argument("--type", dest="event_types", action="append", default=None,
+                        help="тип события (можно несколько раз)")
+    parser.add_argument("--cage", default=None, help="клетка для contacts, например К00A3")
+    parser.add_argument("--radius", type=int, default=0,
+                        help="contacts: сколько соседних номеров учитывать")
+    args = parser.parse_args(argv)
+    if args.kind == 'contacts' and not (args.cage and args.date_from):
+        parser.error("для contacts нужны --cage и --from")
+
+    database.init_db()
+    filters = dict(date_from=args.date_from, date_to=args.date_to, species=args.species)
+    if args.kind == 'animals':
+        count = export_animals(args.path, args.format, status=args.status, **filters)
+    elif args.kind == 'adoptions':
+        count = export_adoptions(args.path, args.format, **filters)
+    elif args.kind == 'contacts':
+        count = export_contacts(args.path, args.cage, args.date_from, args.date_to,
+                                args.radius, args.format)
+    else:
+        count = export_events(args.path, args.format, status=args.status,
+                              event_types=args.event_types, **filters)
+
+    print(f"Экспортировано строк: {count}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
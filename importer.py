@@ -0,0 +1,215 @@
+"""
+Пакетный импорт животных из CSV/JSONL (изъятие, передача из другого приюта)
+
+Запуск без интерфейса:
+    python importer.py animals.csv [--format csv|jsonl] [--batch-size 200]
+
+Колонки/ключи: name, species, breed, birth_date, age_months,
+arrival_date, cage_number, quarantine_until. Обязательны name, species
+и одно из birth_date / age_months.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from datetime import date, timedelta
+from typing import Iterator, Optional
+
+import database
+from config import config
+from models import Animal
+from utils import canonical_cage_number, format_species_display, subtract_months
+
+DEFAULT_BATCH_SIZE = 200
+
+
+class ImportReport:
+    """Итог импорта: новые ID и ошибки по строкам входного файла"""
+
+    def __init__(self):
+        self.imported_ids: list[int] = []
+        self.errors: list[tuple[int, str]] = []  # (номер строки, сообщение)
+
+    @property
+    def imported_count(self) -> int:
+        return len(self.imported_ids)
+
+    def add_error(self, line_no: int, message: str):
+        self.errors.append((line_no, message))
+
+    def format(self) -> str:
+        """Текстовый отчёт для консоли и окна сообщения"""
+        lines = [f"Импортировано: {self.imported_count}, ошибок: {len(self.errors)}"]
+        lines += [f"  строка {line_no}: {message}" for line_no, message in self.errors]
+        return "\n".join(lines)
+
+
+def detect_format(path: str) -> str:
+    """Определяет формат по расширению файла"""
+    ext = os.path.splitext(path)[1].lower()
+    return "jsonl" if ext in (".jsonl", ".ndjson") else "csv"
+
+
+def iter_rows(path: str, fmt: str) -> Iterator[tuple[int, Optional[dict]]]:
+    """
+    Потоково читает файл и выдаёт (номер строки, словарь).
+    Для нечитаемой строки JSONL выдаётся (номер, None).
+    """
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if fmt == "jsonl":
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError:
+                    data = None
+                yield line_no, data if isinstance(data, dict) else None
+        else:
+            reader = csv.DictReader(f)
+            for row in reader:
+                # номер строки файла с учётом заголовка
+                yield reader.line_num, row
+
+
+def _text(row: dict, key: str) -> str:
+    value = row.get(key)
+    return "" if value is None else str(value).strip()
+
+
+def build_animal(row: dict) -> Animal:
+    """
+    Строит Animal из строки файла. Клетка может остаться пустой —
+    её выделит import_animals. Ошибки данных — ValueError.
+    """
+    name = _text(row, "name")
+    species = _text(row, "species")
+    if not species:
+        raise ValueError("Не указан вид")
+
+    birth_date = _text(row, "birth_date")
+    age_months = _text(row, "age_months")
+    if birth_date:
+        est_flag = 0
+    elif age_months:
+        try:
+            birth_date = subtract_months(date.today(), int(age_months)).isoformat()
+        except ValueError:
+            raise ValueError("Оценка возраста должна быть числом")
+        est_flag = 1
+    else:
+        raise ValueError("Укажите дату рождения или оценку возраста")
+
+    animal = Animal({
+        'name': name,
+        'species': format_species_display(species, _text(row, "breed")),
+        'birth_date': birth_date,
+        'age_estimated': est_flag,
+        'arrival_date': _text(row, "arrival_date") or date.today().isoformat(),
+        'cage_number': _text(row, "cage_number"),
+        'quarantine_until': _text(row, "quarantine_until"),
+    })
+    is_valid, error_msg = animal.validate()
+    if not is_valid:
+        raise ValueError(error_msg)
+    return animal
+
+
+def _insert_batch(batch: list, taken: set, report: ImportReport):
+    """
+    Проверяет клетки по реестру, выделяет карантинные и вставляет пачку
+    одним executemany. taken — клетки, уже разобранные строками этого файла.
+    """
+    ready = []
+    for line_no, animal in batch:
+        if animal.cage_number:
+            code = canonical_cage_number(animal.cage_number)
+            if code in taken or not database.is_cage_free(animal.cage_number):
+                report.add_error(line_no, f"Клетка {animal.cage_number} уже занята")
+                continue
+            taken.add(code)
+        ready.append(animal)
+
+    without_cage = [a for a in ready if not a.cage_number]
+    for animal, cage in zip(without_cage,
+                            database.allocate_cages('К', len(without_cage), exclude=taken)):
+        animal.cage_number = cage
+        taken.add(cage)
+
+    for animal in ready:
+        if animal.cage_number.startswith("К") and not animal.quarantine_until:
+            arrival = date.fromisoformat(animal.arrival_date)
+            animal.quarantine_until = (
+                arrival + timedelta(days=config.DEFAULT_QUARANTINE_DAYS)
+            ).isoformat()
+
+    new_ids = database.add_animals(
+        (a.name, a.species, a.birth_date, a.age_estimated,
+         a.arrival_date, a.cage_number, a.quarantine_until or None)
+        for a in ready
+    )
+    for animal, new_id in zip(ready, new_ids):
+        animal.id = new_id
+        animal.mark_clean()
+    report.imported_ids.extend(new_ids)
+
+
+def import_animals(path: str, fmt: Optional[str] = None,
+                   batch_size: int = DEFAULT_BATCH_SIZE,
+                   docs_root: str = "docs") -> ImportReport:
+    """
+    Импортирует животных из файла одной транзакцией.
+    Строки с ошибками пропускаются и попадают в отчёт,
+    остальные вставляются пачками по batch_size.
+    """
+    fmt = fmt or detect_format(path)
+    report = ImportReport()
+
+    with database.transaction():
+        taken = set()
+        batch = []
+        for line_no, row in iter_rows(path, fmt):
+            if row is None:
+                report.add_error(line_no, "Не удалось разобрать строку")
+                continue
+            try:
+                batch.append((line_no, build_animal(row)))
+            except ValueError as e:
+                report.add_error(line_no, str(e))
+                continue
+            if len(batch) >= batch_size:
+                _insert_batch(batch, taken, report)
+                batch = []
+        if batch:
+            _insert_batch(batch, taken, report)
+
+    # Папки документов создаём только после успешного коммита
+    for new_id in report.imported_ids:
+        os.makedirs(os.path.join(docs_root, str(new_id)), exist_ok=True)
+
+    report.errors.sort()
+    return report
+
+
+def main(argv=None) -> int:
+    """Точка входа командной строки"""
+    parser = argparse.ArgumentParser(description="Импорт животных в ShelterApp")
+    parser.add_argument("path", help="файл CSV или JSONL")
+    parser.add_argument("--format", choices=("csv", "jsonl"), default=None)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    database.init_db()
+    try:
+        report = import_animals(args.path, args.format, args.batch_size)
+    except (OSError, RuntimeError) as e:
+        print(f"Ошибка импорта: {e}", file=sys.stderr)
+        return 2
+
+    print(report.format())
+    return 1 if report.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
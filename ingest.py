@@ -0,0 +1,171 @@
+"""
+Приём файлов в папку животного (документы событий, снимки, УЗИ)
+
+Выбранный файл копируется в docs/<id> средствами ядра: os.copy_file_range,
+иначе os.sendfile, иначе обычным буферным копированием (Windows).
+SHA-256 считается в том же проходе по отображённому в память исходнику:
+данные читаются с диска один раз и не копируются в Python.
+Файл сразу попадает в индекс документов (и в docstore, если он включён).
+"""
+import errno
+import hashlib
+import mimetypes
+import mmap
+import os
+
+import database
+import docstore
+from documents import DOCS_ROOT, file_hash
+
+# Сколько копировать за шаг: между шагами — прогресс и проверка отмены
+COPY_CHUNK = 8 << 20
+
+PART_SUFFIX = ".part"
+
+# Ошибки, при которых способ копирования не поддерживается и надо взять следующий
+_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP,
+                errno.ENOTSUP, errno.EBADF, errno.ESPIPE}
+
+
+class IngestCancelled(Exception):
+    """Копирование остановлено пользователем"""
+
+
+def unique_name(folder: str, name: str) -> str:
+    """name, а если занято — «name (2).ext», «name (3).ext», ..."""
+    stem, ext = os.path.splitext(name)
+    candidate, n = name, 1
+    while os.path.exists(os.path.join(folder, candidate)):
+        n += 1
+        candidate = f"{stem} ({n}){ext}"
+    return candidate
+
+
+def _copy_file_range(src, dst, offset, count):
+    return os.copy_file_range(src.fileno(), dst.fileno(), count, offset, offset)
+
+
+def _sendfile(src, dst, offset, count):
+    os.lseek(dst.fileno(), offset, os.SEEK_SET)
+    return os.sendfile(dst.fileno(), src.fileno(), offset, count)
+
+
+def _buffered(src, dst, offset, count):
+    src.seek(offset)
+    data = src.read(count)
+    dst.seek(offset)
+    dst.write(data)
+    return len(data)
+
+
+def _copy_methods():
+    """Способы копирования от самого дешёвого"""
+    methods = []
+    if hasattr(os, "copy_file_range"):
+        methods.append(_copy_file_range)
+    if hasattr(os, "sendfile") and os.name == "posix":
+        methods.append(_sendfile)
+    methods.append(_buffered)
+    return methods
+
+
+def copy_and_hash(src_path: str, dst_path: str, progress=None, stop=None) -> str:
+    """
+    Копирует src_path в dst_path и возвращает SHA-256 содержимого.
+    progress(скопировано_байт) — после каждого шага; stop — threading.Event.
+    """
+    digest = hashlib.sha256()
+    methods = _copy_methods()
+    with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+        size = os.fstat(src.fileno()).st_size
+        mapped = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        view = memoryview(mapped) if size else None
+        try:
+            offset = 0
+            while offset < size:
+                if stop is not None and stop.is_set():
+                    raise IngestCancelled("Копирование остановлено")
+                count = min(COPY_CHUNK, size - offset)
+                try:
+                    copied = methods[0](src, dst, offset, count)
+                except OSError as e:
+                    if e.errno not in _UNSUPPORTED or len(methods) == 1:
+                        raise
+                    methods.pop(0)  # способ не подходит для этой пары файлов
+                    continue
+                if copied == 0:
+                    raise OSError(errno.EIO, "Файл укоротился во время копирования", src_path)
+                with view[offset:offset + copied] as chunk:
+                    digest.update(chunk)
+                offset += copied
+                if progress is not None:
+                    progress(offset)
+        finally:
+            if view is not None:
+                view.release()
+                mapped.close()
+        dst.truncate(size)
+    return digest.hexdigest()
+
+
+def ingest_file(animal_id: int, src_path: str, docs_root: str = DOCS_ROOT,
+                progress=None, stop=None) -> str:
+    """
+    Кладёт файл в docs_root/<id> и в индекс документов; возвращает имя в папке.
+    Файл, уже лежащий в папке, не копируется. При совпадении имени с другим
+    содержимым выбирается «имя (2).ext»; тот же файл повторно не копируется.
+    """
+    folder = os.path.join(docs_root, str(animal_id))
+    os.makedirs(folder, exist_ok=True)
+    name = os.path.basename(src_path)
+    target = os.path.join(folder, name)
+
+    if os.path.exists(target) and os.path.samefile(src_path, target):
+        digest = file_hash(target)
+        if progress is not None:
+            progress(os.path.getsize(target))
+    else:
+        part = os.path.join(folder, f".{name}{PART_SUFFIX}")
+        try:
+            digest = copy_and_hash(src_path, part, progress, stop)
+            st = os.stat(src_path)
+            os.utime(part, ns=(st.st_atime_ns, st.st_mtime_ns))
+        except BaseException:
+            if os.path.exists(part):
+                os.remove(part)
+            raise
+        if (os.path.exists(target) and os.path.getsize(target) == os.path.getsize(part)
+                and file_hash(target) == digest):
+            os.remove(part)   # тот же документ уже прикреплён под этим именем
+        else:
+            name = unique_name(folder, name)
+            target = os.path.join(folder, name)
+            os.replace(part, target)
+
+    if docstore.enabled(docs_root):
+        docstore.adopt(target, digest, docs_root)
+    st = os.stat(target)
+    database.add_documents(animal_id, [(name, st.st_size, st.st_mtime_ns, st.st_ctime_ns,
+                                        digest, mimetypes.guess_type(name)[0])])
+    return name
+
+
+def ingest_files(animal_id: int, paths, docs_root: str = DOCS_ROOT,
+                 progress=None, stop=None) -> list:
+    """
+    ingest_file для нескольких файлов; progress(скопировано, всего) — в байтах
+    по всем файлам. Возвращает имена в папке животного в порядке paths.
+    """
+    paths = list(paths)
+    total = sum(os.path.getsize(path) for path in paths)
+    done = 0
+    names = []
+    for path in paths:
+        report = None
+        if progress is not None:
+            report = lambda copied, base=done: progress(base + copied, total)
+        names.append(ingest_file(animal_id, path, docs_root, report, stop))
+        done += os.path.getsize(path)
+    if progress is not None:
+        progress(total, total)
+    return names
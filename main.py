@@ -2,17 +2,22 @@
 Главный файл приложения ShelterApp
 Точка входа в приложение после рефакторинга
 """
+from ui.startup import StartupTimer  # первым: от него отсчитывается время запуска
 import database
 from ui.main_window import ShelterApp
 
 
 def main():
     """Главная функция приложения"""
+    timer = StartupTimer()
+    timer.mark("imports")
+    
     # Инициализация базы данных
     database.init_db()
+    timer.mark("init_db")
     
     # Создание и запуск приложения
-    app = ShelterApp()
+    app = ShelterApp(startup=timer)
     app.run()
 
 
@@ -1,15 +1,47 @@
 """
 Модели данных для приложения ShelterApp
 """
+import copy
+import json
 from datetime import date
 from typing import Optional, Dict, Any
 import database
+from cache import LRUCache
+from changes import ANIMAL_TOPICS, DOCUMENTS_CHANGED, EVENT_TOPICS, bus
 from utils import validate_cage_number, validate_date_format, calculate_age_in_months
 
 
-class Animal:
+class TrackedModel:
+    """
+    Базовый класс моделей с отслеживанием изменённых полей.
+    Снимок значений TRACKED_FIELDS делается при загрузке и после save();
+    get_changes() возвращает только поля, отличающиеся от снимка.
+    """
+    
+    TRACKED_FIELDS: tuple = ()
+    
+    def mark_clean(self):
+        """Запоминает текущие значения как сохранённые"""
+        self._saved = {f: copy.deepcopy(getattr(self, f)) for f in self.TRACKED_FIELDS}
+    
+    def get_changes(self) -> Dict[str, Any]:
+        """Возвращает {поле: новое значение} для изменённых полей"""
+        return {
+            f: getattr(self, f) for f in self.TRACKED_FIELDS
+            if getattr(self, f) != self._saved.get(f)
+        }
+    
+    def is_dirty(self) -> bool:
+        """Есть ли несохранённые изменения"""
+        return bool(self.get_changes())
+
+
+class Animal(TrackedModel):
     """Модель животного"""
     
+    TRACKED_FIELDS = ('name', 'species', 'birth_date', 'age_estimated',
+                      'arrival_date', 'cage_number', 'quarantine_until')
+    
     def __init__(self, data: Dict[str, Any]):
         self.id = data.get('id')
         self.name = data.get('name', '')
@@ -24,6 +56,7 @@ class Animal:
         self.adoption_date = data.get('adoption_date')
         self.owner_name = data.get('owner_name')
         self.owner_contact = data.get('owner_contact')
+        self.mark_clean()
     
     @classmethod
     def from_db_row(cls, row):
@@ -73,10 +106,11 @@ class Animal:
             raise ValueError(error_msg)
         
         if self.id:
-            # Обновление существующего
-            for field in ['name', 'species', 'birth_date', 'arrival_date', 
-                         'cage_number', 'quarantine_until']:
-                database.update_animal_field(self.id, field, getattr(self, field))
+            # Обновление существующего: один UPDATE только по изменённым полям
+            changes = self.get_changes()
+            if changes:
+                database.update_animal_fields(self.id, changes)
+                self.mark_clean()
             return self.id
         else:
             # Создание нового
@@ -85,6 +119,7 @@ class Animal:
                 self.arrival_date, self.cage_number, self.quarantine_until
             )
             self.id = new_id
+            self.mark_clean()
             return new_id
     
     def delete(self):
@@ -128,9 +163,11 @@ class Animal:
                 self.quarantine_until and not self.adopted and not self.deleted)
 
 
-class Event:
+class Event(TrackedModel):
     """Модель события"""
     
+    TRACKED_FIELDS = ('type', 'date_start', 'date_end', 'conclusion', 'results')
+    
     def __init__(self, data: Dict[str, Any]):
         self.id = data.get('id')
         self.animal_id = data.get('animal_id')
@@ -140,6 +177,7 @@ class Event:
         self.conclusion = data.get('conclusion')
         self.results = data.get('results')
         self.deleted = data.get('deleted', 0)
+        self.mark_clean()
     
     @classmethod
     def from_db_row(cls, row):
@@ -181,9 +219,13 @@ class Event:
             raise ValueError(error_msg)
         
         if self.id:
-            # Обновление существующего
-            for field in ['type', 'date_start', 'date_end', 'conclusion', 'results']:
-                database.update_event_field(self.id, field, getattr(self, field))
+            # Обновление существующего: один UPDATE только по изменённым полям
+            changes = self.get_changes()
+            if isinstance(changes.get('results'), dict):
+                changes['results'] = json.dumps(changes['results'], ensure_ascii=False)
+            if changes:
+                database.update_event_fields(self.id, changes)
+                self.mark_clean()
             return self.id
         else:
             # Создание нового
@@ -192,6 +234,7 @@ class Event:
                 self.date_end, self.conclusion, self.results
             )
             self.id = new_id
+            self.mark_clean()
             return new_id
     
     def delete(self):
@@ -207,53 +250,108 @@ class Event:
         return f"{self.date_start} — {self.date_end}"
 
 
+# Кэш чтения менеджеров. Ключи:
+#   ('animal', id)        — строка get_animal_by_id
+#   ('active',)           — строки get_all_animals
+#   ('cages',)            — get_all_cage_numbers
+#   ('events', animal_id) — get_animal_events
+#   ('timeline', animal_id) — get_event_summaries
+read_cache = LRUCache()
+
+
+def _cached(key, loader):
+    """Чтение через кэш; внутри транзакции — мимо него (видны незакоммиченные изменения)"""
+    if database.in_transaction():
+        return loader()
+    return read_cache.get_or_load(key, loader)
+
+
+def _invalidate(changes):
+    """Подписчик шины изменений: сбрасывает ровно те записи, которые затронула запись в БД"""
+    for change in changes:
+        if change.topic in ANIMAL_TOPICS:
+            read_cache.invalidate(('animal', change.id), ('active',), ('cages',))
+        elif change.topic in EVENT_TOPICS:
+            read_cache.invalidate(('events', change.animal_id), ('timeline', change.animal_id))
+        elif change.topic == DOCUMENTS_CHANGED:
+            # сверка папки могла дописать хеши документам событий этого животного
+            read_cache.invalidate(('events', change.animal_id), ('timeline', change.animal_id))
+        else:
+            read_cache.clear()
+
+
+bus.subscribe(_invalidate)
+
+
+def cache_stats() -> dict:
+    """Счётчики кэша чтения (попадания, промахи, вытеснения)"""
+    return read_cache.stats()
+
+
 class AnimalManager:
     """Менеджер для работы с животными"""
     
     @staticmethod
     def get_all_active() -> list[Animal]:
         """Возвращает всех активных (не удаленных и не усыновленных) животных"""
-        rows = database.get_all_animals()
+        rows = _cached(('active',), database.get_all_animals)
         return [Animal.from_db_row(row) for row in rows]
     
     @staticmethod
     def get_all_adopted() -> list[Animal]:
         """Возвращает всех усыновленных животных"""
         rows = database.get_all_adoptions()
-        animals = []
-        for row in rows:
-            # Формат из get_all_adoptions: (id, name, species, birth_date, age_estimated,
-            #                               arrival_date, adoption_date, owner_name, owner_contact)
-            animal_data = {
-                'id': row[0],
-                'name': row[1],
-                'species': row[2],
-                'birth_date': row[3],
-                'age_estimated': row[4],
-                'arrival_date': row[5],
-                'adoption_date': row[6],
-                'owner_name': row[7],
-                'owner_contact': row[8],
-                'adopted': 1
-            }
-            animals.append(Animal(animal_data))
-        return animals
+        return [AnimalManager.adopted_from_row(row) for row in rows]
+    
+    @staticmethod
+    def get_adopted_page(after=None, sort: str = 'id') -> tuple[list[Animal], Any]:
+        """Страница усыновленных животных: (животные, ключ следующей страницы)"""
+        rows, next_after = database.get_adoptions_page(after, sort=sort)
+        return [AnimalManager.adopted_from_row(row) for row in rows], next_after
+    
+    @staticmethod
+    def adopted_from_row(row) -> Animal:
+        """Создает Animal из строки get_all_adoptions / get_adoptions_page"""
+        # Формат: (id, name, species, birth_date, age_estimated,
+        #          arrival_date, adoption_date, owner_name, owner_contact)
+        animal_data = {
+            'id': row[0],
+            'name': row[1],
+            'species': row[2],
+            'birth_date': row[3],
+            'age_estimated': row[4],
+            'arrival_date': row[5],
+            'adoption_date': row[6],
+            'owner_name': row[7],
+            'owner_contact': row[8],
+            'adopted': 1
+        }
+        return Animal(animal_data)
     
     @staticmethod
     def get_by_id(animal_id: int) -> Optional[Animal]:
         """Возвращает животное по ID"""
-        row = database.get_animal_by_id(animal_id)
-        return Animal.from_db_row(row)
+        return Animal.from_db_row(AnimalManager.get_row(animal_id))
+    
+    @staticmethod
+    def get_row(animal_id: int):
+        """Строка get_animal_by_id через кэш (None — нет среди активных)"""
+        return _cached(('animal', animal_id), lambda: database.get_animal_by_id(animal_id))
     
     @staticmethod
     def get_all_cage_numbers() -> list[str]:
         """Возвращает список всех занятых номеров клеток"""
-        return database.get_all_cage_numbers()
+        return list(_cached(('cages',), database.get_all_cage_numbers))
     
     @staticmethod
     def get_animals_for_medical() -> list[tuple[int, str]]:
         """Возвращает список (ID, имя) для медицинского раздела"""
         return database.get_all_animals_ids()
+    
+    @staticmethod
+    def save_all(animals: list[Animal]) -> list[int]:
+        """Сохраняет список животных в одной транзакции"""
+        return _save_batch(animals)
 
 
 class EventManager:
@@ -262,7 +360,19 @@ class EventManager:
     @staticmethod
     def get_animal_events(animal_id: int) -> list:
         """Возвращает события животного"""
-        return database.get_animal_events(animal_id)
+        events = _cached(('events', animal_id), lambda: database.get_animal_events(animal_id))
+        # списки документов изменяемые — отдаём копии
+        return [(*event[:4], list(event[4]), *event[5:]) for event in events]
+    
+    @staticmethod
+    def get_event_summaries(animal_id: int) -> list:
+        """Лёгкий список событий для ленты медкарты (см. database.get_event_summaries)"""
+        return list(_cached(('timeline', animal_id), lambda: database.get_event_summaries(animal_id)))
+    
+    @staticmethod
+    def get_event_details(event_ids) -> dict:
+        """{event_id: (документы, results)} для раскрытых в ленте событий"""
+        return database.get_event_details(event_ids)
     
     @staticmethod
     def add_event_document(event_id: int, filename: str):
@@ -278,3 +388,31 @@ class EventManager:
     def get_event_documents(event_id: int) -> list[str]:
         """Возвращает список документов события"""
         return database.get_event_docs(event_id)
+    
+    @staticmethod
+    def save_all(events: list[Event]) -> list[int]:
+        """Сохраняет список событий в одной транзакции"""
+        return _save_batch(events)
+
+
+def _save_batch(models: list) -> list[int]:
+    """
+    save() для всех моделей в одной транзакции. Сначала проверяются все
+    модели — ошибка валидации не начинает запись. Если транзакция
+    откатилась, id и снимки моделей возвращаются к прежним: модели снова
+    «грязные», и повторный save_all запишет их правки.
+    """
+    for model in models:
+        is_valid, error_msg = model.validate()
+        if not is_valid:
+            raise ValueError(error_msg)
+    
+    states = [(model.id, model._saved) for model in models]
+    try:
+        with database.transaction():
+            return [model.save() for model in models]
+    except BaseException:
+        for model, (model_id, saved) in zip(models, states):
+            model.id = model_id
+            model._saved = saved
+        raise
@@ -0,0 +1,340 @@
+"""
+Миниатюры документов (снимки, УЗИ, первая страница PDF)
+
+Миниатюра строится в пуле процессов и хранится на диске в
+docs/.previews/<hash[:2]>/<hash>-<mtime_ns>-<размер>.png: ключ — содержимое
+файла (SHA-256 из индекса документов) и его mtime, так что одинаковые
+справки у разных животных рисуются один раз, а изменённый файл — заново.
+Кэш ограничен по объёму; при переполнении удаляются миниатюры, которые
+дольше всех не показывались (время доступа — mtime файла миниатюры).
+
+Чем рисовать:
+  * Pillow, если установлен, — изображения;
+  * pdftoppm (poppler) — первая страница PDF;
+  * ImageMagick (magick/convert) — изображения и PDF, если нет остального.
+Если ничего из этого нет, карточка показывает вместо миниатюры тип файла.
+
+Запуск без интерфейса:
+    python previews.py build    # построить миниатюры всех документов
+    python previews.py trim     # ужать кэш до PREVIEW_CACHE_BYTES
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import database
+from documents import DOCS_ROOT
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow необязателен
+    Image = None
+
+PREVIEWS_NAME = ".previews"
+
+# Сторона миниатюры в пикселях
+THUMB_SIZE = 128
+
+# Предел кэша миниатюр на диске
+PREVIEW_CACHE_BYTES = 64 << 20
+
+# Сколько ждать внешнюю программу
+TOOL_TIMEOUT = 30
+
+IMAGE_EXTS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tif', '.tiff', '.webp'}
+PDF_EXTS = {'.pdf'}
+
+
+def previews_dir(docs_root: str = DOCS_ROOT) -> str:
+    return os.path.join(docs_root, PREVIEWS_NAME)
+
+
+def find_tools() -> dict:
+    """
+    Чем можно рисовать: {'pillow': bool, 'pdftoppm': путь|None, 'magick': путь|None}.
+    Поиск по PATH — раз на PreviewRenderer, а не на каждую миниатюру.
+    """
+    return {
+        'pillow': Image is not None,
+        'pdftoppm': shutil.which("pdftoppm"),
+        # ImageMagick 7 — magick, 6 — convert
+        'magick': shutil.which("magick") or (shutil.which("convert") if os.name != 'nt' else None),
+    }
+
+
+def is_previewable(filename: str) -> bool:
+    """Миниатюры бывают у файлов такого типа (чем рисовать — не проверяется)"""
+    ext = os.path.splitext(filename)[1].lower()
+    return ext in IMAGE_EXTS or ext in PDF_EXTS
+
+
+def can_preview(filename: str, tools: dict = None) -> bool:
+    """Есть ли чем нарисовать миниатюру для такого файла"""
+    return bool(_renderers(os.path.splitext(filename)[1].lower(), tools or find_tools()))
+
+
+def _render_pillow(src: str, dest: str, size: int) -> bool:
+    with Image.open(src) as img:
+        img.thumbnail((size, size))
+        if img.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+            img = img.convert("RGBA")
+        img.save(dest, "PNG")
+    return True
+
+
+def _render_pdftoppm(src: str, dest: str, size: int) -> bool:
+    # pdftoppm сам добавляет .png к имени без расширения
+    stem = os.path.splitext(dest)[0]
+    subprocess.run(["pdftoppm", "-png", "-f", "1", "-l", "1", "-singlefile",
+                    "-scale-to", str(size), src, stem],
+                   check=True, capture_output=True, timeout=TOOL_TIMEOUT)
+    if stem + ".png" != dest:
+        os.replace(stem + ".png", dest)
+    return True
+
+
+def _render_magick(src: str, dest: str, size: int, magick: str) -> bool:
+    subprocess.run([magick, f"{src}[0]", "-thumbnail", f"{size}x{size}", f"png:{dest}"],
+                   check=True, capture_output=True, timeout=TOOL_TIMEOUT)
+    return True
+
+
+def _renderers(ext: str, tools: dict) -> list:
+    """Способы нарисовать файл с расширением ext, от предпочтительного"""
+    methods = []
+    if ext in IMAGE_EXTS and tools['pillow']:
+        methods.append(_render_pillow)
+    if ext in PDF_EXTS and tools['pdftoppm']:
+        methods.append(_render_pdftoppm)
+    if (ext in IMAGE_EXTS or ext in PDF_EXTS) and tools['magick']:
+        methods.append(lambda src, dest, size: _render_magick(src, dest, size, tools['magick']))
+    return methods
+
+
+def render_preview(src: str, dest: str, size: int = THUMB_SIZE, tools: dict = None):
+    """
+    Рисует миниатюру src в dest (PNG). Возвращает dest или None, если
+    нарисовать нечем или файл не читается. Вызывается в процессе пула.
+    """
+    ext = os.path.splitext(src)[1].lower()
+    methods = _renderers(ext, tools or find_tools())
+    if not methods:
+        return None
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    # временное имя — в той же папке, чтобы os.replace был атомарным
+    tmp = os.path.join(os.path.dirname(dest), f".{os.path.basename(dest)}.{os.getpid()}.png")
+    for method in methods:
+        try:
+            if method(src, tmp, size):
+                os.replace(tmp, dest)
+                return dest
+        except (OSError, ValueError, subprocess.SubprocessError):
+            continue  # файл битый или программа не справилась — пробуем следующую
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    return None
+
+
+def preview_task(src: str, dest: str, size: int, tools: dict):
+    """
+    Заявка в процессе пула: готовая миниатюра отмечается показанной (LRU),
+    иначе рисуется. Возвращает (путь или None, нарисована ли заново).
+    """
+    try:
+        os.utime(dest)
+        return dest, False
+    except FileNotFoundError:
+        pass
+    return render_preview(src, dest, size, tools), True
+
+
+class PreviewCache:
+    """
+    Кэш миниатюр на диске с вытеснением давно не показанных (LRU).
+    Показ миниатюры (lookup) обновляет её mtime; trim удаляет самые старые.
+    """
+
+    def __init__(self, docs_root: str = DOCS_ROOT, max_bytes: int = PREVIEW_CACHE_BYTES,
+                 size: int = THUMB_SIZE):
+        self.root = previews_dir(docs_root)
+        self.max_bytes = max_bytes
+        self.size = size
+
+    def path_for(self, digest: str, mtime_ns: int) -> str:
+        """Где лежит (или будет лежать) миниатюра файла с таким содержимым и mtime"""
+        return os.path.join(self.root, digest[:2], f"{digest}-{mtime_ns}-{self.size}.png")
+
+    def lookup(self, digest: str, mtime_ns: int):
+        """Путь готовой миниатюры или None; попадание отмечается для LRU"""
+        path = self.path_for(digest, mtime_ns)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def entries(self) -> list:
+        """[(mtime_ns, size, путь)] всех миниатюр"""
+        result = []
+        if not os.path.isdir(self.root):
+            return result
+        with os.scandir(self.root) as shards:
+            for shard in shards:
+                if not shard.is_dir():
+                    continue
+                with os.scandir(shard.path) as files:
+                    for entry in files:
+                        if entry.is_file() and not entry.name.startswith("."):
+                            st = entry.stat()
+                            result.append((st.st_mtime_ns, st.st_size, entry.path))
+        return result
+
+    def trim(self) -> int:
+        """Удаляет давно не показанные миниатюры сверх max_bytes; возвращает их число"""
+        entries = sorted(self.entries())
+        total = sum(size for _mtime, size, _path in entries)
+        removed = 0
+        for _mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+
+def _resolved(value) -> Future:
+    """Уже завершённый Future со значением value"""
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+class PreviewRenderer:
+    """
+    Пул процессов для рисования миниатюр (spawn: процесс с Tk и потоками
+    безопаснее не форкать). Пул создаётся при первой заявке; одинаковые
+    заявки, пока рисуются, объединяются в один Future.
+
+    request() вызывается из потока Tk при прокрутке и не трогает диск:
+    проверка кэша, отметка показа и рисование — в процессе пула, а
+    доступные программы ищутся один раз при создании.
+    """
+
+    # После скольких новых миниатюр проверять размер кэша
+    TRIM_EVERY = 32
+
+    def __init__(self, cache: PreviewCache = None, workers: int = None):
+        self.cache = cache or PreviewCache()
+        self.workers = workers
+        self.pool = None
+        self.lock = threading.Lock()
+        self.pending = {}    # путь миниатюры -> Future
+        self.failed = set()  # миниатюры, которые нарисовать не удалось
+        self.rendered = 0
+        self.tools = find_tools()
+
+    def _pool(self):
+        if self.pool is None:
+            context = multiprocessing.get_context("spawn")
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        return self.pool
+
+    def request(self, src: str, digest: str, mtime_ns: int):
+        """
+        Future с путём миниатюры (или None, если нарисовать нельзя).
+        Файл, у которого миниатюр не бывает, — уже завершённый Future.
+        """
+        if not is_previewable(src):
+            return _resolved(None)
+        dest = self.cache.path_for(digest, mtime_ns)
+        with self.lock:
+            if dest in self.failed:
+                return _resolved(None)
+            future = self.pending.get(dest)
+            if future is not None:
+                return future
+            future = Future()
+            self.pending[dest] = future
+        try:
+            task = self._pool().submit(preview_task, src, dest, self.cache.size, self.tools)
+        except (BrokenProcessPool, OSError) as e:
+            # пул не запустился (например, в собранном exe). Рисовать здесь
+            # нельзя — request зовут из потока Tk, — поэтому без миниатюры;
+            # следующая заявка попробует поднять пул заново
+            print(f"Ошибка пула миниатюр: {e}", file=sys.stderr)
+            if self.pool is not None:
+                self.pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = None
+            task = _resolved((None, False))
+        task.add_done_callback(lambda f, dest=dest: self._done(dest, f))
+        return future
+
+    def _done(self, dest: str, task):
+        """(В потоке пула) заявка выполнена: результат — в Future, выданный request"""
+        with self.lock:
+            future = self.pending.pop(dest, None)
+            if task.cancelled() or task.exception() is not None:
+                path, rendered = None, False
+            else:
+                path, rendered = task.result()
+            if path is None:
+                self.failed.add(dest)  # не рисуем повторно при каждой прокрутке
+            elif rendered:
+                self.rendered += 1
+            trim = rendered and path is not None and self.rendered % self.TRIM_EVERY == 0
+        if future is not None:
+            future.set_result(path)
+        if trim:
+            self.cache.trim()
+
+    def shutdown(self):
+        """Останавливает пул; недорисованные миниатюры не ждём"""
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+
+def build_all(docs_root: str = DOCS_ROOT, workers: int = None) -> int:
+    """Миниатюры для всех проиндексированных документов; возвращает число новых"""
+    renderer = PreviewRenderer(PreviewCache(docs_root), workers)
+    futures = []
+    for animal_id, filename, _size, mtime_ns, digest in database.iter_documents():
+        if digest and can_preview(filename, renderer.tools) \
+                and renderer.cache.lookup(digest, mtime_ns) is None:
+            src = os.path.join(docs_root, str(animal_id), filename)
+            futures.append(renderer.request(src, digest, mtime_ns))
+    built = sum(1 for future in futures
+                if future.exception() is None and future.result() is not None)
+    renderer.shutdown()
+    renderer.cache.trim()
+    return built
+
+
+def main(argv=None) -> int:
+    """Точка входа командной строки"""
+    parser = argparse.ArgumentParser(description="Миниатюры документов ShelterApp")
+    parser.add_argument("command", choices=("build", "trim"))
+    parser.add_argument("--root", default=DOCS_ROOT, help="папка документов")
+    args = parser.parse_args(argv)
+
+    database.init_db()
+    if args.command == "build":
+        print(f"Построено миниатюр: {build_all(args.root)}")
+    else:
+        print(f"Удалено миниатюр: {PreviewCache(args.root).trim()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
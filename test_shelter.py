@@ -2,9 +2,35 @@ import unittest
 import sqlite3
 import os
 import tempfile
+import shutil
 from datetime import date
+import csv
+import threading
+import time
+import tkinter
+import subprocess
+import sys
+import io
+import contextlib
+from concurrent.futures.process import BrokenProcessPool
 import database as db
+import importer
+import exporter
+import backup
+import documents
+import docstore
+import ingest
+import previews
 import json
+import changes
+import models
+from models import Animal, AnimalManager, Event, EventManager
+from ui.db_executor import DBExecutor
+from ui.text_metrics import ColumnAutofit, TextMeasurer
+from ui.animation import AnimationClock
+from ui.tooltip import TooltipManager
+from ui.startup import StartupTimer
+from ui.dialogs import EventDialog
 
 class TestShelterDB(unittest.TestCase):
     def setUp(self):
@@ -32,6 +58,7 @@ class TestShelterDB(unittest.TestCase):
 
     def tearDown(self):
         """Удаление временной БД."""
+        db.close_connection()
         os.close(self.db_fd)
         os.unlink(self.db_path)
 
@@ -225,5 +252,939 @@ class TestShelterDB(unittest.TestCase):
         ids = db.get_all_animals_ids()
         self.assertEqual(ids, [])
 
+    def test_connection_is_reused(self):
+        """Соединение потока открывается один раз и работает в режиме WAL."""
+        conn = db.get_connection()
+        db.add_animal("Reuse", "Dog", None, 0, "2023-01-01", None, None)
+        self.assertIs(db.get_connection(), conn)
+        mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, "wal")
+
+    def test_transaction_rollback(self):
+        """Ошибка внутри transaction() откатывает все изменения блока."""
+        with self.assertRaises(RuntimeError):
+            with db.transaction() as cur:
+                cur.execute("UPDATE animals SET name = 'Changed' WHERE id = ?",
+                            (self.animal_id,))
+                raise RuntimeError("boom")
+        self.assertEqual(db.get_animal_by_id(self.animal_id)[1], "TestAnimal")
+
+    def test_nested_transaction_savepoint(self):
+        """Откат вложенного блока не затрагивает внешнюю транзакцию."""
+        with db.transaction() as cur:
+            cur.execute("UPDATE animals SET name = 'Outer' WHERE id = ?",
+                        (self.animal_id,))
+            try:
+                with db.transaction() as inner:
+                    inner.execute("UPDATE animals SET name = 'Inner' WHERE id = ?",
+                                  (self.animal_id2,))
+                    raise RuntimeError("inner")
+            except RuntimeError:
+                pass
+        self.assertEqual(db.get_animal_by_id(self.animal_id)[1], "Outer")
+        self.assertEqual(db.get_animal_by_id(self.animal_id2)[1], "TestAnimal2")
+
+    def test_get_animal_events_groups_docs(self):
+        """Несколько документов события собираются в один список, порядок по дате."""
+        db.add_event_doc(self.event_id, "b.txt")
+        db.add_event_doc(self.event_id, "a.txt")
+        early_id = db.add_event(self.animal_id, "checkup", "2022-06-01")
+        events = db.get_animal_events(self.animal_id)
+        self.assertEqual([e[6] for e in events], [early_id, self.event_id])
+        self.assertEqual(events[0][4], [])
+        docs_dir = f"docs/{self.animal_id}"
+        self.assertEqual(events[1][4], [os.path.normpath(f"{docs_dir}/a.txt"),
+                                        os.path.normpath(f"{docs_dir}/b.txt")])
+
+    def test_get_events_for_animals(self):
+        """Пакетная загрузка возвращает события каждого запрошенного животного."""
+        other_event = db.add_event(self.animal_id2, "checkup", "2023-03-01")
+        db.delete_event(db.add_event(self.animal_id2, "removed", "2023-04-01"))
+        events = db.get_events_for_animals([self.animal_id, self.animal_id2, 9999])
+        self.assertEqual([e[6] for e in events[self.animal_id]], [self.event_id])
+        self.assertEqual([e[6] for e in events[self.animal_id2]], [other_event])
+        self.assertEqual(events[9999], [])
+        self.assertEqual(events[self.animal_id], db.get_animal_events(self.animal_id))
+
+    def test_event_summaries_and_lazy_details(self):
+        """Лента медкарты: сводки без документов и результатов, детали — пачкой по ID."""
+        db.add_event_doc(self.event_id, "b.txt")
+        db.add_event_doc(self.event_id, "a.txt")
+        early_id = db.add_event(self.animal_id, "checkup", "2022-06-01")
+        db.delete_event(db.add_event(self.animal_id, "removed", "2023-04-01"))
+        self.assertEqual(db.get_event_summaries(self.animal_id), [
+            (early_id, "checkup", "2022-06-01", None, "", 0),
+            (self.event_id, "vaccination", "2023-01-01", "2023-01-02", "All good", 2),
+        ])
+        details = db.get_event_details([self.event_id, early_id, 9999])
+        full = {e[6]: e for e in db.get_animal_events(self.animal_id)}
+        self.assertEqual(details, {eid: (full[eid][4], full[eid][5]) for eid in full})
+
+        # сводки кэшируются и сбрасываются правкой события
+        self.assertEqual(len(EventManager.get_event_summaries(self.animal_id)), 2)
+        db.update_event_field(early_id, 'conclusion', "ok")
+        self.assertEqual(EventManager.get_event_summaries(self.animal_id)[0][4], "ok")
+
+    def test_migrations_applied_once(self):
+        """Версия схемы записана, повторный init_db ничего не меняет."""
+        self.assertEqual(db.get_schema_version(), db.SCHEMA_VERSION)
+        db.init_db()
+        self.assertEqual(db.get_schema_version(), db.SCHEMA_VERSION)
+        self.assertIsNotNone(db.get_animal_by_id(self.animal_id))
+
+    def test_migrate_legacy_schema(self):
+        """Старая БД без новых колонок и без user_version доводится до актуальной."""
+        db.close_connection()
+        conn = sqlite3.connect(db.DB_NAME)
+        conn.executescript('''
+            DROP TABLE animals; DROP TABLE events; DROP TABLE event_docs;
+            CREATE TABLE animals (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL, species TEXT, birth_date TEXT,
+                age_estimated INTEGER NOT NULL DEFAULT 0, arrival_date TEXT,
+                cage_number TEXT, quarantine_until TEXT);
+            CREATE TABLE events (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                animal_id INTEGER NOT NULL, type TEXT NOT NULL,
+                date_start TEXT NOT NULL, date_end TEXT, conclusion TEXT,
+                results TEXT);
+            PRAGMA user_version = 0;
+        ''')
+        conn.close()
+        db.init_db()
+        self.assertEqual(db.get_schema_version(), db.SCHEMA_VERSION)
+        new_id = db.add_animal("Legacy", "Cat", None, 0, "2023-01-01", "К0001", None)
+        db.add_adoption(new_id, "Owner", "contact", "2023-02-01")
+        self.assertTrue(any(a[0] == new_id for a in db.get_all_adoptions()))
+
+    def test_hot_queries_use_indexes(self):
+        """Горячие запросы списков идут по индексам, а не полным сканом."""
+        conn = db.get_connection()
+        queries = {
+            "idx_animals_active": (
+                "SELECT id, name FROM animals WHERE deleted = 0 AND adopted = 0", ()),
+            "idx_animals_active_cages": (
+                "SELECT cage_number FROM animals WHERE cage_number IS NOT NULL "
+                "AND deleted = 0 AND adopted = 0", ()),
+            "idx_events_animal_date": (
+                "SELECT id FROM events WHERE animal_id = ? AND deleted = 0 "
+                "ORDER BY date_start", (self.animal_id,)),
+        }
+        for index, (sql, params) in queries.items():
+            plan = " ".join(row[3] for row in conn.execute(
+                "EXPLAIN QUERY PLAN " + sql, params))
+            self.assertIn(index, plan)
+            self.assertNotIn("TEMP B-TREE", plan)
+
+        # полный список активных читается из индекса, без обращений к таблице
+        for sql in ("SELECT id, name FROM animals WHERE deleted = 0 AND adopted = 0",
+                    "SELECT id, name, species, birth_date, age_estimated, arrival_date, "
+                    "cage_number, quarantine_until FROM animals WHERE deleted = 0 AND adopted = 0"):
+            plan = " ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql))
+            self.assertIn("COVERING INDEX idx_animals_active", plan)
+        plan = " ".join(row[3] for row in conn.execute(
+            "EXPLAIN QUERY PLAN " + queries["idx_animals_active_cages"][0]))
+        self.assertIn("COVERING INDEX idx_animals_active_cages", plan)
+
+    def _count_updates(self, action, table="animals"):
+        """Выполняет action и возвращает список различных UPDATE таблицы table."""
+        statements = []
+        conn = db.get_connection()
+        conn.set_trace_callback(statements.append)
+        try:
+            action()
+        finally:
+            conn.set_trace_callback(None)
+        # трассировка повторяет исходный запрос для каждого шага триггеров
+        prefix = f"UPDATE {table.upper()} "
+        return sorted({s for s in statements if s.lstrip().upper().startswith(prefix)})
+
+    def test_animal_save_writes_only_dirty_fields(self):
+        """Animal.save() отправляет один UPDATE только по изменённым полям."""
+        animal = AnimalManager.get_by_id(self.animal_id2)
+        self.assertEqual(animal.get_changes(), {})
+        self.assertEqual(self._count_updates(animal.save), [])
+
+        animal.name = "Renamed"
+        animal.cage_number = "К0002"
+        self.assertEqual(animal.get_changes(), {"name": "Renamed", "cage_number": "К0002"})
+        updates = self._count_updates(animal.save)
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn("species", updates[0])
+        self.assertFalse(animal.is_dirty())
+        row = db.get_animal_by_id(self.animal_id2)
+        self.assertEqual((row[1], row[6]), ("Renamed", "К0002"))
+
+    def test_event_save_and_batch_save(self):
+        """Event.save() пишет изменённые поля; save_all сохраняет пачку разом."""
+        event = Event({"id": self.event_id, "animal_id": self.animal_id,
+                       "type": "vaccination", "date_start": "2023-01-01"})
+        event.conclusion = "Updated"
+        event.results = {"status": "done"}
+        other = Event({"animal_id": self.animal_id, "type": "checkup",
+                       "date_start": "2023-05-01"})
+        EventManager.save_all([event, other])
+        events = {e[6]: e for e in db.get_animal_events(self.animal_id)}
+        self.assertEqual(events[self.event_id][3], "Updated")
+        self.assertEqual(json.loads(events[self.event_id][5]), {"status": "done"})
+        self.assertIn(other.id, events)
+
+    def test_batch_save_rollback_keeps_models_dirty(self):
+        """Откат save_all: модели остаются несохранёнными, новые — без id; повтор сохраняет."""
+        animal = AnimalManager.get_by_id(self.animal_id)
+        animal.name = "Renamed"
+        animal.cage_number = "К0001"
+        first = Animal({"name": "Новый", "species": "Cat", "cage_number": "К0100"})
+        clash = Animal({"name": "Второй", "species": "Cat", "cage_number": "К0100"})
+        with self.assertRaises(ValueError):
+            AnimalManager.save_all([animal, first, clash])
+        self.assertTrue(animal.is_dirty())
+        self.assertIsNone(first.id)
+        self.assertEqual(db.get_animal_by_id(self.animal_id)[1], "TestAnimal")
+
+        AnimalManager.save_all([animal, first])
+        self.assertFalse(animal.is_dirty())
+        self.assertEqual(db.get_animal_by_id(self.animal_id)[1], "Renamed")
+        self.assertEqual(db.get_animal_by_id(first.id)[6], "К0100")
+
+    def test_event_dialog_saves_event_with_docs_atomically(self):
+        """Событие из диалога и его документы пишутся одной транзакцией."""
+        before = len(db.get_animal_events(self.animal_id))
+        with self.assertRaises(sqlite3.Error):
+            # второй документ не записывается — событие не должно остаться
+            EventDialog.save_event(self.animal_id, "Осмотр", "2023-06-01", None, None, None,
+                                   ["scan.pdf", object()])
+        self.assertEqual(len(db.get_animal_events(self.animal_id)), before)
+
+        event_id = EventDialog.save_event(self.animal_id, "Осмотр", "2023-06-01", None, None,
+                                          None, ["scan.pdf"])
+        self.assertEqual(db.get_event_docs(event_id), ["scan.pdf"])
+
+    def test_update_fields_rejects_unknown_column(self):
+        """Недопустимая колонка в update_*_fields вызывает ValueError."""
+        with self.assertRaises(ValueError):
+            db.update_animal_fields(self.animal_id, {"deleted": 1})
+        with self.assertRaises(ValueError):
+            db.update_event_fields(self.event_id, {"animal_id": 2})
+
+    def test_import_animals_csv(self):
+        """Импорт CSV: валидные строки вставлены, клетки выделены, ошибки в отчёте."""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, "intake.csv")
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write("name,species,breed,birth_date,age_months,arrival_date,cage_number\n"
+                    "Барсик,Cat,Siamese,2021-05-01,,2023-01-10,\n"
+                    ",Dog,,2020-01-01,,,\n"
+                    "Шарик,Dog,,,7,2023-01-10,\n"
+                    "Дубль,Dog,,2020-01-01,,,A1\n"
+                    "Рыжик,Cat,,,x,,\n")
+        docs_root = os.path.join(tmp_dir, "docs")
+        report = importer.import_animals(path, batch_size=2, docs_root=docs_root)
+
+        self.assertEqual(report.imported_count, 2)
+        self.assertEqual([line for line, _ in report.errors], [3, 5, 6])
+        barsik = db.get_animal_by_id(report.imported_ids[0])
+        sharik = db.get_animal_by_id(report.imported_ids[1])
+        self.assertEqual(barsik[2], "Cat / Siamese")
+        self.assertNotEqual(barsik[6], sharik[6])
+        self.assertTrue(barsik[6].startswith("К") and sharik[6].startswith("К"))
+        self.assertEqual(barsik[7], "2023-01-20")
+        self.assertEqual(sharik[4], 1)
+        for new_id in report.imported_ids:
+            self.assertTrue(os.path.isdir(os.path.join(docs_root, str(new_id))))
+
+    def test_import_animals_jsonl(self):
+        """Импорт JSONL с нечитаемой строкой."""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, "intake.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"name": "Мурка", "species": "Cat",
+                                "birth_date": "2022-02-02", "cage_number": "О0001"},
+                               ensure_ascii=False) + "\n")
+            f.write("{broken\n")
+        report = importer.import_animals(path, docs_root=os.path.join(tmp_dir, "docs"))
+        self.assertEqual(report.imported_count, 1)
+        self.assertEqual(report.errors, [(2, "Не удалось разобрать строку")])
+        self.assertIsNone(db.get_animal_by_id(report.imported_ids[0])[7])
+
+    def test_export_events_expands_results(self):
+        """Экспорт событий: поля results — отдельные колонки, прочее — results_other."""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        db.add_event(self.animal_id2, "Поступление", "2023-02-01",
+                     results={"Температура": 38.5, "Пульс": 120})
+        path = os.path.join(tmp_dir, "events.csv")
+        count = exporter.export_events(path, species="Cat")
+        self.assertEqual(count, 1)
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(rows[0]["animal_name"], "TestAnimal2")
+        self.assertEqual(rows[0]["Температура"], "38.5")
+        self.assertEqual(rows[0]["results_other"], "")
+
+        path = os.path.join(tmp_dir, "events.jsonl")
+        exporter.export_events(path, date_from="2023-01-01", date_to="2023-01-31")
+        with open(path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([r["event_id"] for r in records], [self.event_id])
+        self.assertEqual(json.loads(records[0]["results_other"]), {"status": "completed"})
+
+    def test_export_animals_status_filter(self):
+        """Фильтр статуса в экспорте животных и потоковое чтение пачками."""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        db.add_adoption(self.animal_id2, "Owner", "contact", "2023-03-01")
+        path = os.path.join(tmp_dir, "animals.csv")
+        self.assertEqual(exporter.export_animals(path, status="active"), 1)
+        self.assertEqual(exporter.export_adoptions(path), 1)
+        self.assertEqual(len(list(db.iter_animals(status="all"))), 2)
+        with self.assertRaises(ValueError):
+            list(db.iter_animals(status="unknown"))
+
+    def test_event_results_table_synced(self):
+        """Поля results раскладываются в event_results и ищутся SQL-запросом."""
+        hot = db.add_event(self.animal_id, "Поступление", "2023-05-10",
+                           results={"Температура": "39,8", "Осмотревший": "Иванова"})
+        db.add_event(self.animal_id2, "Поступление", "2023-05-12",
+                     results={"Температура": 38.4})
+        db.add_event(self.animal_id2, "Поступление", "2023-06-01",
+                     results={"Температура": 40.1})
+
+        found = db.find_events_by_result("Температура", ">", 39.5,
+                                         "2023-05-01", "2023-05-31")
+        self.assertEqual([(r[0], r[1]) for r in found], [(hot, self.animal_id)])
+        found = db.find_events_by_result("Осмотревший", "=", "Иванова")
+        self.assertEqual([r[0] for r in found], [hot])
+
+        db.update_event_result_field(hot, "Температура", 37.9)
+        self.assertEqual(db.find_events_by_result("Температура", ">", 39.5,
+                                                  "2023-05-01", "2023-05-31"), [])
+        values = db.get_event_result_values(hot)
+        self.assertEqual(values, {"Температура": "37.9", "Осмотревший": "Иванова"})
+
+        db.update_event_results(hot, "not json")
+        self.assertEqual(db.get_event_result_values(hot), {})
+        with self.assertRaises(ValueError):
+            db.find_events_by_result("Температура", "; DROP", 1)
+
+    def test_full_text_search(self):
+        """Поиск по имени, владельцу и заключению; индекс следит за изменениями."""
+        db.add_adoption(self.animal_id2, "Иванова Мария", "+7 900", "2023-02-01")
+        ev = db.add_event(self.animal_id, "Осмотр", "2023-03-01",
+                          conclusion="Подозрение на дерматит",
+                          results={"Окрас": "полосатый"})
+
+        hits = db.search("иванов")
+        self.assertEqual([(h[0], h[2], h[4]) for h in hits], [("animal", self.animal_id2, 1)])
+        hits = db.search("дерматит")
+        self.assertEqual([(h[0], h[1], h[2]) for h in hits], [("event", ev, self.animal_id)])
+        self.assertEqual([h[1] for h in db.search("полосат")], [ev])
+
+        db.update_event_field(ev, "conclusion", "Здоров")
+        self.assertEqual(db.search("дерматит"), [])
+        db.delete_event(ev)
+        self.assertEqual(db.search("полосат"), [])
+        db.update_animal_field(self.animal_id, "name", "Ёжик")
+        self.assertEqual([h[2] for h in db.search("ежик")], [self.animal_id])
+        db.delete_animal(self.animal_id)
+        self.assertEqual(db.search("ежик"), [])
+        self.assertEqual(db.search("  \"*( "), [])
+
+    def test_keyset_pages(self):
+        """Страницы по индексу проходят все строки без повторов, в том числе с NULL в ключе."""
+        db.add_animals([(f"Зверь{i}", "Кот", "2020-01-01", 0, "2023-01-01",
+                         f"П{i}", "2023-02-01" if i % 2 else None) for i in range(7)])
+        expected = [row[0] for row in db.get_all_animals()]
+
+        for sort in ("id", "quarantine_until", "name"):
+            seen, after = [], None
+            while True:
+                rows, after = db.get_animals_page(after, limit=3, sort=sort)
+                seen += [row[0] for row in rows]
+                if after is None:
+                    break
+            self.assertEqual(sorted(seen), sorted(expected), sort)
+            self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(db.count_animals(), len(expected))
+
+        db.add_adoption(self.animal_id2, "Иванова", "+7", "2023-02-01")
+        rows, after = db.get_adoptions_page(sort="owner_name")
+        self.assertEqual([row[0] for row in rows], [self.animal_id2])
+        self.assertIsNone(after)
+        self.assertEqual(db.count_adoptions(), 1)
+        with self.assertRaises(ValueError):
+            db.get_animals_page(sort="name; DROP TABLE animals")
+
+    def test_keyset_pages_sorted_by_index(self):
+        """Страница любой сортировки читается по индексу: без TEMP B-TREE и с поиском начала."""
+        conn = db.get_connection()
+        pages = [(db.get_animals_page, sort) for sort in db.ANIMAL_SORT_COLUMNS]
+        pages += [(db.get_adoptions_page, sort) for sort in db.ADOPTION_SORT_COLUMNS]
+        for fetch, sort in pages:
+            for after in (None, ("x", 1)):
+                statements = []
+                conn.set_trace_callback(statements.append)
+                try:
+                    fetch(after, limit=3, sort=sort)
+                finally:
+                    conn.set_trace_callback(None)
+                plan = " ".join(row[3] for row in conn.execute(
+                    "EXPLAIN QUERY PLAN " + statements[-1]))
+                self.assertNotIn("TEMP B-TREE", plan, sort)
+                self.assertIn("INDEX", plan, sort)
+                if after is not None:
+                    self.assertIn("SEARCH", plan, sort)
+
+    def test_read_cache_invalidated_by_writes(self):
+        """Повторное чтение берётся из кэша; запись сбрасывает только свои записи."""
+        models.read_cache.clear()
+        models.read_cache.reset_stats()
+
+        self.assertEqual(AnimalManager.get_by_id(self.animal_id).name, "TestAnimal")
+        AnimalManager.get_by_id(self.animal_id)
+        AnimalManager.get_by_id(self.animal_id2)
+        self.assertEqual(len(EventManager.get_animal_events(self.animal_id)), 1)
+        EventManager.get_animal_events(self.animal_id)
+        stats = models.cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 3))
+
+        db.update_animal_field(self.animal_id, "name", "Renamed")
+        self.assertEqual(AnimalManager.get_by_id(self.animal_id).name, "Renamed")
+        AnimalManager.get_by_id(self.animal_id2)  # чужая запись осталась в кэше
+        self.assertEqual(models.cache_stats()['hits'], 3)
+
+        db.update_event_field(self.event_id, "conclusion", "Updated")
+        self.assertEqual(EventManager.get_animal_events(self.animal_id)[0][3], "Updated")
+        db.add_event(self.animal_id, "Осмотр", "2023-05-01")
+        self.assertEqual(len(EventManager.get_animal_events(self.animal_id)), 2)
+
+        # откат не сбрасывает кэш, а чтение внутри транзакции идёт мимо него
+        misses = models.cache_stats()['misses']
+        with self.assertRaises(RuntimeError):
+            with db.transaction():
+                db.update_animal_field(self.animal_id, "name", "Temp")
+                self.assertEqual(AnimalManager.get_by_id(self.animal_id).name, "Temp")
+                raise RuntimeError
+        self.assertEqual(AnimalManager.get_by_id(self.animal_id).name, "Renamed")
+        self.assertEqual(models.cache_stats()['misses'], misses)
+
+        AnimalManager.get_all_cage_numbers().append("X")
+        self.assertEqual(sorted(AnimalManager.get_all_cage_numbers()), ["A1"])
+
+        # изменение документов сбрасывает только события этого животного
+        EventManager.get_animal_events(self.animal_id)
+        AnimalManager.get_by_id(self.animal_id)
+        misses = models.cache_stats()['misses']
+        db.add_documents(self.animal_id, [("scan.pdf", 1, 1, 1, "ab" * 32, "application/pdf")])
+        AnimalManager.get_by_id(self.animal_id)
+        self.assertEqual(models.cache_stats()['misses'], misses)
+        EventManager.get_animal_events(self.animal_id)
+        self.assertEqual(models.cache_stats()['misses'], misses + 1)
+
+    def test_change_bus_publishes_after_commit(self):
+        """Изменения приходят подписчику одной пачкой после COMMIT и не приходят при откате."""
+        received = []
+        changes.bus.subscribe(received.append)
+        self.addCleanup(changes.bus.unsubscribe, received.append)
+
+        with db.transaction():
+            db.update_animal_fields(self.animal_id, {"name": "Барсик", "cage_number": "К0001"})
+            db.update_animal_field(self.animal_id, "name", "Барсик")
+            db.update_animal_field(self.animal_id, "name", "Барсик")
+            self.assertEqual(received, [])
+        self.assertEqual(received, [[
+            changes.Change(changes.ANIMAL_UPDATED, self.animal_id, fields=("name", "cage_number")),
+            changes.Change(changes.ANIMAL_UPDATED, self.animal_id, fields=("name",)),
+        ]])
+
+        received.clear()
+        with self.assertRaises(RuntimeError):
+            with db.transaction():
+                db.delete_animal(self.animal_id)
+                raise RuntimeError
+        self.assertEqual(received, [])
+
+        # откат вложенного блока выбрасывает и его изменения, внешний COMMIT их не публикует
+        with db.transaction():
+            db.update_animal_field(self.animal_id2, "name", "Kept")
+            with self.assertRaises(RuntimeError):
+                with db.transaction():
+                    db.delete_animal(self.animal_id)
+                    raise RuntimeError
+        self.assertEqual(received, [[
+            changes.Change(changes.ANIMAL_UPDATED, self.animal_id2, fields=("name",))]])
+        self.assertIsNotNone(db.get_animal_by_id(self.animal_id))
+        received.clear()
+
+        db.add_event_doc(self.event_id, "scan.pdf")
+        db.add_adoption(self.animal_id2, "Иванова", "+7", "2023-02-01")
+        db.add_adoption(self.animal_id2, "Иванова", "+7", "2023-02-01")  # уже передан
+        self.assertEqual(received, [
+            [changes.Change(changes.EVENT_UPDATED, self.event_id, self.animal_id, ("docs",))],
+            [changes.Change(changes.ANIMAL_ADOPTED, self.animal_id2)],
+        ])
+
+    def test_db_executor_delivers_and_cancels(self):
+        """Результаты приходят в поток Tk через очередь; отменённая группа молчит."""
+        root = tkinter.Tcl()  # цикл событий Tcl без окна
+        executor = DBExecutor(root)
+        self.addCleanup(executor.shutdown)
+        done, errors = [], []
+
+        def run_until(predicate):
+            deadline = time.monotonic() + 5
+            while not predicate() and time.monotonic() < deadline:
+                root.update()
+                time.sleep(0.005)
+
+        executor.submit(db.get_animal_by_id, self.animal_id, on_done=done.append)
+        executor.submit(db.update_animal_field, self.animal_id, "bogus; --", 1,
+                        on_error=errors.append)
+        cancelled = executor.submit(db.get_all_animals, on_done=done.append, group="card")
+        executor.cancel("card")
+        marker = executor.submit(lambda: "last", on_done=done.append)
+        run_until(marker.done)
+        run_until(lambda: "last" in done)
+
+        self.assertEqual(done[0][1], "TestAnimal")
+        self.assertEqual(done[1:], ["last"])
+        self.assertIsInstance(errors[0], sqlite3.OperationalError)
+        self.assertTrue(cancelled.cancelled() or cancelled.done())
+        self.assertFalse(executor.is_busy("card"))
+        # всё доставлено — таймер разбора очереди больше не взводится
+        run_until(lambda: executor.poller.job is None)
+        self.assertEqual(executor.poller.outstanding, 0)
+        self.assertIsNone(executor.poller.job)
+
+        # второй исполнитель с тем же poller — тот же таймер
+        other = DBExecutor(root, poller=executor.poller)
+        self.addCleanup(other.shutdown)
+        other.submit(lambda: "other", on_done=done.append)
+        job = executor.poller.job
+        executor.submit(lambda: "again", on_done=done.append)
+        self.assertIs(executor.poller.job, job)
+        run_until(lambda: executor.poller.job is None)
+        self.assertEqual(sorted(done[2:]), ["again", "other"])
+
+    def test_cage_registry_allocates_and_releases(self):
+        """Реестр клеток: первая свободная, освобождение при передаче и удалении, запрет дублей."""
+        self.assertEqual(db.next_free_cage("К"), "К0000")
+        first = db.add_animal("Первый", "Cat", "2021-01-01", 0, "2023-01-01", "К0000", None)
+        db.add_animal("Дальний", "Cat", "2021-01-01", 0, "2023-01-01", "К0003", None)
+        # пропущенные номера до К0003 стали свободными
+        self.assertEqual(db.allocate_cages("К", 3), ["К0001", "К0002", "К0004"])
+        self.assertEqual(db.allocate_cages("К", 2, exclude={"К0001"}), ["К0002", "К0004"])
+        self.assertEqual(db.next_free_cage("О"), "О0000")
+
+        with self.assertRaises(ValueError):
+            db.add_animal("Дубль", "Cat", "2021-01-01", 0, "2023-01-01", "К0000", None)
+        with self.assertRaises(ValueError):
+            db.update_animal_field(self.animal_id2, "cage_number", "К0003")
+        self.assertFalse(db.is_cage_free("К0000"))
+        self.assertTrue(db.is_cage_free("К0000", animal_id=first))
+
+        db.add_adoption(first, "Иванова", "+7", "2023-02-01")
+        self.assertEqual(db.next_free_cage("К"), "К0000")
+        db.update_animal_fields(self.animal_id2, {"cage_number": "К0000"})
+        self.assertEqual(db.next_free_cage("К"), "К0001")
+        db.delete_animal(self.animal_id2)
+        self.assertTrue(db.is_cage_free("К0000"))
+        # кириллическая «С» в номере — та же клетка, что и латинская
+        db.add_animal("Кирилл", "Cat", "2021-01-01", 0, "2023-01-01", "К000С", None)
+        self.assertFalse(db.is_cage_free("К000C"))
+
+    def test_cage_stays_and_contacts(self):
+        """История клеток по переводам/карантину/передаче и поиск контактов через R*Tree."""
+        sick = db.add_animal("Больной", "Cat", "2021-01-01", 0, "2024-03-05", "О0005", None)
+        db.add_event(sick, "Карантин", "2024-03-05", date_end="2024-03-15",
+                     results={"Клетка_отсиживания": "К00A3", "Клетка_по_окончанию": "О0007"})
+        neighbour = db.add_animal("Сосед", "Cat", "2021-01-01", 0, "2024-03-10", "К00A4", None)
+        moved = db.add_animal("Переведённый", "Dog", "2021-01-01", 0, "2024-01-01", "К0001", None)
+        transfer = db.add_event(moved, "Перевод", "2024-03-12",
+                                results={"Клетка_из": "О0001", "Клетка_в": "К00A3"})
+        db.add_adoption(moved, "Петров", "+7 900", "2024-03-14")
+
+        # после карантина — О0007 по событию, но в карточке О0005: карточка важнее
+        self.assertEqual(db.get_cage_stays(sick), [
+            ("К00A3", "2024-03-05", "2024-03-15"),
+            ("О0005", "2024-03-15", None),
+        ])
+        self.assertEqual(db.get_cage_stays(moved), [
+            ("О0001", "2024-01-01", "2024-03-12"),
+            ("К00A3", "2024-03-12", "2024-03-14"),
+        ])
+
+        contacts = db.find_cage_contacts("К00A3", "2024-03-01", "2024-03-31", exclude_animal=sick)
+        self.assertEqual([(row[0], row[3]) for row in contacts], [(moved, "К00A3")])
+        self.assertEqual(contacts[0][7], "Петров")
+        near = db.find_cage_contacts("К00A3", "2024-03-01", "2024-03-31", radius=1)
+        self.assertEqual({row[0] for row in near}, {sick, moved, neighbour})
+        self.assertEqual(db.find_cage_contacts("К00A3", "2024-03-16", "2024-03-31"), [])
+
+        # удалённый перевод убирает пребывание из истории
+        db.delete_event(transfer)
+        self.assertEqual(db.get_cage_stays(moved), [("К0001", "2024-01-01", "2024-03-14")])
+        db.delete_animal(neighbour)
+        self.assertEqual(db.get_cage_stays(neighbour), [])
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, "contacts.csv")
+        self.assertEqual(exporter.main(["contacts", path, "--cage", "К00a3",
+                                        "--from", "2024-03-01", "--radius", "1"]), 0)
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual([row["name"] for row in rows], ["Больной"])
+
+    def test_backup_generations_and_cancel(self):
+        """Онлайн-копия: проверка целостности, ротация поколений, отмена без мусора."""
+        dest = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dest)
+        steps = []
+        path = backup.create_backup(dest, keep=2, pages=1,
+                                    progress=lambda done, total: steps.append((done, total)))
+        self.assertGreater(len(steps), 1)
+        self.assertEqual(steps[-1][0], steps[-1][1])
+        copy = sqlite3.connect(path)
+        self.addCleanup(copy.close)
+        self.assertEqual(copy.execute("PRAGMA journal_mode").fetchone()[0], "delete")
+        self.assertEqual(copy.execute("SELECT name FROM animals ORDER BY id").fetchall(),
+                         [("TestAnimal",), ("TestAnimal2",)])
+
+        self.assertEqual(backup.main(["--dir", dest, "--keep", "2"]), 0)
+        backup.create_backup(dest, keep=2)
+        backups = backup.list_backups(dest)
+        self.assertEqual(len(backups), 2)
+        self.assertNotIn(path, backups)
+
+        stop = threading.Event()
+        stop.set()
+        with self.assertRaises(backup.BackupCancelled):
+            backup.create_backup(dest, keep=2, stop=stop, pages=1)
+        self.assertEqual(sorted(os.listdir(dest)), sorted(os.path.basename(p) for p in backups))
+
+    def test_documents_index_reconciled_with_disk(self):
+        """Индекс документов: сверка по mtime, неизменённые папки не читаются, событие шины."""
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        folder = os.path.join(root, str(self.animal_id))
+        os.makedirs(folder)
+        for name in ("scan.pdf", "photo.jpg"):
+            with open(os.path.join(folder, name), "wb") as f:
+                f.write(name.encode())
+        seen = []
+        changes.bus.subscribe(seen.extend, (changes.DOCUMENTS_CHANGED,))
+        self.addCleanup(changes.bus.unsubscribe, seen.extend)
+
+        self.assertEqual(documents.reconcile_all(root), [self.animal_id])
+        self.assertEqual(sorted(os.path.basename(p) for p in db.get_documents(self.animal_id)),
+                         ["photo.jpg", "scan.pdf"])
+        self.assertEqual(seen, [changes.Change(changes.DOCUMENTS_CHANGED, None, self.animal_id)])
+        row = db.get_connection().execute(
+            "SELECT size, hash, mime FROM documents WHERE filename = 'scan.pdf'").fetchone()
+        self.assertEqual(row, (8, documents.file_hash(os.path.join(folder, "scan.pdf")),
+                               "application/pdf"))
+        # папка не менялась — повторная сверка её не читает
+        self.assertEqual(documents.reconcile_all(root), [])
+
+        os.remove(os.path.join(folder, "photo.jpg"))
+        with open(os.path.join(folder, "scan.pdf"), "ab") as f:
+            f.write(b"-v2")
+        self.assertEqual(documents.reconcile_all(root, force=True), [self.animal_id])
+        self.assertEqual(db.get_document_stats(self.animal_id)["scan.pdf"][0], 11)
+        self.assertEqual(len(db.get_documents(self.animal_id)), 1)
+
+        shutil.rmtree(folder)
+        self.assertEqual(documents.reconcile_all(root), [self.animal_id])
+        self.assertEqual(db.get_documents(self.animal_id), [])
+        self.assertEqual(db.get_document_dirs(), {})
+
+    def test_docstore_dedupes_and_collects_garbage(self):
+        """Хранилище по содержимому: одинаковые файлы — одна копия, сборка мусора."""
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        for animal_id in (self.animal_id, self.animal_id2):
+            os.makedirs(os.path.join(root, str(animal_id)))
+            with open(os.path.join(root, str(animal_id), "vaccine.pdf"), "wb") as f:
+                f.write(b"same certificate")
+        first = os.path.join(root, str(self.animal_id), "vaccine.pdf")
+        second = os.path.join(root, str(self.animal_id2), "vaccine.pdf")
+        documents.reconcile_all(root)
+        db.add_event_doc(self.event_id, "vaccine.pdf")
+        digest = documents.file_hash(first)
+        self.assertEqual(db.get_connection().execute(
+            "SELECT hash FROM event_docs WHERE event_id = ?", (self.event_id,)).fetchone()[0], digest)
+
+        docstore.enable(root)
+        self.assertEqual(docstore.adopt_indexed(root), 2)
+        self.assertTrue(os.path.samefile(first, second))
+        self.assertTrue(os.path.samefile(first, docstore.blob_path(digest, root)))
+        self.assertEqual(docstore.usage(root)["saved_bytes"], len(b"same certificate"))
+        # ссылки получили mtime блоба — индекс это знает, повторного хеширования нет
+        self.assertEqual(documents.reconcile_all(root, force=True), [])
+
+        # новый файл при включённом хранилище сразу становится ссылкой
+        with open(os.path.join(root, str(self.animal_id2), "copy.pdf"), "wb") as f:
+            f.write(b"same certificate")
+        documents.reconcile_animal(self.animal_id2, root)
+        self.assertTrue(os.path.samefile(first, os.path.join(root, str(self.animal_id2), "copy.pdf")))
+
+        # блоб жив, пока на него ссылается прикрепление к событию
+        for path in (first, second, os.path.join(root, str(self.animal_id2), "copy.pdf")):
+            os.remove(path)
+        documents.reconcile_all(root)
+        self.assertEqual(docstore.collect_garbage(root), (0, 0))
+        db.delete_event_doc(self.event_id, "vaccine.pdf")
+        self.assertEqual(docstore.collect_garbage(root), (1, len(b"same certificate")))
+        self.assertEqual(list(docstore.iter_blobs(root)), [])
+
+    def test_ingest_copies_hashes_and_renames(self):
+        """Приём файла: копия в папку животного с хешем, совпадение имён, отмена."""
+        root, outside = tempfile.mkdtemp(), tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        self.addCleanup(shutil.rmtree, outside)
+        src = os.path.join(outside, "xray.jpg")
+        with open(src, "wb") as f:
+            f.write(b"x" * 1000)
+        reports = []
+        names = ingest.ingest_files(self.animal_id, [src], root,
+                                    progress=lambda done, total: reports.append((done, total)))
+        self.assertEqual(names, ["xray.jpg"])
+        self.assertEqual(reports[-1], (1000, 1000))
+        target = os.path.join(root, str(self.animal_id), "xray.jpg")
+        self.assertEqual(db.get_document_stats(self.animal_id)["xray.jpg"][:1], (1000,))
+        digest = db.get_connection().execute(
+            "SELECT hash FROM documents WHERE animal_id = ? AND filename = ?",
+            (self.animal_id, "xray.jpg")).fetchone()[0]
+        self.assertEqual(digest, documents.file_hash(target))
+
+        # тот же файл ещё раз — имя прежнее; другое содержимое — «имя (2)»
+        self.assertEqual(ingest.ingest_file(self.animal_id, src, root), "xray.jpg")
+        self.assertEqual(ingest.ingest_file(self.animal_id, target, root), "xray.jpg")
+        with open(src, "wb") as f:
+            f.write(b"y" * 10)
+        self.assertEqual(ingest.ingest_file(self.animal_id, src, root), "xray (2).jpg")
+
+        stop = threading.Event()
+        stop.set()
+        with self.assertRaises(ingest.IngestCancelled):
+            ingest.ingest_file(self.animal_id, src, root, stop=stop)
+        self.assertEqual(sorted(os.listdir(os.path.join(root, str(self.animal_id)))),
+                         ["xray (2).jpg", "xray.jpg"])
+
+    def test_preview_cache_lru_and_renderer(self):
+        """Кэш миниатюр: ключ — хеш и mtime, вытеснение давно не показанных, повторов нет."""
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        cache = previews.PreviewCache(root, max_bytes=250)
+        self.assertIsNone(cache.lookup("ab" * 32, 1))
+        paths = []
+        for n, digest in enumerate(("aa" * 32, "bb" * 32, "cc" * 32)):
+            path = cache.path_for(digest, 100)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(b"p" * 100)
+            os.utime(path, ns=(n, n))
+            paths.append(path)
+        self.assertNotEqual(cache.path_for("aa" * 32, 101), paths[0])
+        # первую показали — вытесняется вторая, давно не показанная
+        self.assertEqual(cache.lookup("aa" * 32, 100), paths[0])
+        self.assertEqual(cache.trim(), 1)
+        self.assertEqual([os.path.exists(p) for p in paths], [True, False, True])
+
+        # нарисовать нечем — None, заявка не повторяется
+        src = os.path.join(root, "notes.txt")
+        with open(src, "w") as f:
+            f.write("text")
+        self.assertIsNone(previews.render_preview(src, cache.path_for("dd" * 32, 1)))
+        renderer = previews.PreviewRenderer(cache, workers=1)
+        self.addCleanup(renderer.shutdown)
+        self.assertIsNone(renderer.request(src, "dd" * 32, 1).result())
+        self.assertIsNone(renderer.pool)
+        # готовая миниатюра: проверка и отметка показа — в процессе пула
+        self.assertEqual(renderer.request(paths[2], "cc" * 32, 100).result(timeout=60), paths[2])
+        self.assertGreater(os.stat(paths[2]).st_mtime_ns, 2)
+        self.assertEqual(renderer.pending, {})
+
+        # пул сломан — миниатюры нет, в потоке вызова ничего не рисуется
+        def broken_pool():
+            raise BrokenProcessPool("pool died")
+        renderer._pool = broken_pool
+        with contextlib.redirect_stderr(io.StringIO()) as err:
+            self.assertIsNone(renderer.request(paths[0], "ee" * 32, 100).result())
+        self.assertIn("pool died", err.getvalue())
+        self.assertFalse(os.path.exists(cache.path_for("ee" * 32, 100)))
+        self.assertEqual(renderer.pending, {})
+
+    def test_text_measurer_cache_and_incremental_autofit(self):
+        """Измерения кэшируются по (шрифт, текст); ширины колонок — по изменённым строкам."""
+        class FakeFont:
+            calls = 0
+            def measure(self, text):
+                FakeFont.calls += 1
+                return 10 * len(text)
+            def __str__(self):
+                return "fake"
+        font = FakeFont()
+        measurer = TextMeasurer(max_size=16)
+        self.assertEqual(measurer.measure("abc", font), 30)
+        self.assertEqual(measurer.measure("abc", font), 30)
+        self.assertEqual(FakeFont.calls, 1)
+        self.assertEqual(measurer.truncate("abcdefgh", 60, font), "abc...")
+        calls = FakeFont.calls
+        self.assertEqual(measurer.truncate("abcdefgh", 60, font), "abc...")
+        self.assertEqual(FakeFont.calls, calls)
+
+        class FakeTree:
+            def __init__(self):
+                self.widths = {}
+            def column(self, col, width):
+                self.widths[col] = width
+        tree = FakeTree()
+        autofit = ColumnAutofit(("A", "Name"), padding=0, font=font, text_measurer=measurer)
+        autofit.add(1, ("1", "Bob"))
+        autofit.add(2, ("2", "Alexander"))
+        self.assertEqual(autofit.apply(tree), 2)
+        self.assertEqual(tree.widths, {"A": 10, "Name": 90})
+        autofit.update(2, ("2", "Al"))
+        self.assertEqual(autofit.apply(tree), 1)
+        self.assertEqual(tree.widths["Name"], 40)  # не уже заголовка
+        calls = FakeFont.calls
+        autofit.update(1, ("1", "Bob"))   # значения не изменились — ничего не меряем
+        autofit.remove(1)
+        self.assertEqual(FakeFont.calls, calls)
+        self.assertEqual(autofit.widths(), {"A": 10, "Name": 40})
+        self.assertEqual(autofit.apply(tree), 0)
+
+    def test_animation_clock_single_timer(self):
+        """Часы анимации: один таймер на все анимации, пауза при сворачивании окна."""
+        class FakeRoot:
+            def __init__(self):
+                self.jobs, self.bindings = {}, {}
+            def after(self, ms, fn):
+                job = len(self.jobs) + 1
+                self.jobs[job] = fn
+                return job
+            def after_cancel(self, job):
+                del self.jobs[job]
+            def bind(self, sequence, fn, add=None):
+                self.bindings[sequence] = fn
+            def fire(self):
+                job, fn = self.jobs.popitem()
+                fn()
+        root = FakeRoot()
+        clock = AnimationClock(root)
+        rows, items = [], []
+        clock.register('rows', rows.append, period=2)
+        clock.register('item', items.append)
+        self.assertEqual(len(root.jobs), 1)
+        for _ in range(4):
+            root.fire()
+        self.assertEqual(len(root.jobs), 1)
+        self.assertEqual(rows, [True, False, True])
+        self.assertEqual(items, [True, False, True, False, True])
+
+        minimized = type("Event", (), {"widget": root})
+        root.bindings["<Unmap>"](minimized)
+        self.assertEqual(root.jobs, {})
+        root.bindings["<Map>"](minimized)
+        self.assertEqual(len(root.jobs), 1)
+        clock.unregister('rows')
+        clock.unregister('item')
+        clock.unregister('item')
+        self.assertEqual(root.jobs, {})
+
+    def test_tooltip_manager_debounces_and_caches(self):
+        """Подсказки: движение над тем же ключом ничего не делает, текст грузится один раз."""
+        class FakeRoot:
+            def __init__(self):
+                self.jobs = {}
+                self.bindings = {}
+                self.next_job = 0
+            def after(self, ms, fn):
+                self.next_job += 1
+                job = self.next_job
+                self.jobs[job] = fn
+                return job
+            def after_cancel(self, job):
+                del self.jobs[job]
+            def bind(self, sequence, fn, add=None):
+                self.bindings[sequence] = fn
+        root = FakeRoot()
+        tooltips = TooltipManager(root)
+        loads = []
+        def resolve(event):
+            if event.y > 100:
+                return None
+            return ('row', event.y // 10), lambda: loads.append(event.y // 10)
+        tooltips.attach(root, resolve)
+        motion = lambda y: root.bindings["<Motion>"](type("Event", (), {"y": y, "x_root": 0, "y_root": y}))
+
+        motion(1)
+        motion(5)   # та же строка — таймер не перезапускается
+        self.assertEqual(list(root.jobs), [1])
+        motion(15)  # другая строка — прежний показ отменён
+        self.assertEqual(list(root.jobs), [2])
+        root.jobs.pop(2)()
+        motion(25)
+        motion(15)
+        root.jobs.popitem()[1]()
+        self.assertEqual(loads, [1])   # текст строки 1 взят из кэша
+        motion(500)
+        self.assertEqual(root.jobs, {})
+        self.assertFalse(tooltips.shown)
+
+    def test_headless_modules_do_not_import_tk(self):
+        """Модули без интерфейса (CLI, фоновые задачи) не тянут за собой tkinter."""
+        code = ("import sys, database, models, utils, importer, exporter, backup, documents, "
+                "docstore, ingest, previews, config, changes, cache, ui.startup; "
+                "print('tkinter' in sys.modules)")
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        self.assertEqual(out.stdout.strip(), "False")
+
+    def test_startup_timer_report(self):
+        """Отчёт о запуске: этапы по порядку, строка JSON в файле, выводится один раз."""
+        timer = StartupTimer(t0=time.perf_counter())
+        timer.mark("init_db")
+        timer.mark("first_paint")
+        self.assertEqual([stage for stage, _ in timer.marks], ["init_db", "first_paint"])
+        self.assertLessEqual(timer.marks[0][1], timer.marks[1][1])
+        self.assertIn("first_paint", timer.format())
+
+        path = os.path.join(tempfile.mkdtemp(), "startup.jsonl")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        timer.report(path)
+        timer.report(path)
+        with open(path, encoding="utf-8") as f:
+            lines = f.readlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(list(json.loads(lines[0])['marks']), ["init_db", "first_paint"])
+
+        quiet = StartupTimer()
+        quiet.report("")
+        self.assertTrue(quiet.reported)
+
+    def test_cage_registry_migration_tolerates_legacy_duplicates(self):
+        """Миграция реестра: дубль клетки в старых данных не мешает, клетку получает первый."""
+        path = os.path.join(tempfile.mkdtemp(), "legacy.db")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        db.DB_NAME = path
+        db.init_db()
+        conn = db.get_connection()
+        conn.execute("DROP TABLE cages")
+        conn.execute("PRAGMA user_version = 5")
+        conn.executemany(
+            "INSERT INTO animals(name, species, birth_date, arrival_date, cage_number) "
+            "VALUES (?, 'Cat', '2021-01-01', '2023-01-01', ?)",
+            [("А", "О0002"), ("Б", "О0002"), ("В", "A1")])
+        db.migrate()
+        self.assertEqual(db.get_schema_version(), db.SCHEMA_VERSION)
+        self.assertEqual(conn.execute(
+            "SELECT code, status, animal_id FROM cages ORDER BY num").fetchall(),
+            [("О0000", "free", None), ("О0001", "free", None), ("О0002", "occupied", 1)])
+        self.assertEqual(db.allocate_cages("О", 3), ["О0000", "О0001", "О0003"])
+        db.close_connection()
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
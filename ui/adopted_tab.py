@@ -7,16 +7,36 @@ from tkinter import ttk, messagebox
 from datetime import date
 from config import config
 from models import AnimalManager
-from utils import autofit_treeview_columns
+from ui.text_metrics import ColumnAutofit
+from ui.virtual_tree import VirtualTreeview
+from ui.tooltip import treeview_cell_resolver
+import changes
 
 class AdoptedTab:
     """Вкладка переданных животных"""
     
-    def __init__(self, parent):
+    # Больше изменений за одну транзакцию (импорт) — дешевле перечитать таблицу
+    RELOAD_THRESHOLD = 20
+    
+    # Колонки, по которым можно сортировать кликом на заголовок
+    SORT_COLUMNS = {
+        "ID животного": "id",
+        "Имя": "name",
+        "Вид": "species",
+        "Дата рождения": "birth_date",
+        "Дата поступления": "arrival_date",
+        "Имя владельца": "owner_name",
+        "Контакт": "owner_contact",
+        "Дата передачи": "adoption_date",
+    }
+    
+    def __init__(self, parent, executor, frame=None):
         self.parent = parent
-        self.frame = ttk.Frame(parent)
+        self.executor = executor  # фоновые операции с БД (ui.db_executor)
+        self.frame = frame if frame is not None else ttk.Frame(parent)
         self.setup_ui()
         self.setup_bindings()
+        changes.bus.subscribe(executor.in_tk(self.on_changes), changes.ANIMAL_TOPICS)
     
     def setup_ui(self):
         """Создание интерфейса"""
@@ -28,12 +48,6 @@ class AdoptedTab:
             row=0, column=0, pady=5
         )
         
-        # Фрейм для таблицы
-        frm_adopt = ttk.Frame(self.frame)
-        frm_adopt.grid(row=1, column=0, sticky='nsew', padx=5, pady=5)
-        frm_adopt.rowconfigure(0, weight=1)
-        frm_adopt.columnconfigure(0, weight=1)
-        
         # Колонки таблицы
         self.columns = (
             "ID животного", "Имя", "Вид", "Дата рождения", 
@@ -41,53 +55,100 @@ class AdoptedTab:
             "Имя владельца", "Контакт", "Дата передачи"
         )
         
-        # Создание таблицы
-        self.tree = ttk.Treeview(frm_adopt, columns=self.columns, show='headings')
+        # Виртуальная таблица: в Treeview только видимые строки, данные — страницами
+        self.table = VirtualTreeview(
+            self.frame, self.columns,
+            fetch_page=lambda after, sort: AnimalManager.get_adopted_page(after, sort),
+            count_rows=database.count_adoptions,
+            render_row=self.make_row,
+            key=lambda animal: animal.id,
+            sort_columns=self.SORT_COLUMNS,
+            executor=self.executor,
+            # ширины колонок — по показанным строкам, пересчёт только изменённых
+            autofit=ColumnAutofit(self.columns),
+        )
+        self.table.frame.grid(row=1, column=0, sticky='nsew', padx=5, pady=5)
+        self.tree = self.table.tree
         
         # Настройка заголовков
         for col in self.columns:
             self.tree.heading(col, text=col)
             self.tree.column(col, anchor='center')
         
-        # Скроллбары
-        vsb = ttk.Scrollbar(frm_adopt, orient='vertical', command=self.tree.yview)
-        self.tree.configure(yscrollcommand=vsb.set)
-        
-        hsb = ttk.Scrollbar(frm_adopt, orient='horizontal', command=self.tree.xview)
+        # Горизонтальный скроллбар
+        hsb = ttk.Scrollbar(self.table.frame, orient='horizontal', command=self.tree.xview)
         self.tree.configure(xscrollcommand=hsb.set)
-        
-        # Размещение
-        self.tree.grid(row=0, column=0, sticky='nsew')
-        vsb.grid(row=0, column=1, sticky='ns')
         hsb.grid(row=1, column=0, columnspan=2, sticky='ew')
     
+    def setup_tooltips(self, tooltips):
+        """Полный текст обрезанных ячеек (имена, контакты) во всплывающей подсказке"""
+        tooltips.attach(self.tree, treeview_cell_resolver(self.tree, self.table.key_for_item))
+    
     def setup_bindings(self):
         """Настройка обработчиков событий"""
         self.tree.bind("<Double-1>", self.on_double_click)
     
     def refresh_list(self):
-        """Обновление списка усыновленных животных"""
-        self.tree.delete(*self.tree.get_children())
-        
-        animals = AnimalManager.get_all_adopted()
-        today = date.today()
-        
-        for animal in animals:
-            # Вычисляем возраст
-            age_display = animal.get_age_display()
-            birth_display = animal.get_birth_date_display()
-            
-            values = (
-                animal.id, animal.name, animal.species,
-                birth_display, age_display, animal.arrival_date or "",
-                animal.owner_name or "", animal.owner_contact or "",
-                animal.adoption_date or ""
-            )
-            
-            self.tree.insert('', 'end', iid=str(animal.id), values=values)
+        """Обновление списка усыновленных животных (перечитывается только видимое окно)"""
+        self.table.reload()
+    
+    def make_row(self, animal):
+        """Значения и теги строки таблицы для усыновленного животного"""
+        # Вычисляем возраст
+        age_display = animal.get_age_display()
+        birth_display = animal.get_birth_date_display()
         
-        # Автоподгонка ширины колонок
-        autofit_treeview_columns(self.tree, self.columns)
+        values = (
+            animal.id, animal.name, animal.species,
+            birth_display, age_display, animal.arrival_date or "",
+            animal.owner_name or "", animal.owner_contact or "",
+            animal.adoption_date or ""
+        )
+        return values, ()
+    
+    def on_changes(self, batch):
+        """Точечное обновление таблицы по шине изменений"""
+        if len(batch) > self.RELOAD_THRESHOLD or any(c.topic == changes.RESET for c in batch):
+            self.refresh_list()
+            return
+        self.executor.submit(self.load_changed_rows, batch, on_done=self.apply_changes)
+    
+    @staticmethod
+    def load_changed_rows(batch):
+        """(В рабочем потоке) свежие строки переданных и изменённых животных"""
+        return [
+            (change, database.get_adoption_by_id(change.id)
+             if change.topic in (changes.ANIMAL_ADOPTED, changes.ANIMAL_UPDATED) else None)
+            for change in batch
+        ]
+    
+    def apply_changes(self, loaded):
+        """Применяет изменения к таблице"""
+        for change, row in loaded:
+            if change.topic == changes.ANIMAL_ADOPTED:
+                if row:
+                    self.table.add_row(AnimalManager.adopted_from_row(row))
+            elif change.topic == changes.ANIMAL_UPDATED:
+                if not row:
+                    continue  # животное не из этой вкладки
+                if self.table.sort in change.fields:
+                    self.table.reload()  # строка могла сменить место
+                else:
+                    self.table.update_row(change.id, AnimalManager.adopted_from_row(row))
+            elif change.topic == changes.ANIMAL_DELETED:
+                self.table.remove_row(change.id)
+    
+    def on_shown(self):
+        """Вкладку снова открыли — догружаем недостающее"""
+        self.table.render()
+    
+    def on_hidden(self):
+        """Вкладку закрыли — фоновая подгрузка таблицы больше не нужна"""
+        self.table.cancel_loading()
+    
+    def show_animal(self, animal_id):
+        """Прокручивает таблицу к животному и выделяет его"""
+        return self.table.show_key(animal_id)
     
     def on_double_click(self, event):
         """Обработчик двойного клика для редактирования"""
@@ -101,7 +162,7 @@ class AdoptedTab:
             return  # Эту колонку не редактируем
         
         row_id = self.tree.identify_row(event.y)
-        if not row_id:
+        if not row_id or self.table.row_for_item(row_id) is None:
             return
         # Координаты ячейки
         x, y, width, height = self.tree.bbox(row_id, col_id)
@@ -115,9 +176,8 @@ class AdoptedTab:
         def save_edit(e):
             new_value = entry.get().strip()
             animal_id = self.tree.item(row_id)["values"][0]
-            database.update_adoption_field(animal_id, field, new_value)
             entry.destroy()
-            self.refresh_list()
+            self.executor.submit(database.update_adoption_field, animal_id, field, new_value)
 
         entry.bind("<Return>", save_edit)
         entry.bind("<FocusOut>", save_edit)
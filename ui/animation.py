@@ -0,0 +1,75 @@
+"""
+Общие часы анимации: один таймер Tk на все мигающие строки и элементы списков
+"""
+
+
+class AnimationClock:
+    """
+    Один after()-таймер, который раз в TICK_MS вызывает все
+    зарегистрированные анимации. Анимация — callback(phase) с периодом
+    в тиках: phase чередуется True/False каждые period тиков, так что
+    всё мигает синхронно.
+
+    Регистрация и снятие — O(1) (словарь по ключу). Пока анимаций нет или
+    окно свёрнуто, таймер не запущен; при показе окна часы продолжают.
+    Колбэки должны делать работу уровня тега (tag_configure), а не обход
+    строк — тогда тик стоит одинаково при одной и при сотне строк.
+    """
+
+    TICK_MS = 250
+
+    def __init__(self, root, tick_ms: int = TICK_MS):
+        self.root = root
+        self.tick_ms = tick_ms
+        self.animations = {}   # ключ -> (callback, period)
+        self.ticks = 0
+        self.job = None
+        self.visible = True
+        root.bind("<Map>", self.on_map, add='+')
+        root.bind("<Unmap>", self.on_unmap, add='+')
+
+    def register(self, key, callback, period: int = 1):
+        """Добавляет (или заменяет) анимацию key; callback(phase) вызывается сразу"""
+        self.animations[key] = (callback, period)
+        callback(self.phase(period))
+        self.start()
+
+    def unregister(self, key):
+        """Снимает анимацию key (если была); когда анимаций нет, таймер останавливается"""
+        if self.animations.pop(key, None) is not None and not self.animations:
+            self.stop()
+
+    def is_registered(self, key) -> bool:
+        return key in self.animations
+
+    def phase(self, period: int) -> bool:
+        return (self.ticks // period) % 2 == 0
+
+    def start(self):
+        if self.job is None and self.visible and self.animations:
+            self.job = self.root.after(self.tick_ms, self.tick)
+
+    def stop(self):
+        if self.job is not None:
+            self.root.after_cancel(self.job)
+            self.job = None
+
+    def tick(self):
+        """Один тик для всех анимаций"""
+        self.job = None
+        self.ticks += 1
+        for callback, period in list(self.animations.values()):
+            if self.ticks % period == 0:
+                callback(self.phase(period))
+        self.start()
+
+    def on_map(self, event):
+        if event.widget is self.root:
+            self.visible = True
+            self.start()
+
+    def on_unmap(self, event):
+        # <Unmap> приходит и от дочерних виджетов — реагируем только на окно
+        if event.widget is self.root:
+            self.visible = False
+            self.stop()
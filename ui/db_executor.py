@@ -0,0 +1,175 @@
+"""
+Фоновое выполнение операций с БД, чтобы SQLite не блокировал цикл Tk
+"""
+import queue
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import messagebox
+
+# Один рабочий поток: записи выполняются строго в порядке отправки,
+# а чтение после записи видит её результат
+DB_WORKERS = 1
+
+
+class TkPoller:
+    """
+    Очередь колбэков из рабочих потоков, разбираемая в потоке Tk.
+
+    Один after()-таймер на все исполнители приложения, и он взведён,
+    только пока есть чего ждать: expect() отмечает задачу, чей колбэк
+    ещё придёт, done() — что он пришёл. Когда задач нет и очередь пуста,
+    таймер не перезапускается и простаивающее окно Tk не будится.
+    """
+
+    POLL_MS = 15
+
+    def __init__(self, root, poll_ms: int = POLL_MS):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.callbacks = queue.SimpleQueue()   # что выполнить в потоке Tk
+        self.outstanding = 0   # ожидаемые колбэки (меняется только в потоке Tk)
+        self.job = None
+
+    def put(self, callback):
+        """Колбэк в очередь (из любого потока)"""
+        self.callbacks.put(callback)
+
+    def expect(self):
+        """(Поток Tk) будет ещё один колбэк — таймер должен работать"""
+        self.outstanding += 1
+        self.start()
+
+    def done(self):
+        """(Поток Tk) ожидаемый колбэк пришёл"""
+        self.outstanding -= 1
+
+    def start(self):
+        if self.job is None:
+            self.job = self.root.after(self.poll_ms, self.poll)
+
+    def stop(self):
+        if self.job is not None:
+            self.root.after_cancel(self.job)
+            self.job = None
+
+    def poll(self):
+        """Разбор очереди; следующий тик — только если ещё что-то ожидается"""
+        self.job = None
+        while True:
+            try:
+                callback = self.callbacks.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                callback()
+            except Exception:
+                self.root.report_callback_exception(*sys.exc_info())
+        if self.outstanding > 0 or not self.callbacks.empty():
+            self.start()
+
+
+class DBExecutor:
+    """
+    Пул потоков для вызовов database/models.
+
+    submit() возвращает Future; on_done/on_error вызываются уже в потоке Tk:
+    рабочий поток кладёт их в очередь, которую Tk разбирает через after().
+    Задачи можно объединять в группы (group) и отменять группой — например,
+    загрузку медкарты, когда пользователь ушёл на другую.
+
+    Очередь колбэков разбирает TkPoller; исполнители одного окна передают
+    общий poller, чтобы на всех был один таймер.
+    """
+
+    def __init__(self, root, workers: int = DB_WORKERS, poller: TkPoller = None):
+        self.root = root
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shelter-db")
+        self.poller = poller or TkPoller(root)
+        self.tk_thread = threading.get_ident()
+        self.generations = {}   # group -> номер; отмена увеличивает номер
+        self.pending = {}       # group -> множество незавершённых Future
+
+    def submit(self, fn, *args, on_done=None, on_error=None, group=None):
+        """Выполняет fn(*args) в рабочем потоке; колбэки — в потоке Tk"""
+        return self.watch(self.pool.submit(fn, *args), on_done, on_error, group)
+
+    def watch(self, future, on_done=None, on_error=None, group=None):
+        """
+        Колбэки готовности уже запущенного Future (например, из пула
+        миниатюр) — в потоке Tk, с той же отменой по группам, что у submit
+        """
+        generation = self.generations.get(group, 0)
+        if group is not None:
+            self.pending.setdefault(group, set()).add(future)
+        self.poller.expect()
+        future.add_done_callback(lambda f: self.poller.put(
+            lambda: self.finish(f, on_done, on_error, group, generation)))
+        return future
+
+    def cancel(self, group):
+        """Отменяет задачи группы: не начатые не выполнятся, колбэки начатых не вызовутся"""
+        self.generations[group] = self.generations.get(group, 0) + 1
+        for future in self.pending.pop(group, ()):
+            future.cancel()
+
+    def is_busy(self, group) -> bool:
+        """Есть ли у группы незавершённые задачи"""
+        return bool(self.pending.get(group))
+
+    def in_tk(self, callback):
+        """
+        Обёртка, которая всегда вызывает callback в потоке Tk.
+        Нужна подписчикам changes.bus: COMMIT может случиться в рабочем потоке.
+        Из рабочего потока вызов ставится в очередь — его разберут, пока
+        задача, из которой он сделан, не завершилась (таймер ещё работает).
+        """
+        def wrapper(*args):
+            if threading.get_ident() == self.tk_thread:
+                callback(*args)
+            else:
+                self.poller.put(lambda: callback(*args))
+        return wrapper
+
+    def progress_reporter(self, callback):
+        """
+        Функция progress(done, total) для рабочего потока: callback(процент)
+        вызывается в потоке Tk и только при смене процента.
+        """
+        report = self.in_tk(callback)
+        last_percent = [-1]
+
+        def progress(done, total):
+            percent = done * 100 // max(total, 1)
+            if percent != last_percent[0]:
+                last_percent[0] = percent
+                report(percent)
+        return progress
+
+    def finish(self, future, on_done, on_error, group, generation):
+        """Доставка результата в потоке Tk"""
+        self.poller.done()
+        if group is not None:
+            futures = self.pending.get(group)
+            if futures is not None:
+                futures.discard(future)
+                if not futures:
+                    del self.pending[group]
+        if future.cancelled() or self.generations.get(group, 0) != generation:
+            return
+
+        error = future.exception()
+        if error is None:
+            if on_done is not None:
+                on_done(future.result())
+        elif on_error is not None:
+            on_error(error)
+        else:
+            traceback.print_exception(type(error), error, error.__traceback__)
+            messagebox.showerror("Ошибка", f"Ошибка базы данных: {error}")
+
+    def shutdown(self):
+        """Дожидается отправленных записей и останавливает пул (при закрытии окна)"""
+        self.poller.stop()
+        self.pool.shutdown(wait=True)
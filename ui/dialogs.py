@@ -5,18 +5,22 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 from datetime import date
 import os
+import threading
 from config import config
 from models import Animal, AnimalManager
 from utils import validate_date_format
 import database
+import ingest
 
 
 class AdoptionDialog:
     """Диалог усыновления животного"""
     
-    def __init__(self, parent, animal_id):
+    def __init__(self, parent, animal_id, executor=None):
         self.parent = parent
         self.animal_id = animal_id
+        # запись в БД в фоне (ui.db_executor); None — прямо в потоке Tk
+        self.executor = executor
         self.result = None
         self.create_dialog()
     
@@ -46,7 +50,8 @@ class AdoptionDialog:
         btn_frame = ttk.Frame(self.dialog)
         btn_frame.grid(row=3, column=0, columnspan=2, pady=20)
         
-        ttk.Button(btn_frame, text="Подтвердить", command=self.confirm).pack(side='left', padx=5)
+        self.btn_confirm = ttk.Button(btn_frame, text="Подтвердить", command=self.confirm)
+        self.btn_confirm.pack(side='left', padx=5)
         ttk.Button(btn_frame, text="Отмена", command=self.cancel).pack(side='left', padx=5)
         
         # Фокус на первое поле
@@ -66,12 +71,28 @@ class AdoptionDialog:
             messagebox.showwarning("Ошибка", "Неверный формат даты")
             return
         
-        try:
-            database.add_adoption(self.animal_id, owner, contact, adoption_date)
-            self.result = True
+        if self.executor is None:
+            try:
+                database.add_adoption(self.animal_id, owner, contact, adoption_date)
+            except Exception as e:
+                self.on_failed(e)
+                return
+            self.on_saved()
+            return
+        # пока запись ждёт своей очереди, повторно не отправляем
+        self.btn_confirm.state(['disabled'])
+        self.executor.submit(database.add_adoption, self.animal_id, owner, contact, adoption_date,
+                             on_done=lambda _: self.on_saved(), on_error=self.on_failed)
+    
+    def on_saved(self):
+        self.result = True
+        if self.dialog.winfo_exists():
             self.dialog.destroy()
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось оформить усыновление: {str(e)}")
+    
+    def on_failed(self, error):
+        if self.dialog.winfo_exists():
+            self.btn_confirm.state(['!disabled'])
+        messagebox.showerror("Ошибка", f"Не удалось оформить усыновление: {str(error)}")
     
     def cancel(self):
         """Отмена"""
@@ -82,28 +103,28 @@ class AdoptionDialog:
 class EventDialog:
     """Диалог создания события"""
     
-    def __init__(self, parent, animal_id):
+    def __init__(self, parent, animal_id, executor=None, db_executor=None):
         self.parent = parent
         self.animal_id = animal_id
+        # фоновое копирование документов (ui.db_executor); None — прямо в потоке Tk
+        self.executor = executor
+        # чтение и запись БД (исполнитель вкладки); None — прямо в потоке Tk
+        self.db_executor = db_executor
         self.result = None
         self.extra_fields = {}  # Дополнительные поля для именных событий
+        self.pending_docs = []  # файлы, которые ещё копируются в папку животного
+        self.copy_stop = threading.Event()
         self.create_dialog()
     
     def create_dialog(self):
-        """Создание диалогового окна"""
-        # Получаем данные животного
-        animal_data = database.get_animal_by_id(self.animal_id)
-        if not animal_data:
-            messagebox.showerror("Ошибка", "Животное не найдено")
-            return
-        
-        name = animal_data[1]
-        
+        """Создание диалогового окна (имя животного в заголовке — после загрузки)"""
         self.dialog = tk.Toplevel(self.parent)
-        self.dialog.title(f"Новое событие для #{self.animal_id} ({name})")
+        self.dialog.title(f"Новое событие для #{self.animal_id}")
         self.dialog.geometry("600x500")
         self.dialog.transient(self.parent)
         self.dialog.grab_set()
+        # закрытие окна останавливает копирование документов
+        self.dialog.protocol("WM_DELETE_WINDOW", self.cancel)
         
         # Создаем скроллируемую область
         canvas = tk.Canvas(self.dialog)
@@ -122,6 +143,32 @@ class EventDialog:
         scrollbar.pack(side="right", fill="y")
         
         self.create_form()
+        self.run_db(AnimalManager.get_row, self.animal_id, on_done=self.on_animal_loaded,
+                    group=self)
+    
+    def run_db(self, fn, *args, on_done, on_error=None, group=None):
+        """fn(*args) через исполнитель БД (или сразу, если его нет); on_done — в потоке Tk"""
+        if self.db_executor is not None:
+            self.db_executor.submit(fn, *args, on_done=on_done, on_error=on_error, group=group)
+            return
+        try:
+            result = fn(*args)
+        except Exception as e:
+            if on_error is None:
+                raise
+            on_error(e)
+            return
+        on_done(result)
+    
+    def on_animal_loaded(self, animal_data):
+        """Данные животного пришли: имя — в заголовок; животного нет — закрываем"""
+        if not self.dialog.winfo_exists():
+            return
+        if not animal_data:
+            messagebox.showerror("Ошибка", "Животное не найдено", parent=self.parent)
+            self.cancel()
+            return
+        self.dialog.title(f"Новое событие для #{self.animal_id} ({animal_data[1]})")
     
     def create_form(self):
         """Создание формы события"""
@@ -193,8 +240,11 @@ class EventDialog:
         self.lb_docs.grid(row=0, column=0, sticky='nsew', pady=2)
         sb_docs.grid(row=0, column=1, sticky='ns', pady=2)
         
+        self.lbl_copy = ttk.Label(docs_frame)
+        self.lbl_copy.grid(row=1, column=0, columnspan=2, sticky='w')
+        
         btn_frame = ttk.Frame(docs_frame)
-        btn_frame.grid(row=1, column=0, columnspan=2, pady=5)
+        btn_frame.grid(row=2, column=0, columnspan=2, pady=5)
         
         ttk.Button(btn_frame, text="Добавить файлы", command=self.add_documents).pack(side='left', padx=5)
         ttk.Button(btn_frame, text="Удалить выбранное", command=self.remove_document).pack(side='left', padx=5)
@@ -212,7 +262,8 @@ class EventDialog:
         btn_frame = ttk.Frame(self.scrollable_frame)
         btn_frame.grid(row=row, column=0, columnspan=2, pady=20)
         
-        ttk.Button(btn_frame, text="Создать", command=self.create_event).pack(side='left', padx=5)
+        self.btn_create = ttk.Button(btn_frame, text="Создать", command=self.create_event)
+        self.btn_create.pack(side='left', padx=5)
         ttk.Button(btn_frame, text="Отмена", command=self.cancel).pack(side='left', padx=5)
         
         # Настройка обработчиков
@@ -270,7 +321,10 @@ class EventDialog:
             self.extra_fields_frame.grid_forget()
     
     def add_documents(self):
-        """Добавление документов"""
+        """
+        Добавление документов: файлы копируются в папку животного в фоне
+        (файлы из самой папки не копируются), в список попадают их имена там.
+        """
         folder = os.path.abspath(f"docs/{self.animal_id}")
         os.makedirs(folder, exist_ok=True)
         
@@ -278,20 +332,59 @@ class EventDialog:
             title="Выберите файлы",
             initialdir=folder
         )
+        if not files:
+            return
         
-        for file_path in files:
-            filename = os.path.basename(file_path)
+        pending = [os.path.basename(file_path) for file_path in files]
+        self.pending_docs.extend(pending)
+        self.refresh_doc_list()
+        if self.executor is None:
+            self.on_documents_copied(pending, ingest.ingest_files(self.animal_id, files))
+            return
+        progress = self.executor.progress_reporter(
+            lambda percent: self.lbl_copy.config(text=f"Копирование: {percent}%"))
+        self.executor.submit(ingest.ingest_files, self.animal_id, files, ingest.DOCS_ROOT,
+                             progress, self.copy_stop,
+                             on_done=lambda names: self.on_documents_copied(pending, names),
+                             on_error=lambda e: self.on_documents_failed(pending, e),
+                             group=self)
+    
+    def on_documents_copied(self, pending, names):
+        """Файлы скопированы: в списке — их имена в папке животного"""
+        for filename in pending:
+            self.pending_docs.remove(filename)
+        for filename in names:
             if filename not in self.doc_paths:
                 self.doc_paths.append(filename)
-                self.lb_docs.insert('end', filename)
+        if not self.pending_docs:
+            self.lbl_copy.config(text="")
+        self.refresh_doc_list()
+    
+    def on_documents_failed(self, pending, error):
+        """Копирование не удалось: файлы убираются из списка"""
+        for filename in pending:
+            self.pending_docs.remove(filename)
+        if not self.pending_docs:
+            self.lbl_copy.config(text="")
+        self.refresh_doc_list()
+        messagebox.showerror("Ошибка", f"Не удалось скопировать документы: {error}",
+                             parent=self.dialog)
+    
+    def refresh_doc_list(self):
+        """Список документов: готовые, затем копирующиеся"""
+        self.lb_docs.delete(0, 'end')
+        for filename in self.doc_paths:
+            self.lb_docs.insert('end', filename)
+        for filename in self.pending_docs:
+            self.lb_docs.insert('end', f"{filename} — копируется…")
     
     def remove_document(self):
-        """Удаление выбранного документа"""
+        """Удаление выбранного документа из списка (файл в папке остаётся)"""
         selection = self.lb_docs.curselection()
         for idx in reversed(selection):
-            filename = self.lb_docs.get(idx)
-            self.doc_paths.remove(filename)
-            self.lb_docs.delete(idx)
+            if idx < len(self.doc_paths):
+                del self.doc_paths[idx]
+        self.refresh_doc_list()
     
     def create_event(self):
         """Создание события"""
@@ -307,6 +400,10 @@ class EventDialog:
             messagebox.showwarning("Ошибка", "Тип и дата начала обязательны")
             return
         
+        if self.pending_docs:
+            messagebox.showwarning("Ошибка", "Дождитесь окончания копирования документов")
+            return
+        
         if not validate_date_format(date_start):
             messagebox.showwarning("Ошибка", "Неверный формат даты начала")
             return
@@ -340,23 +437,39 @@ class EventDialog:
             except Exception:
                 pass  # Если не удалось сериализовать, сохраняем без дополнительных полей
         
-        try:
-            # Создаем событие
+        self.btn_create.state(['disabled'])
+        self.run_db(self.save_event, self.animal_id, event_type, date_start, date_end,
+                    conclusion, results_json, list(self.doc_paths),
+                    on_done=self.on_event_saved, on_error=self.on_event_failed)
+    
+    @staticmethod
+    def save_event(animal_id, event_type, date_start, date_end, conclusion, results_json, docs):
+        """(В рабочем потоке) событие и его документы — одной транзакцией"""
+        with database.transaction():
             event_id = database.add_event(
-                self.animal_id, event_type, date_start, date_end, conclusion, results_json
+                animal_id, event_type, date_start, date_end, conclusion, results_json
             )
-            
-            # Добавляем документы
-            for filename in self.doc_paths:
+            for filename in docs:
                 database.add_event_doc(event_id, filename)
-            
-            self.result = True
+        return event_id
+    
+    def on_event_saved(self, event_id):
+        self.result = event_id
+        if self.dialog.winfo_exists():
             self.dialog.destroy()
-            
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось создать событие: {str(e)}")
+    
+    def on_event_failed(self, error):
+        if self.dialog.winfo_exists():
+            self.btn_create.state(['!disabled'])
+        messagebox.showerror("Ошибка", f"Не удалось создать событие: {str(error)}")
     
     def cancel(self):
         """Отмена"""
         self.result = False
+        self.copy_stop.set()
+        if self.executor is not None:
+            self.executor.cancel(self)
+        if self.db_executor is not None:
+            # загрузка имени больше не нужна (запись события в эту группу не входит)
+            self.db_executor.cancel(self)
         self.dialog.destroy()
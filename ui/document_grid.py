@@ -0,0 +1,120 @@
+"""
+Сетка документов медкарты с миниатюрами, которые грузятся по мере прокрутки
+"""
+import os
+import tkinter as tk
+from tkinter import ttk
+
+
+
+class DocumentGrid:
+    """
+    Плитки документов: миниатюра (или тип файла) и имя.
+
+    Миниатюры запрашиваются у previews.PreviewRenderer только для плиток,
+    попавших в видимую часть прокручиваемой области (viewport — виджет,
+    чьи границы на экране считаются видимыми; обычно Canvas карточки).
+    Готовые картинки доставляются в поток Tk через executor.watch.
+    """
+
+    PAD = 4
+    NAME_CHARS = 18
+    # Пауза перед подгрузкой после прокрутки или изменения размеров
+    SETTLE_MS = 50
+
+    def __init__(self, parent, entries, renderer, executor, viewport, on_open):
+        self.frame = ttk.Frame(parent)
+        self.entries = entries        # [(путь, hash, mtime_ns, mime)]
+        self.renderer = renderer
+        self.executor = executor
+        self.viewport = viewport
+        self.on_open = on_open        # on_open(путь)
+        self.size = renderer.cache.size
+        self.blank = tk.PhotoImage(width=self.size, height=self.size)
+        self.photos = {}              # путь -> PhotoImage (держим ссылки)
+        self.requested = set()        # пути, миниатюры которых уже запрошены
+        self.tiles = []               # (плитка, картинка-Label, запись)
+        self.columns = 0
+        self.settle_job = None
+
+        for entry in entries:
+            self.tiles.append(self.create_tile(entry))
+        self.frame.bind("<Configure>", lambda e: self.schedule())
+
+    def create_tile(self, entry):
+        """Плитка одного документа"""
+        path, _digest, _mtime_ns, _mime = entry
+        name = os.path.basename(path)
+        ext = os.path.splitext(name)[1].lstrip('.').upper() or '?'
+        tile = ttk.Frame(self.frame, relief='groove', padding=2)
+        picture = ttk.Label(tile, image=self.blank, text=ext, compound='center', anchor='center')
+        picture.grid(row=0, column=0)
+        short = name if len(name) <= self.NAME_CHARS else name[:self.NAME_CHARS - 1] + '…'
+        button = ttk.Button(tile, text=short, command=lambda p=path: self.on_open(p))
+        button.grid(row=1, column=0, sticky='ew')
+        picture.bind("<Double-1>", lambda e, p=path: self.on_open(p))
+        return tile, picture, entry
+
+    def layout(self):
+        """
+        Раскладка плиток по ширине; перекладываем только при смене числа колонок.
+        Возвращает True, если плитки переложены.
+        """
+        tile_px = self.size + 2 * self.PAD + 8
+        columns = max(1, self.frame.winfo_width() // tile_px)
+        if columns == self.columns:
+            return False
+        self.columns = columns
+        for i, (tile, _picture, _entry) in enumerate(self.tiles):
+            tile.grid(row=i // columns, column=i % columns, padx=self.PAD, pady=self.PAD, sticky='n')
+        return True
+
+    def schedule(self, *args):
+        """Раскладка и подгрузка после паузы (прокрутка идёт пачками событий)"""
+        if self.settle_job is None:
+            self.settle_job = self.frame.after(self.SETTLE_MS, self.settle)
+
+    def settle(self):
+        self.settle_job = None
+        if not self.frame.winfo_exists():
+            return
+        if self.layout():
+            self.schedule()   # видимость плиток известна после отрисовки новой раскладки
+        else:
+            self.load_visible()
+
+    def load_visible(self):
+        """Запрашивает миниатюры плиток, которые сейчас видны на экране"""
+        top = self.viewport.winfo_rooty()
+        bottom = top + self.viewport.winfo_height()
+        for tile, picture, entry in self.tiles:
+            path, digest, mtime_ns, _mime = entry
+            if path in self.requested or not digest or not tile.winfo_ismapped():
+                continue
+            y = tile.winfo_rooty()
+            if y + tile.winfo_height() < top or y > bottom:
+                continue
+            self.requested.add(path)
+            future = self.renderer.request(path, digest, mtime_ns)
+            # ошибка рендера — просто нет картинки, плитка остаётся с типом файла
+            self.executor.watch(
+                future, on_done=lambda preview, picture=picture, path=path:
+                    self.show_preview(picture, path, preview),
+                on_error=lambda error: None)
+
+    def show_preview(self, picture, path, preview):
+        """Готовая миниатюра — в плитку (если карточку ещё не закрыли)"""
+        try:
+            if preview is None or not picture.winfo_exists():
+                return
+            photo = tk.PhotoImage(file=preview)
+        except tk.TclError:
+            return  # Tk не прочитал картинку — остаётся тип файла
+        self.photos[path] = photo
+        picture.configure(image=photo, text='')
+
+    def destroy(self):
+        if self.settle_job is not None:
+            self.frame.after_cancel(self.settle_job)
+            self.settle_job = None
+        self.frame.destroy()
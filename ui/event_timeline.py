@@ -0,0 +1,163 @@
+"""
+Лента событий медкарты: виджеты строятся только для видимых событий
+"""
+import tkinter as tk
+from tkinter import ttk
+
+
+class EventTimeline:
+    """
+    Горизонтальная лента событий.
+
+    Каждое событие сначала нарисовано на Canvas дешёвой сводкой (рамка и
+    пара текстовых элементов, без виджетов). Для событий, попавших в
+    видимую часть ленты (с запасом MARGIN колонок), строится полная
+    колонка: build_event(frame, summary) создаёт редакторы заголовка, а
+    документы и результаты подгружаются в фоне пачкой (load_details) и
+    дорисовываются через build_details(frame, summary, docs, results).
+    Колонки, ушедшие далеко за край, уничтожаются.
+
+    summary — строка database.get_event_summaries:
+    (id, type, date_start, date_end, conclusion, число документов).
+    """
+
+    COL_W = 400
+    PAD_X = 5
+    # Высота ленты, пока ни одна колонка не построена
+    MIN_HEIGHT = 120
+    # Сколько колонок строить за краем видимой области и когда их удалять
+    MARGIN = 1
+    DROP_MARGIN = 4
+    SETTLE_MS = 30
+    SUMMARY_CHARS = 200
+
+    def __init__(self, parent, summaries, executor, build_event, build_details, load_details):
+        self.summaries = summaries
+        self.executor = executor
+        self.build_event = build_event        # (frame, summary) -> None
+        self.build_details = build_details    # (frame, summary, docs, results) -> None
+        self.load_details = load_details      # (event_ids) -> {id: (docs, results)} в рабочем потоке
+        self.built = {}       # индекс события -> (id окна на Canvas, Frame)
+        self.details = {}     # event_id -> (docs, results)
+        self.loading = set()  # event_id, чьи детали уже запрошены
+        self.settle_job = None
+
+        self.canvas = tk.Canvas(parent, height=self.MIN_HEIGHT, borderwidth=0, highlightthickness=0)
+        self.hsb = ttk.Scrollbar(parent, orient="horizontal", command=self.on_scrollbar)
+        self.canvas.configure(xscrollcommand=self.on_xscroll)
+        self.canvas.bind("<Configure>", lambda e: self.schedule())
+        self.canvas.bind("<Destroy>", self.on_destroy)
+        self.draw_summaries()
+
+    @property
+    def step(self):
+        return self.COL_W + self.PAD_X
+
+    def column_x(self, index):
+        return index * self.step + self.PAD_X
+
+    def draw_summaries(self):
+        """Сводки всех событий — элементы Canvas, без виджетов"""
+        for index, (eid, etype, ds, de, concl, doc_count) in enumerate(self.summaries):
+            x = self.column_x(index)
+            self.canvas.create_rectangle(x, 0, x + self.COL_W, self.MIN_HEIGHT - 1, outline='#c0c0c0')
+            self.canvas.create_text(x + 6, 6, anchor='nw', text=f"{eid}: {etype}",
+                                    font=("", 10, "bold"))
+            dates = ds if not de or ds == de else f"{ds} — {de}"
+            if doc_count:
+                dates += f"   документов: {doc_count}"
+            self.canvas.create_text(x + 6, 28, anchor='nw', text=dates)
+            if concl:
+                short = concl if len(concl) <= self.SUMMARY_CHARS else concl[:self.SUMMARY_CHARS] + '…'
+                self.canvas.create_text(x + 6, 48, anchor='nw', text=short, width=self.COL_W - 12)
+        width = self.column_x(len(self.summaries))
+        self.canvas.configure(scrollregion=(0, 0, width, self.MIN_HEIGHT))
+
+    def on_scrollbar(self, *args):
+        self.canvas.xview(*args)
+
+    def on_xscroll(self, first, last):
+        self.hsb.set(first, last)
+        self.schedule()
+
+    def schedule(self):
+        """Пересчёт видимых колонок после паузы (прокрутка идёт пачками событий)"""
+        if self.settle_job is None:
+            self.settle_job = self.canvas.after(self.SETTLE_MS, self.settle)
+
+    def visible_range(self, margin):
+        """Индексы событий [first, last], видимых на Canvas, с запасом margin"""
+        left = self.canvas.canvasx(0)
+        right = self.canvas.canvasx(max(self.canvas.winfo_width(), 1))
+        first = max(0, int(left // self.step) - margin)
+        last = min(len(self.summaries) - 1, int(right // self.step) + margin)
+        return first, last
+
+    def settle(self):
+        """Строит колонки для видимых событий и удаляет далёкие"""
+        self.settle_job = None
+        if not self.summaries:
+            return
+        keep_first, keep_last = self.visible_range(self.DROP_MARGIN)
+        for index in [i for i in self.built if not keep_first <= i <= keep_last]:
+            window, frame = self.built.pop(index)
+            self.canvas.delete(window)
+            frame.destroy()
+
+        first, last = self.visible_range(self.MARGIN)
+        missing = []
+        for index in range(first, last + 1):
+            if index not in self.built:
+                self.materialize(index)
+            eid = self.summaries[index][0]
+            if eid not in self.details and eid not in self.loading:
+                missing.append(eid)
+        if missing:
+            self.loading.update(missing)
+            self.executor.submit(self.load_details, missing, on_done=self.on_details, group=self)
+        self.canvas.after_idle(self.fit_height)
+
+    def materialize(self, index):
+        """Полная колонка события поверх его сводки"""
+        summary = self.summaries[index]
+        frame = ttk.Frame(self.canvas, width=self.COL_W, relief='groove', padding=5)
+        frame.columnconfigure(0, weight=1)
+        frame.columnconfigure(1, weight=0)
+        self.build_event(frame, summary)
+        details = self.details.get(summary[0])
+        if details is None:
+            ttk.Label(frame, text="Загрузка…").grid(row=3, column=0, sticky='w')
+        else:
+            self.build_details(frame, summary, *details)
+        window = self.canvas.create_window(self.column_x(index), 0, window=frame,
+                                           anchor='nw', width=self.COL_W)
+        self.built[index] = (window, frame)
+
+    def on_details(self, details):
+        """Детали пришли — дорисовываем построенные колонки этих событий"""
+        self.details.update(details)
+        self.loading.difference_update(details)
+        for index, (window, frame) in list(self.built.items()):
+            summary = self.summaries[index]
+            if summary[0] in details:
+                for child in frame.grid_slaves(row=3):
+                    child.destroy()
+                self.build_details(frame, summary, *details[summary[0]])
+        self.canvas.after_idle(self.fit_height)
+
+    def fit_height(self):
+        """Высота ленты — по самой высокой построенной колонке"""
+        if not self.canvas.winfo_exists():
+            return
+        height = max([frame.winfo_reqheight() for _window, frame in self.built.values()]
+                     + [self.MIN_HEIGHT])
+        if int(self.canvas.cget('height')) != height:
+            self.canvas.configure(height=height)
+            self.canvas.configure(scrollregion=(0, 0, self.column_x(len(self.summaries)), height))
+
+    def on_destroy(self, event):
+        if event.widget is self.canvas:
+            self.executor.cancel(self)
+            if self.settle_job is not None:
+                self.canvas.after_cancel(self.settle_job)
+                self.settle_job = None
@@ -1,29 +1,71 @@
 """
 Главное окно приложения ShelterApp
 """
+import threading
 import tkinter as tk
-from tkinter import ttk
+from tkinter import ttk, messagebox
 from config import config
+import backup
+import documents
+import previews
 from ui.shelter_tab import ShelterTab
 from ui.medical_tab import MedicalTab
 from ui.adopted_tab import AdoptedTab
+from ui.search_bar import SearchBar
+from ui.db_executor import DBExecutor, TkPoller
+from ui.animation import AnimationClock
+from ui.tooltip import TooltipManager
+from ui.startup import StartupTimer
 
 
 class ShelterApp:
     """Главное приложение ShelterApp"""
     
-    def __init__(self):
+    # Как часто сверять папки docs с индексом документов
+    DOCS_POLL_MS = 10000
+    # Первая сверка — чуть позже, чтобы не спорить за диск с первой загрузкой
+    DOCS_FIRST_POLL_MS = 2000
+    
+    # Вкладки: (имя, заголовок, класс). Объект вкладки создаётся при первом
+    # открытии (или первом обращении — например, уведомлении медкарты)
+    TABS = (
+        ('shelter', "Приют", ShelterTab),
+        ('adopted', "Переданы", AdoptedTab),
+        ('medical', "Медицина", MedicalTab),
+    )
+    
+    def __init__(self, startup=None):
+        self.startup = startup or StartupTimer()
         self.root = tk.Tk()
+        self.startup.mark("tk")
+        # Колбэки всех исполнителей разбирает один таймер (только пока есть задачи)
+        self.poller = TkPoller(self.root)
+        # Все обращения к БД из интерфейса — через фоновый исполнитель
+        self.executor = DBExecutor(self.root, poller=self.poller)
+        # Резервная копия — в своём потоке, чтобы не задерживать запросы вкладок
+        self.backup_executor = DBExecutor(self.root, poller=self.poller)
+        self.backup_stop = threading.Event()
+        # Сверка папок документов (хеширование новых файлов) — тоже отдельно
+        self.docs_executor = DBExecutor(self.root, poller=self.poller)
+        self.docs_poll_job = None
+        # Миниатюры документов рисует пул процессов (запускается при первой заявке)
+        self.preview_renderer = previews.PreviewRenderer()
+        # Один таймер на всё, что мигает во вкладках
+        self.animation = AnimationClock(self.root)
+        # Одно окно подсказок на все вкладки
+        self.tooltips = TooltipManager(self.root)
         self.setup_window()
+        self.create_menu()
         self.create_tabs()
         self.setup_bindings()
+        self.startup.mark("window")
     
     def setup_window(self):
         """Настройка главного окна"""
         self.root.title(config.APP_TITLE)
         self.root.geometry(config.DEFAULT_GEOMETRY)
         self.root.columnconfigure(0, weight=1)
-        self.root.rowconfigure(0, weight=1)
+        self.root.rowconfigure(1, weight=1)
         
         # Установка иконки
         try:
@@ -33,35 +75,137 @@ class ShelterApp:
             # Если файл иконки не найден, продолжаем без неё
             pass
     
+    def create_menu(self):
+        """Главное меню и строка состояния"""
+        menubar = tk.Menu(self.root)
+        file_menu = tk.Menu(menubar, tearoff=0)
+        file_menu.add_command(label="Резервная копия БД", command=self.start_backup)
+        menubar.add_cascade(label="Файл", menu=file_menu)
+        self.root.config(menu=menubar)
+
+        self.lbl_status = ttk.Label(self.root, anchor='w')
+        self.lbl_status.grid(row=2, column=0, sticky="ew", padx=5)
+
     def create_tabs(self):
-        """Создание вкладок"""
+        """Страницы вкладок; строится только открытая при запуске"""
         self.notebook = ttk.Notebook(self.root)
+        self.tabs = {}        # имя -> объект вкладки (построенные)
+        self.tab_pages = {}   # имя -> страница Notebook
+        for name, title, _cls in self.TABS:
+            page = ttk.Frame(self.notebook)
+            self.notebook.add(page, text=title)
+            self.tab_pages[name] = page
         
-        # Создаем вкладки и сохраняем ссылки на них
-        self.shelter_tab = ShelterTab(self.notebook)
-        self.adopted_tab = AdoptedTab(self.notebook)
-        self.medical_tab = MedicalTab(self.notebook)
-        
-        # Устанавливаем ссылку на главное приложение в каждой вкладке
-        self.shelter_tab.app = self
-        self.adopted_tab.app = self
-        self.medical_tab.app = self
+        self.notebook.grid(row=1, column=0, sticky="nsew")
+        self.root.rowconfigure(1, weight=1)
+        self.root.columnconfigure(0, weight=1)
         
-        # Добавляем вкладки в notebook
-        self.notebook.add(self.shelter_tab.frame, text="Приют")
-        self.notebook.add(self.adopted_tab.frame, text="Переданы")
-        self.notebook.add(self.medical_tab.frame, text="Медицина", 
-                         image=self.medical_tab.blank_img, compound='right')
+        # Виджеты открытой вкладки — до первой отрисовки окна, данные — после (run)
+        self.get_tab(self.selected_tab_name(), load=False)
         
-        self.notebook.grid(row=0, column=0, sticky="nsew")
-        self.root.rowconfigure(0, weight=1)
-        self.root.columnconfigure(0, weight=1)
+        # Глобальный поиск над вкладками
+        self.search_bar = SearchBar(self.root, self)
+        self.search_bar.frame.grid(row=0, column=0, sticky="ew")
+    
+    def get_tab(self, name, load=True):
+        """
+        Вкладка по имени; при первом обращении — создаётся (и загружает данные, если load).
+        Вкладке передаётся frame — её страница, уже добавленная в Notebook:
+        вкладка строит виджеты в ней и по notebook.select() видит, открыта ли она.
+        """
+        tab = self.tabs.get(name)
+        if tab is None:
+            cls = next(cls for tab_name, _title, cls in self.TABS if tab_name == name)
+            tab = cls(self.notebook, self.executor, frame=self.tab_pages[name])
+            tab.app = self
+            tab.setup_tooltips(self.tooltips)
+            if hasattr(tab, 'update_tab_title'):
+                tab.update_tab_title()  # значок уведомлений медкарты
+            self.tabs[name] = tab
+            if load:
+                tab.refresh_list()
+        return tab
+    
+    @property
+    def shelter_tab(self):
+        return self.get_tab('shelter')
+    
+    @property
+    def adopted_tab(self):
+        return self.get_tab('adopted')
+    
+    @property
+    def medical_tab(self):
+        return self.get_tab('medical')
+    
+    def selected_tab_name(self):
+        """Имя открытой вкладки"""
+        selected = self.notebook.select()
+        for name, page in self.tab_pages.items():
+            if str(page) == selected:
+                return name
+        return self.TABS[0][0]
     
     def setup_bindings(self):
         """Настройка горячих клавиш"""
         self.fullscreen = False
         self.root.bind("<F11>", self.toggle_fullscreen)
+        self.root.bind("<Control-f>", lambda e: self.search_bar.entry.focus_set())
         self.root.bind("<Escape>", lambda e: self.toggle_fullscreen() if self.fullscreen else None)
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+    
+    def on_tab_changed(self, event=None):
+        """Фоновая загрузка ушедших из виду вкладок отменяется, открытой — возобновляется"""
+        selected = self.selected_tab_name()
+        built_now = selected not in self.tabs
+        self.get_tab(selected)  # первое открытие: вкладка строится и грузит данные
+        for name, tab in self.tabs.items():
+            if name == selected:
+                if not built_now:
+                    tab.on_shown()
+            else:
+                tab.on_hidden()
+    
+    def start_backup(self):
+        """Резервная копия в фоне; ход копирования — в строке состояния"""
+        if self.backup_executor.is_busy('backup'):
+            return
+        self.backup_stop.clear()
+        progress = self.backup_executor.progress_reporter(
+            lambda percent: self.show_status(f"Резервное копирование: {percent}%"))
+        self.backup_executor.submit(
+            backup.create_backup, backup.BACKUP_DIR, backup.KEEP_GENERATIONS,
+            progress, self.backup_stop,
+            on_done=self.on_backup_done, on_error=self.on_backup_error, group='backup')
+
+    def show_status(self, text=""):
+        """Текст в строке состояния (ход фоновых операций)"""
+        self.lbl_status.config(text=text)
+
+    def on_backup_done(self, path):
+        self.show_status(f"Резервная копия сохранена: {path}")
+
+    def on_backup_error(self, error):
+        self.show_status()
+        messagebox.showerror("Резервная копия", f"Не удалось создать копию: {error}")
+
+    def poll_documents(self):
+        """Периодическая сверка docs/ — подхватывает файлы, положенные мимо программы"""
+        if not self.docs_executor.is_busy('docs'):
+            self.docs_executor.submit(documents.reconcile_all, group='docs')
+        self.docs_poll_job = self.root.after(self.DOCS_POLL_MS, self.poll_documents)
+    
+    def on_close(self):
+        """Закрытие окна: копирование прерываем, отправленные в БД записи дожидаемся"""
+        self.backup_stop.set()
+        self.backup_executor.shutdown()
+        if self.docs_poll_job is not None:
+            self.root.after_cancel(self.docs_poll_job)
+        self.docs_executor.shutdown()
+        self.preview_renderer.shutdown()
+        self.executor.shutdown()
+        self.root.destroy()
     
     def toggle_fullscreen(self, event=None):
         """Переключение полноэкранного режима"""
@@ -69,15 +213,29 @@ class ShelterApp:
         self.root.attributes("-fullscreen", self.fullscreen)
     
     def refresh_all_tabs(self):
-        """Обновляет все вкладки"""
-        self.shelter_tab.refresh_list()
-        self.adopted_tab.refresh_list()
-        self.medical_tab.refresh_list()
+        """Обновляет все построенные вкладки (остальные загрузятся при открытии)"""
+        for tab in self.tabs.values():
+            tab.refresh_list()
     
     def run(self):
-        """Запуск приложения"""
-        # Инициализация данных
+        """
+        Запуск приложения: сначала окно с открытой вкладкой отрисовывается,
+        затем она загружает данные; остальные вкладки строятся при открытии.
+        """
+        self.root.wait_visibility()
+        self.root.update_idletasks()
+        self.startup.mark("first_paint")
+        
         self.refresh_all_tabs()
+        # исполнитель выполняет задачи по порядку: эта закончится после
+        # запросов вкладки, а её колбэк — после того, как строки показаны
+        self.executor.submit(lambda: None, on_done=self.on_first_data)
+        self.docs_poll_job = self.root.after(self.DOCS_FIRST_POLL_MS, self.poll_documents)
         
         # Запуск главного цикла
         self.root.mainloop()
+    
+    def on_first_data(self, _=None):
+        """Данные открытой вкладки показаны — запуск закончен"""
+        self.startup.mark("first_data")
+        self.startup.report()
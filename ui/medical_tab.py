@@ -4,32 +4,61 @@
 import tkinter as tk
 from tkinter import ttk, font, messagebox, filedialog
 import os
-import glob
 import json
 from models import AnimalManager, EventManager
-from utils import truncate_text_for_width
+from ui.text_metrics import measurer
 from ui.dialogs import EventDialog
+from ui.document_grid import DocumentGrid
+from ui.event_timeline import EventTimeline
 import database
+import documents
+import ingest
+import changes
 from config import config
 
 
 class MedicalTab:
     """Вкладка медицины с карточками животных"""
     
-    def __init__(self, parent):
+    # Пауза после последнего изменения размеров перед перерисовкой списка
+    RELAYOUT_DELAY_MS = 100
+    # Мигание новой медкарты в списке (см. ui.animation)
+    BLINK_KEY = 'medical-new'
+    
+    def __init__(self, parent, executor, frame=None):
         self.parent = parent
-        self.frame = ttk.Frame(parent)
+        self.executor = executor  # фоновые операции с БД (ui.db_executor)
+        self.frame = frame if frame is not None else ttk.Frame(parent)
         self.notified_animals = set()
-        self.blink_timer = None
-        self.blink_state = False
-        self.blink_index = None
+        self.blink_id = None   # мигающее животное (номер строки ищется на каждом тике)
+        # Список животных в памяти: полные строки и ID по порядку. Из БД он
+        # перечитывается только при изменении данных, а при смене ширины
+        # перерисовывается из памяти (см. relayout_list)
         self.med_names = []
-        self.tip = None
-        self.update_lock = False
+        self.med_ids = []
+        self.list_loaded = False
+        self.list_px = None            # ширина, под которую обрезаны строки списка
+        self.relayout_job = None
+        self.blink_on_add = None       # ID, который мигнёт, когда появится в списке
+        self.current_animal_id = None  # открытая (или загружаемая) медкарта
+        self.card_loaded = False
+        self.card_docs = None          # (рамка документов, canvas, vsb) открытой карточки
+        self.doc_grid = None
+        self.docs_stale = False        # файлы менялись, пока вкладка была скрыта
+        self.card_events = None        # рамка карточки, в которой лента событий
+        self.timeline = None
+        self.events_stale = False      # события менялись, пока вкладка была скрыта
+        # группы фоновых задач для отмены
+        self.list_group = (self, 'list')
+        self.card_group = (self, 'card')
         
         self.setup_ui()
         self.setup_bindings()
         self.create_notification_images()
+        changes.bus.subscribe(executor.in_tk(self.on_changes), changes.ANIMAL_TOPICS)
+        changes.bus.subscribe(executor.in_tk(self.on_documents_changed),
+                              (changes.DOCUMENTS_CHANGED,))
+        changes.bus.subscribe(executor.in_tk(self.on_event_changes), changes.EVENT_TOPICS)
     
     def setup_ui(self):
         """Создание интерфейса"""
@@ -69,10 +98,25 @@ class MedicalTab:
     def setup_bindings(self):
         """Настройка обработчиков событий"""
         self.lst_med.bind("<<ListboxSelect>>", self.on_med_select)
-        self.lst_med.bind("<Motion>", self.on_motion)
-        self.lst_med.bind("<Leave>", self.on_leave)
         self.list_frame.bind('<Configure>', self.adjust_list_width)
     
+    def setup_tooltips(self, tooltips):
+        """Полное имя животного во всплывающей подсказке над списком"""
+        self.tooltips = tooltips
+        tooltips.attach(self.lst_med, self.tooltip_target)
+    
+    def tooltip_target(self, event):
+        """Строка списка под мышью: (ключ, loader) для TooltipManager"""
+        idx = self.lst_med.nearest(event.y)
+        bbox = self.lst_med.bbox(idx)
+        if not self.list_loaded or not bbox or idx >= len(self.med_names):
+            return None
+        _x0, y0, _w0, h0 = bbox
+        if event.y < y0 or event.y > y0 + h0:
+            return None
+        full = self.med_names[idx]
+        return ('medical', self.med_ids[idx]), lambda: full
+    
     def create_notification_images(self):
         """Создание изображений для уведомлений"""
         self.blank_img = tk.PhotoImage(width=1, height=1)
@@ -85,65 +129,198 @@ class MedicalTab:
                     self.yellow_dot.put("#FFD700", (x, y))
     
     def refresh_list(self):
-        """Обновление списка животных"""
-        self.lst_med.delete(0, 'end')
-        self.med_names.clear()
+        """Обновление списка животных (чтение из БД в фоне)"""
+        self.executor.cancel(self.list_group)
+        self.list_loaded = False
+        if not self.med_ids:
+            self.lst_med.delete(0, 'end')
+            self.lst_med.insert('end', "Загрузка…")
+        self.executor.submit(database.get_all_animals_ids,
+                             on_done=self.fill_list, group=self.list_group)
+    
+    def fill_list(self, animals):
+        """Заполнение списка животных [(id, имя), ...]"""
+        self.med_names[:] = [f"ID:{aid}: {name}" for aid, name in animals]
+        self.med_ids[:] = [aid for aid, _name in animals]
+        self.list_loaded = True
         
         # Пересчитываем доступную ширину
         self.list_frame.update_idletasks()
+        self.list_px = self.list_avail_px()
+        self.render_list()
+        
+        # Уведомление пришло раньше списка (вкладка построена по уведомлению)
+        if self.blink_on_add in self.med_ids:
+            self.blink_list_item(self.blink_on_add)
+            self.blink_on_add = None
+    
+    def render_list(self):
+        """Строки Listbox из списка в памяти, обрезанные под self.list_px"""
+        top = self.lst_med.yview()[0]
+        texts = [self.fit_list_text(full, self.list_px) for full in self.med_names]
+        self.lst_med.delete(0, 'end')
+        if texts:
+            self.lst_med.insert('end', *texts)
+        self.lst_med.yview_moveto(top)
+    
+    def list_avail_px(self):
+        """Ширина списка, доступная под текст"""
         frame_px = self.list_frame.winfo_width()
         pad_px = self.vsb_med.winfo_reqwidth() + 6
-        avail_px = max(50, frame_px - pad_px)
-        
-        # Загружаем животных
-        for aid, name in database.get_all_animals_ids():
-            full = f"ID:{aid}: {name}"
-            # если текст целиком помещается — используем его
-            if self.med_font.measure(full) <= avail_px:
-                display = full
+        return max(50, frame_px - pad_px)
+    
+    def fit_list_text(self, full, avail_px):
+        """Текст строки списка, обрезанный с '...' под ширину avail_px (кэш измерений)"""
+        return measurer.truncate(full, avail_px, self.med_font)
+    
+    def on_changes(self, batch):
+        """Точечное обновление списка животных по шине изменений"""
+        if not self.list_loaded or any(c.topic == changes.RESET for c in batch):
+            self.refresh_list()
+            return
+        self.executor.submit(self.load_changed_rows, batch,
+                             on_done=self.apply_changes, group=self.list_group)
+    
+    @staticmethod
+    def load_changed_rows(batch):
+        """(В рабочем потоке) свежие строки для новых и переименованных животных"""
+        return [
+            (change, database.get_animal_by_id(change.id)
+             if change.topic == changes.ANIMAL_ADDED or 'name' in change.fields else None)
+            for change in batch
+        ]
+    
+    def apply_changes(self, loaded):
+        """Применяет изменения к списку"""
+        avail_px = self.list_px
+        for change, row in loaded:
+            index = self.med_ids.index(change.id) if change.id in self.med_ids else None
+            if change.topic == changes.ANIMAL_ADDED:
+                if row and index is None:
+                    full = f"ID:{row[0]}: {row[1]}"
+                    self.lst_med.insert('end', self.fit_list_text(full, avail_px))
+                    self.med_names.append(full)
+                    self.med_ids.append(row[0])
+                    if self.blink_on_add == row[0]:
+                        self.blink_on_add = None
+                        self.blink_list_item(row[0])
+            elif index is None:
+                continue
+            elif change.topic == changes.ANIMAL_UPDATED:
+                if row:
+                    full = f"ID:{row[0]}: {row[1]}"
+                    self.lst_med.delete(index)
+                    self.lst_med.insert(index, self.fit_list_text(full, avail_px))
+                    self.med_names[index] = full
+                    self.tooltips.forget(('medical', change.id))
             else:
-                # бинарный поиск максимальной длины подстроки, влезает ли вместе с '...'
-                lo, hi = 0, len(full)
-                while lo < hi:
-                    mid = (lo + hi) // 2
-                    if self.med_font.measure(full[:mid] + '...') <= avail_px:
-                        lo = mid + 1
-                    else:
-                        hi = mid
-                # lo — первая неподходящая длина, поэтому обрезаем на lo-1
-                display = full[:lo-1] + '...'
-            
-            self.lst_med.insert('end', display)
-            self.med_names.append(full)
+                # передано или удалено — медкарта больше не в списке
+                self.lst_med.delete(index)
+                del self.med_names[index]
+                del self.med_ids[index]
+    
+    def is_shown(self):
+        """Открыта ли вкладка медкарт"""
+        return hasattr(self.parent, 'select') and str(self.parent.select()) == str(self.frame)
+    
+    def on_documents_changed(self, batch):
+        """
+        В папке открытой медкарты появились или пропали файлы — перечитываем
+        только блок документов (редактируемые поля событий не трогаем).
+        Пока вкладка скрыта — только отмечаем, обновим при показе.
+        """
+        if not self.card_loaded or not any(c.topic == changes.DOCUMENTS_CHANGED
+                                           and c.animal_id == self.current_animal_id
+                                           for c in batch):
+            return
+        if self.is_shown():
+            self.refresh_documents()
+        else:
+            self.docs_stale = True
+    
+    def refresh_documents(self):
+        """Перечитывает файлы открытой медкарты и перерисовывает блок документов"""
+        self.docs_stale = False
+        animal_id = self.current_animal_id
+        self.executor.submit(
+            database.get_document_entries, animal_id,
+            on_done=lambda docs: self.show_documents(animal_id, docs),
+            group=self.card_group,
+        )
+    
+    def on_event_changes(self, batch):
+        """События открытой медкарты добавлены, изменены или удалены — перерисовываем ленту"""
+        if not self.card_loaded or not any(c.animal_id == self.current_animal_id for c in batch):
+            return
+        if self.is_shown():
+            self.refresh_timeline()
+        else:
+            self.events_stale = True
+    
+    def refresh_timeline(self):
+        """Перечитывает сводки событий открытой медкарты и перестраивает ленту"""
+        self.events_stale = False
+        animal_id = self.current_animal_id
+        self.executor.submit(
+            EventManager.get_event_summaries, animal_id,
+            on_done=lambda events: self.show_timeline(animal_id, events),
+            group=self.card_group,
+        )
+    
+    def on_shown(self):
+        """Вкладку снова открыли — догружаем то, что отменили при уходе"""
+        if not self.list_loaded:
+            self.refresh_list()
+        if self.current_animal_id is not None and not self.card_loaded:
+            self.open_medical_card(self.current_animal_id)
+        else:
+            if self.docs_stale:
+                self.refresh_documents()
+            if self.events_stale:
+                self.refresh_timeline()
+    
+    def on_hidden(self):
+        """Вкладку закрыли — отменяем фоновую загрузку списка и медкарты"""
+        if not self.list_loaded:
+            self.executor.cancel(self.list_group)
+        if not self.card_loaded:
+            self.executor.cancel(self.card_group)
     
     def adjust_list_width(self, event=None):
-        """Автоматическая подгонка ширины списка"""
+        """
+        Автоматическая подгонка ширины списка. Пока окно тянут, событий
+        <Configure> много — строки перерисовываются один раз после паузы
+        и без обращения к БД.
+        """
         total = self.frame.winfo_width()
         max_px = total // 4
-        min_px = self.med_font.measure('0') * 10
+        min_px = measurer.measure('0', self.med_font) * 10
         frame_px = max(min_px, max_px)
         
         self.list_frame.config(width=frame_px)
-        self.refresh_list()
+        if self.relayout_job is not None:
+            self.frame.after_cancel(self.relayout_job)
+        self.relayout_job = self.frame.after(self.RELAYOUT_DELAY_MS, self.relayout_list)
+    
+    def relayout_list(self):
+        """Обрезка строк списка под новую ширину (измерения — из кэша)"""
+        self.relayout_job = None
+        if not self.list_loaded:
+            return  # список ещё грузится — fill_list обрежет под текущую ширину
+        avail_px = self.list_avail_px()
+        if avail_px == self.list_px:
+            return
+        self.list_px = avail_px
+        self.render_list()
     
     def on_med_select(self, event):
         """Обработчик выбора животного из списка"""
         sel = self.lst_med.curselection()
-        if not sel:
-            return
-        
-        text = self.lst_med.get(sel[0])
-        # Ожидаем формат "ID:<число>: <имя>"
-        parts = text.split(":", 2)
-        if len(parts) < 3:
-            return
-        
-        id_part = parts[1].strip()
-        if not id_part.isdigit():
+        # ID — из списка в памяти: обрезанная строка может не содержать его целиком
+        if not sel or not self.list_loaded or sel[0] >= len(self.med_ids):
             return
         
-        aid = int(id_part)
-        self.open_medical_card(aid)
+        self.open_medical_card(self.med_ids[sel[0]])
     
     def open_medical_card(self, animal_id):
         """Открытие медицинской карточки животного"""
@@ -157,12 +334,47 @@ class MedicalTab:
             self.update_tab_title()
             self.stop_blink()
         
+        # Пока карточка грузится в фоне — заглушка вместо старого содержимого
+        self.current_animal_id = animal_id
+        self.card_loaded = False
+        self.card_docs = self.doc_grid = None
+        self.card_events = self.timeline = None
+        self.docs_stale = self.events_stale = False
+        for w in self.detail_frame.winfo_children():
+            w.destroy()
+        ttk.Label(self.detail_frame, text="Загрузка медкарты…").grid(row=0, column=0, sticky='w')
+        
+        self.executor.cancel(self.card_group)
+        self.executor.submit(
+            self.load_card, animal_id,
+            on_done=lambda data: self.show_medical_card(animal_id, data),
+            group=self.card_group,
+        )
+        # карточка строится по индексу; заодно сверяем папку с диском —
+        # если файлы изменились, карточка перечитается по шине
+        self.app.docs_executor.submit(documents.reconcile_animal, animal_id)
+    
+    @staticmethod
+    def load_card(animal_id):
+        """(В рабочем потоке) данные карточки: строка животного, файлы (из индекса), события"""
+        animal_data = AnimalManager.get_row(animal_id)
+        docs = database.get_document_entries(animal_id)
+        events = EventManager.get_event_summaries(animal_id)
+        return animal_data, docs, events
+    
+    def save_event_edit(self, fn, *args):
+        """Запись в фоне; ленту событий перерисует шина изменений (on_event_changes)"""
+        self.executor.submit(fn, *args)
+    
+    def show_medical_card(self, animal_id, data):
+        """Построение медкарты по загруженным данным"""
+        animal_data, docs, events = data
+        self.card_loaded = True
+        
         # Очищаем панель деталей
         for w in self.detail_frame.winfo_children():
             w.destroy()
         
-        # Получаем данные животного
-        animal_data = database.get_animal_by_id(animal_id)
         if not animal_data:
             return
         
@@ -218,91 +430,21 @@ class MedicalTab:
         vsb.grid(row=1, column=1, sticky='ns')
         
         # Заполняем содержимое
-        self.create_medical_content(scroll_frame, animal_id)
+        self.create_medical_content(scroll_frame, canvas, vsb, animal_id, docs, events)
     
-    def create_medical_content(self, parent, animal_id):
-        """Создание содержимого медицинской карточки"""
+    def create_medical_content(self, parent, canvas, vsb, animal_id, docs, events):
+        """
+        Создание содержимого медицинской карточки.
+        docs — (путь, hash, mtime_ns, mime); events — сводки для ленты
+        (EventManager.get_event_summaries); canvas/vsb — прокрутка карточки.
+        """
         # === Документы ===
-        docs = sorted(glob.glob(f"docs/{animal_id}/*"), key=os.path.getctime)
         docs_frame = ttk.LabelFrame(parent, text="Документы")
         docs_frame.grid(row=0, column=0, sticky='nsew', pady=(0, 5), padx=2)
         docs_frame.columnconfigure(0, weight=1)
-
-        def update_doc_buttons(event=None):
-            if self.update_lock:
-                return
-            
-            try:
-                self.update_lock = True
-                frame_width = docs_frame.winfo_width()
-                
-                # Удаляем старые виджеты
-                for w in docs_frame.winfo_children():
-                    w.destroy()
-                
-                if not docs:
-                    def open_docs_folder():
-                        folder_path = os.path.abspath(os.path.join("docs", str(animal_id)))
-                        os.makedirs(folder_path, exist_ok=True)
-                        if os.name == 'nt':
-                            os.startfile(folder_path)
-                        else:
-                            os.system(f'open "{folder_path}"' if os.sys.platform == 'darwin' else f'xdg-open "{folder_path}"')
-
-                    btn = tk.Button(
-                        docs_frame,
-                        text="Документов нет, нажмите чтобы добавить",
-                        bg="red", 
-                        fg="white",
-                        command=open_docs_folder
-                    )
-                    btn.grid(row=0, column=0, sticky='ew', padx=2, pady=2)
-                    return
-                
-                # Рассчитываем размеры
-                temp_frame = ttk.Frame(docs_frame)
-                temp_buttons = []
-                for path in docs:
-                    btn = ttk.Button(temp_frame, text=os.path.basename(path))
-                    btn.grid()
-                    temp_frame.update_idletasks()
-                    temp_buttons.append(btn.winfo_width() + 10)
-                    btn.destroy()
-                
-                max_width = max(temp_buttons) if temp_buttons else 1
-                columns = max(1, (frame_width - 20) // max_width)
-                
-                # Размещаем кнопки
-                row = col = 0
-                for i, path in enumerate(docs):
-                    if col >= columns:
-                        row += 1
-                        col = 0
-                    
-                    btn = ttk.Button(
-                        docs_frame,
-                        text=os.path.basename(path),
-                        command=lambda p=path: os.startfile(p)
-                    )
-                    btn.grid(row=row, column=col, padx=2, pady=2, sticky='ew')
-                    col += 1
-                
-                # Настройка колонок
-                for c in range(columns):
-                    docs_frame.columnconfigure(c, weight=1)
-            
-            finally:
-                self.update_lock = False
-
-        # Первый вызов
-        update_doc_buttons()
-
-        # Оптимизированная привязка с троттлингом
-        def delayed_update(event):
-            docs_frame.after(5, update_doc_buttons)
-
-        docs_frame.bind("<Configure>", delayed_update)
-
+        self.card_docs = (docs_frame, canvas, vsb)
+        self.show_documents(animal_id, docs)
+        
         # === Блок «События» ===
         # Кнопка добавления события
         btn_new_event = ttk.Button(
@@ -311,283 +453,325 @@ class MedicalTab:
             command=lambda: self.open_event_dialog(animal_id)
         )
         btn_new_event.grid(row=3, column=0, sticky='w', pady=(0,10))
-        events = database.get_animal_events(animal_id)
 
         # Заголовок блока
         ttk.Label(parent, text="События", font=("", 12)).grid(
             row=2, column=0, sticky='w', pady=(10, 5)
         )
 
+        self.card_events = parent
+        self.show_timeline(animal_id, events)
+
+    def show_timeline(self, animal_id, events):
+        """Лента событий открытой медкарты (строки 4–5 карточки; перестраивается по шине)"""
+        if self.card_events is None or animal_id != self.current_animal_id:
+            return
+        parent = self.card_events
+        for row in (4, 5):
+            for w in parent.grid_slaves(row=row):
+                w.destroy()
+        self.timeline = None
+
         if not events:
             ttk.Label(parent, text="Событий пока нет").grid(row=4, column=0, sticky='w', pady=10)
         else:
-            events_canvas = tk.Canvas(parent, height=1000, borderwidth=0, highlightthickness=0)
-            hsb = ttk.Scrollbar(parent, orient="horizontal", command=events_canvas.xview)
-            events_frame = ttk.Frame(events_canvas)
+            # колонки строятся только для видимых событий, документы и
+            # результаты — подгружаются для них же
+            timeline = EventTimeline(
+                parent, events, self.executor,
+                build_event=lambda col, summary: self.build_event_column(col, animal_id, summary),
+                build_details=lambda col, summary, docs, results: self.build_event_details(
+                    col, animal_id, summary, docs, results),
+                load_details=EventManager.get_event_details,
+            )
+            timeline.hsb.grid(row=4, column=0, sticky='ew', pady=(0,2))
+            timeline.canvas.grid(row=5, column=0, sticky='ew')
+            self.timeline = timeline
 
-            events_frame.bind(
-            "<Configure>",
-            lambda e: events_canvas.configure(scrollregion=events_canvas.bbox("all"))
+    def show_documents(self, animal_id, docs):
+        """Блок документов открытой медкарты (строится заново при изменении файлов)"""
+        if self.card_docs is None or animal_id != self.current_animal_id:
+            return
+        docs_frame, canvas, vsb = self.card_docs
+        if self.doc_grid is not None:
+            self.doc_grid.destroy()
+            self.doc_grid = None
+        for w in docs_frame.winfo_children():
+            w.destroy()
+        canvas.configure(yscrollcommand=vsb.set)
+
+        if docs:
+            # плитки с миниатюрами; картинки рисуются, когда плитка видна
+            grid = DocumentGrid(docs_frame, docs, self.app.preview_renderer, self.executor,
+                                canvas, on_open=lambda p: os.startfile(p))
+            grid.frame.grid(row=0, column=0, sticky='nsew')
+            canvas.configure(yscrollcommand=lambda *a: (vsb.set(*a), grid.schedule()))
+            self.doc_grid = grid
+        else:
+            def open_docs_folder():
+                folder_path = os.path.abspath(os.path.join("docs", str(animal_id)))
+                os.makedirs(folder_path, exist_ok=True)
+                if os.name == 'nt':
+                    os.startfile(folder_path)
+                else:
+                    os.system(f'open "{folder_path}"' if os.sys.platform == 'darwin' else f'xdg-open "{folder_path}"')
+
+            btn = tk.Button(
+                docs_frame,
+                text="Документов нет, нажмите чтобы добавить",
+                bg="red", 
+                fg="white",
+                command=open_docs_folder
             )
-            events_frame_id = events_canvas.create_window((0, 0), window=events_frame, anchor="nw")
-            events_canvas.configure(xscrollcommand=hsb.set)
-
-            hsb.grid(row=4, column=0, sticky='ew', pady=(0,2))
-            events_canvas.grid(row=5, column=0, sticky='ew')
-
-            COL_W = 400
-            PAD_X = 5
-
-            # Наполняем события горизонтально
-            for idx, (etype, ds, de, concl, ew_doc_list, results, eid) in enumerate(events):
-                col = ttk.Frame(events_frame, width=COL_W, relief='groove', padding=5)
-                col.grid(row=0, column=idx, padx=( PAD_X, 0), sticky='ns')
-
-                # Конфигурируем колонки внутри карточки события
-                col.columnconfigure(0, weight=1)  # Колонка для основного контента
-                col.columnconfigure(1, weight=0)  # Колонка для кнопки удаления
-
-                # === row 0: Тип события ===
-                row_type = 0
-                lbl_type = ttk.Label(col, text=f"{eid}: {etype}", font=("", 10, "bold"))
-                lbl_type.grid(row=row_type, column=0, sticky='w', pady=(0,4))
-
-                # Кнопка удаления события
-                def _confirm_and_delete_event_handler(event_id_to_delete, animal_id_to_refresh):
-                    confirm_message = f"Вы уверены, что хотите удалить событие «{event_id_to_delete}»?"
-                    if messagebox.askyesno("Подтверждение удаления", confirm_message, parent=self.frame):
-                        database.delete_event(event_id_to_delete)
-                        self.open_medical_card(animal_id_to_refresh)
-                
-                delete_event_button = ttk.Button(
-                    col,
-                    text="×",
-                    width=3, 
-                    command=lambda current_event_id=eid, current_animal_id=animal_id: \
-                        _confirm_and_delete_event_handler(current_event_id, current_animal_id)
-                )
-                delete_event_button.grid(row=row_type, column=1, sticky='ne', padx=3, pady=3)
-
-                # Фабрика колбэка для редактирования типа
-                def make_type_editor(frame=col, r=row_type, original=etype, ev_id=eid):
-                    def on_edit_type(event):
-                        frame.grid_propagate(False)
-                        lbl_type.grid_forget()
-                        ent = ttk.Entry(frame, font=("", 10, "bold"))
-                        ent.insert(0, original)
-                        ent.grid(row=r, column=0, sticky='w', pady=(0,4))
+            btn.grid(row=0, column=0, sticky='ew', padx=2, pady=2)
+
+    def build_event_column(self, col, animal_id, summary):
+        """Заголовок колонки события: тип, даты и примечание с редакторами"""
+        eid, etype, ds, de, concl, _doc_count = summary
+
+        # === row 0: Тип события ===
+        row_type = 0
+        lbl_type = ttk.Label(col, text=f"{eid}: {etype}", font=("", 10, "bold"))
+        lbl_type.grid(row=row_type, column=0, sticky='w', pady=(0,4))
+
+        # Кнопка удаления события
+        def _confirm_and_delete_event_handler(event_id_to_delete):
+            confirm_message = f"Вы уверены, что хотите удалить событие «{event_id_to_delete}»?"
+            if messagebox.askyesno("Подтверждение удаления", confirm_message, parent=self.frame):
+                self.save_event_edit(database.delete_event, event_id_to_delete)
+        
+        delete_event_button = ttk.Button(
+            col,
+            text="×",
+            width=3, 
+            command=lambda current_event_id=eid: \
+                _confirm_and_delete_event_handler(current_event_id)
+        )
+        delete_event_button.grid(row=row_type, column=1, sticky='ne', padx=3, pady=3)
+
+        # Фабрика колбэка для редактирования типа
+        def make_type_editor(frame=col, r=row_type, original=etype, ev_id=eid):
+            def on_edit_type(event):
+                frame.grid_propagate(False)
+                lbl_type.grid_forget()
+                ent = ttk.Entry(frame, font=("", 10, "bold"))
+                ent.insert(0, original)
+                ent.grid(row=r, column=0, sticky='w', pady=(0,4))
+                ent.focus()
+                def save(e=None):
+                    new = ent.get().strip()
+                    if not new:
+                        messagebox.showwarning("Ошибка", "Название не может быть пустым")
                         ent.focus()
-                        def save(e=None):
-                            new = ent.get().strip()
-                            if not new:
-                                messagebox.showwarning("Ошибка", "Название не может быть пустым")
-                                ent.focus()
-                                return
-                            database.update_event_field(ev_id, 'type', new)
-                            self.open_medical_card(animal_id)
-                        ent.bind('<Return>', save)
-                        ent.bind('<FocusOut>', save)
-                    return on_edit_type
-
-                lbl_type.bind('<Double-1>', make_type_editor())
-
-                # === row 1: Даты ===
-                row_dates = 1
-                date_text = ds if not de or ds == de else f"{ds} — {de}"
-                lbl_dates = ttk.Label(col, text=date_text)
-                lbl_dates.grid(row=row_dates, column=0, sticky='w', pady=(0,4))
-
-                def make_dates_editor(frame=col, r=row_dates, orig_ds=ds, orig_de=de, ev_id=eid):
-                    def on_edit_dates(event):
-                        frame.grid_propagate(False)
-                        lbl_dates.grid_forget()
-                        frm = ttk.Frame(frame)
-                        frm.grid(row=r, column=0, sticky='w', pady=(0,4))
-                        ent_start = ttk.Entry(frm, width=10)
-                        ent_start.insert(0, orig_ds)
-                        ent_end = ttk.Entry(frm, width=10)
-                        ent_end.insert(0, orig_de or orig_ds)
-                        ent_start.grid(row=0, column=0, padx=(0,5))
-                        ent_end.grid(row=0, column=1)
+                        return
+                    self.save_event_edit(database.update_event_field, ev_id, 'type', new)
+                ent.bind('<Return>', save)
+                ent.bind('<FocusOut>', save)
+            return on_edit_type
+
+        lbl_type.bind('<Double-1>', make_type_editor())
+
+        # === row 1: Даты ===
+        row_dates = 1
+        date_text = ds if not de or ds == de else f"{ds} — {de}"
+        lbl_dates = ttk.Label(col, text=date_text)
+        lbl_dates.grid(row=row_dates, column=0, sticky='w', pady=(0,4))
+
+        def make_dates_editor(frame=col, r=row_dates, orig_ds=ds, orig_de=de, ev_id=eid):
+            def on_edit_dates(event):
+                frame.grid_propagate(False)
+                lbl_dates.grid_forget()
+                frm = ttk.Frame(frame)
+                frm.grid(row=r, column=0, sticky='w', pady=(0,4))
+                ent_start = ttk.Entry(frm, width=10)
+                ent_start.insert(0, orig_ds)
+                ent_end = ttk.Entry(frm, width=10)
+                ent_end.insert(0, orig_de or orig_ds)
+                ent_start.grid(row=0, column=0, padx=(0,5))
+                ent_end.grid(row=0, column=1)
+                ent_start.focus()
+                
+                def save(e=None):
+                    new_start = ent_start.get().strip()
+                    new_end = ent_end.get().strip() or None
+                    
+                    if not new_start:
+                        messagebox.showwarning("Ошибка", "Дата начала обязательна")
                         ent_start.focus()
-                        
-                        def save(e=None):
-                            new_start = ent_start.get().strip()
-                            new_end = ent_end.get().strip() or None
-                            
-                            if not new_start:
-                                messagebox.showwarning("Ошибка", "Дата начала обязательна")
-                                ent_start.focus()
-                                return
-                            
-                            try:
-                                from datetime import date
-                                date.fromisoformat(new_start)
-                                if new_end:
-                                    date.fromisoformat(new_end)
-                            except ValueError:
-                                messagebox.showwarning("Ошибка", "Неверный формат даты (YYYY-MM-DD)")
-                                return
-                            
-                            database.update_event_field(ev_id, 'date_start', new_start)
-                            database.update_event_field(ev_id, 'date_end', new_end)
-                            self.open_medical_card(animal_id)
-                        
-                        ent_start.bind('<Return>', save)
-                        ent_end.bind('<Return>', save)
-                    return on_edit_dates
-
-                lbl_dates.bind('<Double-1>', make_dates_editor())
-
-                # === row 2: Примечание ===
-                row_concl = 2
-                concl_text = concl or "(нет примечания)"
-                lbl_concl = ttk.Label(col, text=concl_text, wraplength=COL_W-20)
-                lbl_concl.grid(row=row_concl, column=0, sticky='w', pady=(0,4))
-
-                def make_concl_editor(frame=col, r=row_concl, original=concl, ev_id=eid):
-                    def on_edit_concl(event):
-                        frame.grid_propagate(False)
-                        lbl_concl.grid_forget()
-                        txt = tk.Text(frame, height=3, width=40)
-                        txt.insert('1.0', original or "")
-                        txt.grid(row=r, column=0, sticky='w', pady=(0,4))
-                        txt.focus()
-                        
-                        def save(e=None):
-                            new_concl = txt.get('1.0', 'end').strip() or None
-                            database.update_event_field(ev_id, 'conclusion', new_concl)
-                            self.open_medical_card(animal_id)
-                        def on_return(event):
-                            if event.state & 0x0001:
-                                return
-                            save()
-                            return "break"
-                        txt.bind("<Return>", on_return)
-                        txt.bind('<FocusOut>', save)
-                    return on_edit_concl
-
-                lbl_concl.bind('<Double-1>', make_concl_editor())
-
-                # === row 3: Документы события ===
-                ew_docs = database.get_event_docs(eid)
-                ew_docs_frame = ttk.LabelFrame(col, text="Документы")
-                ew_docs_frame.grid(row=3, column=0, sticky='ew', pady=(0,4), padx=2)
-                ew_docs_frame.columnconfigure(0, weight=1)
-
-                # узнаём доступную ширину
-                ew_docs_frame.update_idletasks()
-                max_px = ew_docs_frame.winfo_width() or COL_W
-                pad = 6
-
-                row = 0
-                col_idx = 0
-                used_px = 0
-
-                if ew_docs:
-                    for fn in ew_docs:
-                        # создаём временную кнопку, чтобы измерить ширину
-                        tmp = ttk.Button(ew_docs_frame, text=fn)
-                        tmp.update_idletasks()
-                        bw = tmp.winfo_reqwidth() + pad
-                        tmp.destroy()
-
-                        # перенос, если не влезает
-                        if used_px + bw > max_px and col_idx > 0:
-                            row += 1
-                            col_idx = 0
-                            used_px = 0
-
-                        # контейнер для пары кнопок
-                        sub = ttk.Frame(ew_docs_frame)
-                        sub.grid(row=row, column=col_idx, sticky='w', padx=2, pady=2)
-
-                        # кнопка «Открыть»
-                        btn_open = ttk.Button(
-                            sub, text=fn,
-                            command=lambda animal_id=animal_id, fn=fn: os.startfile(f"docs/{animal_id}/{fn}")
-                        )
-                        btn_open.grid(row=0, column=0, sticky='w')
-
-                        # кнопка «×» (удалить ссылку)
-                        btn_del = ttk.Button(
-                            sub, text="×", width=2,
-                            command=lambda ev_id=eid, fn=fn: (
-                                database.delete_event_doc(ev_id, fn),
-                                self.open_medical_card(animal_id)
-                            )
-                        )
-                        btn_del.grid(row=0, column=1, sticky='w', padx=(4,0))
-
-                        used_px += bw
-                        col_idx += 1
-
-                    # кнопка «Прикрепить ещё» сразу под последним рядом
-                    ttk.Button(
-                        ew_docs_frame,
-                        text="Прикрепить документ…",
-                        command=lambda eid=eid: self.attach_event_doc_dialog(eid, animal_id)
-                    ).grid(row=row+1, column=0, sticky='w', pady=(4,0), padx=2)
+                        return
+                    
+                    try:
+                        from datetime import date
+                        date.fromisoformat(new_start)
+                        if new_end:
+                            date.fromisoformat(new_end)
+                    except ValueError:
+                        messagebox.showwarning("Ошибка", "Неверный формат даты (YYYY-MM-DD)")
+                        return
+                    
+                    self.save_event_edit(database.update_event_fields, ev_id, {
+                        'date_start': new_start,
+                        'date_end': new_end,
+                    })
+                
+                ent_start.bind('<Return>', save)
+                ent_end.bind('<Return>', save)
+            return on_edit_dates
+
+        lbl_dates.bind('<Double-1>', make_dates_editor())
+
+        # === row 2: Примечание ===
+        row_concl = 2
+        concl_text = concl or "(нет примечания)"
+        lbl_concl = ttk.Label(col, text=concl_text, wraplength=EventTimeline.COL_W-20)
+        lbl_concl.grid(row=row_concl, column=0, sticky='w', pady=(0,4))
+
+        def make_concl_editor(frame=col, r=row_concl, original=concl, ev_id=eid):
+            def on_edit_concl(event):
+                frame.grid_propagate(False)
+                lbl_concl.grid_forget()
+                txt = tk.Text(frame, height=3, width=40)
+                txt.insert('1.0', original or "")
+                txt.grid(row=r, column=0, sticky='w', pady=(0,4))
+                txt.focus()
+                
+                def save(e=None):
+                    new_concl = txt.get('1.0', 'end').strip() or None
+                    self.save_event_edit(database.update_event_field,
+                                         ev_id, 'conclusion', new_concl)
+                def on_return(event):
+                    if event.state & 0x0001:
+                        return
+                    save()
+                    return "break"
+                txt.bind("<Return>", on_return)
+                txt.bind('<FocusOut>', save)
+            return on_edit_concl
+
+        lbl_concl.bind('<Double-1>', make_concl_editor())
+
+    def build_event_details(self, col, animal_id, summary, ew_doc_list, results):
+        """Документы и результаты события (когда лента их подгрузила)"""
+        eid, etype = summary[0], summary[1]
+
+        # === row 3: Документы события ===
+        # документы подгружены лентой, когда событие стало видно
+        ew_docs = [os.path.basename(path) for path in ew_doc_list]
+        ew_docs_frame = ttk.LabelFrame(col, text="Документы")
+        ew_docs_frame.grid(row=3, column=0, sticky='ew', pady=(0,4), padx=2)
+        ew_docs_frame.columnconfigure(0, weight=1)
+
+        # узнаём доступную ширину
+        ew_docs_frame.update_idletasks()
+        max_px = ew_docs_frame.winfo_width() or EventTimeline.COL_W
+        pad = 6
+
+        row = 0
+        col_idx = 0
+        used_px = 0
+
+        if ew_docs:
+            for fn in ew_docs:
+                # создаём временную кнопку, чтобы измерить ширину
+                tmp = ttk.Button(ew_docs_frame, text=fn)
+                tmp.update_idletasks()
+                bw = tmp.winfo_reqwidth() + pad
+                tmp.destroy()
+
+                # перенос, если не влезает
+                if used_px + bw > max_px and col_idx > 0:
+                    row += 1
+                    col_idx = 0
+                    used_px = 0
+
+                # контейнер для пары кнопок
+                sub = ttk.Frame(ew_docs_frame)
+                sub.grid(row=row, column=col_idx, sticky='w', padx=2, pady=2)
+
+                # кнопка «Открыть»
+                btn_open = ttk.Button(
+                    sub, text=fn,
+                    command=lambda animal_id=animal_id, fn=fn: os.startfile(f"docs/{animal_id}/{fn}")
+                )
+                btn_open.grid(row=0, column=0, sticky='w')
 
-                else:
-                    # если нет файлов
-                    tk.Button(
-                        ew_docs_frame,
-                        text="Документов нет, прикрепить…",
-                        bg="red", fg="white",
-                        command=lambda eid=eid: self.attach_event_doc_dialog(eid, animal_id)
-                    ).grid(row=0, column=0, sticky='w', pady=(2,4), padx=2)
-
-                # === row 4: Значения ===
-                specs = config.get_event_fields(etype)
-                frm_res = ttk.LabelFrame(col, text="Результаты")
-                frm_res.grid(row=6, column=0, sticky='ew', pady=(4,0))
-                frm_res.columnconfigure(0, weight=1)
-
-                try:
-                    master_data = json.loads(results) if results else {}
-                except:
-                    master_data = {}
-
-                for i, (fname, ftype) in enumerate(specs):
-                    val = master_data.get(fname, "")
-
-                    lbl = ttk.Label(frm_res, text=f"{fname}: {val}", anchor='w')
-                    lbl.grid(row=i, column=0, sticky='ew', padx=2, pady=1)
-
-                    def make_res_editor(frame=frm_res, row=i, field=fname,
-                                        orig_data=master_data, ev_id=eid, ftype=ftype):
-                        data = orig_data.copy()
-                        def on_edit(event):
-                            frame.grid_propagate(False)
-                            lbl.grid_forget()
-                            ent = ttk.Entry(frame)
-                            ent.insert(0, str(data.get(field, "")))
-                            ent.grid(row=row, column=0, sticky='ew', padx=2, pady=1)
+                # кнопка «×» (удалить ссылку)
+                btn_del = ttk.Button(
+                    sub, text="×", width=2,
+                    command=lambda ev_id=eid, fn=fn: self.save_event_edit(
+                        database.delete_event_doc, ev_id, fn
+                    )
+                )
+                btn_del.grid(row=0, column=1, sticky='w', padx=(4,0))
+
+                used_px += bw
+                col_idx += 1
+
+            # кнопка «Прикрепить ещё» сразу под последним рядом
+            ttk.Button(
+                ew_docs_frame,
+                text="Прикрепить документ…",
+                command=lambda eid=eid: self.attach_event_doc_dialog(eid, animal_id)
+            ).grid(row=row+1, column=0, sticky='w', pady=(4,0), padx=2)
+
+        else:
+            # если нет файлов
+            tk.Button(
+                ew_docs_frame,
+                text="Документов нет, прикрепить…",
+                bg="red", fg="white",
+                command=lambda eid=eid: self.attach_event_doc_dialog(eid, animal_id)
+            ).grid(row=0, column=0, sticky='w', pady=(2,4), padx=2)
+
+        # === row 4: Значения ===
+        specs = config.get_event_fields(etype)
+        frm_res = ttk.LabelFrame(col, text="Результаты")
+        frm_res.grid(row=6, column=0, sticky='ew', pady=(4,0))
+        frm_res.columnconfigure(0, weight=1)
+
+        try:
+            master_data = json.loads(results) if results else {}
+        except:
+            master_data = {}
+
+        for i, (fname, ftype) in enumerate(specs):
+            val = master_data.get(fname, "")
+
+            lbl = ttk.Label(frm_res, text=f"{fname}: {val}", anchor='w')
+            lbl.grid(row=i, column=0, sticky='ew', padx=2, pady=1)
+
+            def make_res_editor(frame=frm_res, row=i, field=fname,
+                                orig_data=master_data, ev_id=eid, ftype=ftype):
+                data = orig_data.copy()
+                def on_edit(event):
+                    frame.grid_propagate(False)
+                    lbl.grid_forget()
+                    ent = ttk.Entry(frame)
+                    ent.insert(0, str(data.get(field, "")))
+                    ent.grid(row=row, column=0, sticky='ew', padx=2, pady=1)
+                    ent.focus()
+                    def save(e=None):
+                        new = ent.get().strip()
+                        try:
+                            if ftype == 'int':
+                                cast = int(new)
+                            elif ftype in ('float', 'double'):
+                                cast = float(new)
+                            else:
+                                cast = new
+                        except:
+                            messagebox.showwarning("Ошибка", f"Неверный формат для {field}")
                             ent.focus()
-                            def save(e=None):
-                                new = ent.get().strip()
-                                try:
-                                    if ftype == 'int':
-                                        cast = int(new)
-                                    elif ftype in ('float', 'double'):
-                                        cast = float(new)
-                                    else:
-                                        cast = new
-                                except:
-                                    messagebox.showwarning("Ошибка", f"Неверный формат для {field}")
-                                    ent.focus()
-                                    return
-                                data[field] = cast
-                                # сохраняем JSON полностью обновлённым
-                                database.update_event_results(ev_id, json.dumps(data))
-                                self.open_medical_card(animal_id)
-                            ent.bind('<Return>', save)
-                            ent.bind('<FocusOut>', save)
-                        return on_edit
-
-                    lbl.bind('<Double-1>', make_res_editor())
-                
+                            return
+                        data[field] = cast
+                        # меняем только это поле, остальной JSON не трогаем
+                        self.save_event_edit(database.update_event_result_field,
+                                             ev_id, field, cast)
+                    ent.bind('<Return>', save)
+                    ent.bind('<FocusOut>', save)
+                return on_edit
+
+            lbl.bind('<Double-1>', make_res_editor())
 
     def attach_event_doc_dialog(self, event_id, animal_id):
         """Диалог прикрепления документов к событию"""
@@ -600,31 +784,52 @@ class MedicalTab:
             initialdir=folder
         )
         
-        for file_path in files:
-            filename = os.path.basename(file_path)
-            database.add_event_doc(event_id, filename)
+        if not files:
+            return
+        
+        # файлы копируются в папку животного в фоне, ход — в строке состояния
+        app = self.app
+        progress = app.docs_executor.progress_reporter(
+            lambda percent: app.show_status(f"Копирование документов: {percent}%"))
+        
+        def on_done(_):
+            app.show_status()  # ленту и документы перерисует шина изменений
         
-        if files:
-            self.open_medical_card(animal_id)
+        def on_error(error):
+            app.show_status()
+            messagebox.showerror("Ошибка", f"Не удалось прикрепить документы: {error}")
+        
+        app.docs_executor.submit(self.ingest_event_docs, event_id, animal_id, files, progress,
+                                 on_done=on_done, on_error=on_error)
+    
+    @staticmethod
+    def ingest_event_docs(event_id, animal_id, paths, progress=None):
+        """(В рабочем потоке) копирование файлов в папку животного и ссылки на них"""
+        names = ingest.ingest_files(animal_id, paths, progress=progress)
+        MedicalTab.attach_event_docs(event_id, names)
+    
+    @staticmethod
+    def attach_event_docs(event_id, filenames):
+        """(В рабочем потоке) ссылки на файлы одной транзакцией"""
+        with database.transaction():
+            for filename in filenames:
+                database.add_event_doc(event_id, filename)
     
     def open_event_dialog(self, animal_id):
         """Открытие диалога создания события"""
-        dialog = EventDialog(self.frame, animal_id)
-        if dialog.result:
-            self.open_medical_card(animal_id)  # Обновляем карточку
+        # новое событие попадёт в ленту по шине изменений (on_event_changes)
+        EventDialog(self.frame, animal_id, self.app.docs_executor, self.executor)
     
     def notify_new_animal(self, animal_id):
         """Уведомление о новом животном"""
         self.notified_animals.add(animal_id)
         self.update_tab_title()
-        self.refresh_list()
         
-        # Запускаем мигание
-        full_name = f"ID:{animal_id}"
-        for idx, name in enumerate(self.med_names):
-            if name.startswith(full_name):
-                self.blink_list_item(idx)
-                break
+        # Запускаем мигание; если строка ещё не пришла по шине — мигнёт при добавлении
+        if animal_id in self.med_ids:
+            self.blink_list_item(animal_id)
+        else:
+            self.blink_on_add = animal_id
     
     def update_tab_title(self):
         """Обновление заголовка вкладки"""
@@ -636,65 +841,29 @@ class MedicalTab:
                 self.parent.tab(self.frame, text="Медицина", 
                               image=self.blank_img, compound='right')
     
-    def blink_list_item(self, index):
-        """Мигание элемента списка"""
-        if self.blink_timer is not None:
-            self.frame.after_cancel(self.blink_timer)
-            if self.blink_index is not None:
-                self.lst_med.itemconfig(self.blink_index, bg='')
-        
-        self.blink_index = index
-        self.blink_state = False
-        
-        def _blink():
-            color = 'yellow' if self.blink_state else ''
-            self.lst_med.itemconfig(self.blink_index, bg=color)
-            self.blink_state = not self.blink_state
-            self.blink_timer = self.frame.after(250, _blink)
-        
-        _blink()
+    def blink_list_item(self, animal_id):
+        """
+        Мигание строки животного (на общих часах анимации). Запоминается ID,
+        а не номер строки: строки выше могут удалиться, список — перерисоваться.
+        """
+        if self.blink_id is not None and self.blink_id != animal_id:
+            self.set_row_bg(self.blink_id, '')
+        self.blink_id = animal_id
+        self.app.animation.register(self.BLINK_KEY, self.blink_tick)
+    
+    def set_row_bg(self, animal_id, color):
+        """Фон строки животного, если она сейчас есть в списке"""
+        if self.list_loaded and animal_id in self.med_ids:
+            self.lst_med.itemconfig(self.med_ids.index(animal_id), bg=color)
+    
+    def blink_tick(self, phase):
+        """Один тик мигания"""
+        if self.blink_id is not None:
+            self.set_row_bg(self.blink_id, '' if phase else 'yellow')
     
     def stop_blink(self):
         """Остановка мигания"""
-        if self.blink_timer is not None:
-            self.frame.after_cancel(self.blink_timer)
-            self.blink_timer = None
-        if self.blink_index is not None:
-            self.lst_med.itemconfig(self.blink_index, bg='')
-            self.blink_index = None
-    
-    def on_motion(self, event):
-        """Обработчик движения мыши для тултипа"""
-        idx = self.lst_med.nearest(event.y)
-        bbox = self.lst_med.bbox(idx)
-        
-        if not bbox or idx >= len(self.med_names):
-            if self.tip:
-                self.tip.destroy()
-                self.tip = None
-            return
-        
-        x0, y0, w0, h0 = bbox
-        if event.y < y0 or event.y > y0 + h0:
-            if self.tip:
-                self.tip.destroy()
-                self.tip = None
-            return
-        
-        # Показываем тултип
-        full = self.med_names[idx]
-        if self.tip:
-            self.tip.destroy()
-        
-        self.tip = tk.Toplevel(self.lst_med)
-        self.tip.wm_overrideredirect(True)
-        abs_x = self.lst_med.winfo_rootx() + w0 + 2
-        abs_y = self.lst_med.winfo_rooty() + y0
-        self.tip.geometry(f"+{abs_x}+{abs_y}")
-        tk.Label(self.tip, text=full, background="lightyellow").pack()
-    
-    def on_leave(self, event):
-        """Обработчик ухода мыши"""
-        if self.tip:
-            self.tip.destroy()
-            self.tip = None
+        self.app.animation.unregister(self.BLINK_KEY)
+        if self.blink_id is not None:
+            self.set_row_bg(self.blink_id, '')
+            self.blink_id = None
@@ -0,0 +1,116 @@
+"""
+Глобальная строка поиска по животным, владельцам и медкартам
+"""
+import tkinter as tk
+from tkinter import ttk
+import database
+
+
+class SearchBar:
+    """Строка поиска с выпадающим списком найденного"""
+
+    # Задержка перед запросом, чтобы не искать на каждую букву
+    DEBOUNCE_MS = 250
+    MAX_VISIBLE_HITS = 8
+
+    def __init__(self, parent, app):
+        self.parent = parent
+        self.app = app
+        self.frame = ttk.Frame(parent)
+        self.hits = []
+        self.search_job = None
+        self.setup_ui()
+        self.setup_bindings()
+
+    def setup_ui(self):
+        """Создание интерфейса"""
+        self.frame.columnconfigure(1, weight=1)
+
+        ttk.Label(self.frame, text="Поиск:").grid(row=0, column=0, sticky='w', padx=(5, 2), pady=2)
+        self.entry = ttk.Entry(self.frame)
+        self.entry.grid(row=0, column=1, sticky='ew', padx=(0, 5), pady=2)
+
+        # Список результатов показывается только когда есть что показать
+        self.lst_hits = tk.Listbox(self.frame, height=self.MAX_VISIBLE_HITS, activestyle='none')
+
+    def setup_bindings(self):
+        """Настройка обработчиков событий"""
+        self.entry.bind("<KeyRelease>", self.on_key_release)
+        self.entry.bind("<Escape>", lambda e: self.clear())
+        self.entry.bind("<Down>", self.focus_hits)
+        self.entry.bind("<Return>", lambda e: self.open_hit(0))
+        self.lst_hits.bind("<Return>", lambda e: self.open_selected())
+        self.lst_hits.bind("<Double-1>", lambda e: self.open_selected())
+        self.lst_hits.bind("<Escape>", lambda e: self.clear())
+
+    def on_key_release(self, event):
+        """Отложенный запуск поиска после ввода"""
+        if event.keysym in ("Down", "Return", "Escape"):
+            return
+        if self.search_job is not None:
+            self.frame.after_cancel(self.search_job)
+        self.search_job = self.frame.after(self.DEBOUNCE_MS, self.run_search)
+
+    def run_search(self):
+        """Запускает поиск в фоне; предыдущий незавершённый запрос отменяется"""
+        self.search_job = None
+        self.app.executor.cancel(self)
+        self.app.executor.submit(database.search, self.entry.get(),
+                                 on_done=self.show_hits, group=self)
+
+    def show_hits(self, hits):
+        """Показывает результаты поиска"""
+        self.hits = hits
+        self.lst_hits.delete(0, 'end')
+
+        if not self.hits:
+            self.lst_hits.grid_forget()
+            return
+
+        for kind, ref_id, animal_id, animal_name, adopted, title, snippet in self.hits:
+            where = "передан" if adopted else "в приюте"
+            if kind == 'animal':
+                text = f"#{animal_id} {animal_name} ({where}) — {snippet}"
+            else:
+                text = f"#{animal_id} {animal_name}: событие {ref_id} «{title}» — {snippet}"
+            self.lst_hits.insert('end', text)
+
+        self.lst_hits.configure(height=min(len(self.hits), self.MAX_VISIBLE_HITS))
+        self.lst_hits.grid(row=1, column=0, columnspan=2, sticky='ew', padx=5, pady=(0, 5))
+
+    def focus_hits(self, event=None):
+        """Переход с поля ввода в список результатов"""
+        if self.hits:
+            self.lst_hits.focus_set()
+            self.lst_hits.selection_clear(0, 'end')
+            self.lst_hits.selection_set(0)
+            self.lst_hits.activate(0)
+
+    def open_selected(self):
+        """Открывает выбранный в списке результат"""
+        sel = self.lst_hits.curselection()
+        if sel:
+            self.open_hit(sel[0])
+
+    def open_hit(self, index):
+        """Переход к животному из результата поиска"""
+        if index >= len(self.hits):
+            return
+        _kind, _ref_id, animal_id, _name, adopted, _title, _snippet = self.hits[index]
+
+        if adopted:
+            # Медкарты переданных не открываются — показываем строку в таблице
+            tab = self.app.adopted_tab
+            self.app.notebook.select(tab.frame)
+            tab.show_animal(animal_id)
+        else:
+            self.app.medical_tab.open_medical_card(animal_id)
+        self.clear()
+
+    def clear(self):
+        """Очистка строки поиска"""
+        self.app.executor.cancel(self)
+        self.entry.delete(0, 'end')
+        self.hits = []
+        self.lst_hits.delete(0, 'end')
+        self.lst_hits.grid_forget()
@@ -2,30 +2,53 @@
 Вкладка "Приют" - основная таблица животных
 """
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog
 from datetime import date, timedelta
 import re
 from config import config
 from models import AnimalManager, Animal
 from utils import (
-    get_default_quarantine_cage, 
     format_species_display, 
     calculate_quarantine_days_left,
-    autofit_treeview_columns
 )
 from ui.dialogs import AdoptionDialog
+from ui.virtual_tree import VirtualTreeview
+from ui.tooltip import treeview_cell_resolver
 import database
+import importer
+import changes
 
 
 class ShelterTab:
     """Вкладка приюта с таблицей животных"""
     
-    def __init__(self, parent):
+    EXPIRED_COLOR = '#C8E6C9'
+    # Мигание строк с закончившимся карантином (см. ui.animation)
+    BLINK_KEY = 'shelter-expired'
+    BLINK_TICKS = 2
+    
+    # Больше изменений за одну транзакцию (импорт) — дешевле перечитать таблицу
+    RELOAD_THRESHOLD = 20
+    
+    # Колонки, по которым можно сортировать кликом на заголовок
+    SORT_COLUMNS = {
+        "ID": "id",
+        "Имя": "name",
+        "Вид": "species",
+        "Дата рождения": "birth_date",
+        "Дата поступления": "arrival_date",
+        "Клетка": "cage_number",
+        "Осталось дней карантина": "quarantine_until",
+    }
+    
+    def __init__(self, parent, executor, frame=None):
         self.parent = parent
-        self.frame = ttk.Frame(parent)
-        self.blink_timers = {}
+        self.executor = executor  # фоновые операции с БД (ui.db_executor)
+        self.frame = frame if frame is not None else ttk.Frame(parent)
+        self.visible = str(parent.select()) == str(self.frame)   # мигание — только на открытой вкладке
         self.setup_ui()
         self.setup_bindings()
+        changes.bus.subscribe(executor.in_tk(self.on_changes), changes.ANIMAL_TOPICS)
     
     def setup_ui(self):
         """Создание интерфейса вкладки"""
@@ -98,12 +121,16 @@ class ShelterTab:
         frm_buttons.grid(row=1, column=0, columnspan=2, sticky="ew", padx=5, pady=5)
         frm_buttons.columnconfigure(0, weight=1)
         frm_buttons.columnconfigure(1, weight=1)
+        frm_buttons.columnconfigure(2, weight=1)
         
         btn_add = ttk.Button(frm_buttons, text="Добавить", command=self.add_animal)
         btn_add.grid(row=0, column=0, sticky="ew", padx=5)
         
+        btn_import = ttk.Button(frm_buttons, text="Импорт из файла…", command=self.import_animals)
+        btn_import.grid(row=0, column=1, sticky="ew", padx=5)
+        
         btn_refresh = ttk.Button(frm_buttons, text="Обновить список", command=self.refresh_all_tabs)
-        btn_refresh.grid(row=0, column=1, sticky="ew", padx=5)
+        btn_refresh.grid(row=0, column=2, sticky="ew", padx=5)
     
     def create_animal_table(self):
         """Создание таблицы животных"""
@@ -113,12 +140,18 @@ class ShelterTab:
             "Med", "Adopt", "Del"
         )
         
-        table_frame = ttk.Frame(self.frame)
-        table_frame.grid(row=2, column=0, columnspan=2, sticky='nsew', padx=5, pady=5)
-        table_frame.columnconfigure(0, weight=1)
-        table_frame.rowconfigure(0, weight=1)
-        
-        self.tree = ttk.Treeview(table_frame, columns=self.columns, show='headings')
+        # Виртуальная таблица: в Treeview только видимые строки, данные — страницами
+        self.table = VirtualTreeview(
+            self.frame, self.columns,
+            fetch_page=lambda after, sort: database.get_animals_page(after, sort=sort),
+            count_rows=database.count_animals,
+            render_row=self.make_row,
+            sort_columns=self.SORT_COLUMNS,
+            executor=self.executor,
+        )
+        self.table.frame.grid(row=2, column=0, columnspan=2, sticky='nsew', padx=5, pady=5)
+        self.table.on_render = self.update_blinking
+        self.tree = self.table.tree
         
         # Настройка заголовков и ширин
         for col in self.columns:
@@ -126,15 +159,14 @@ class ShelterTab:
             if col in config.COLUMN_WIDTHS:
                 self.tree.column(col, width=config.COLUMN_WIDTHS[col], anchor='center')
         
-        # Скроллбар
-        vsb = ttk.Scrollbar(table_frame, orient='vertical', command=self.tree.yview)
-        self.tree.configure(yscrollcommand=vsb.set)
-        self.tree.grid(row=0, column=0, sticky='nsew')
-        vsb.grid(row=0, column=1, sticky='ns')
-        
         # Настройка тегов для раскраски
         self.tree.tag_configure('quarantine', background='#FFF59D')
-        self.tree.tag_configure('expired', background='#C8E6C9')
+        self.tree.tag_configure('expired', background=self.EXPIRED_COLOR)
+        self.plain_color = ttk.Style().lookup('Treeview', 'fieldbackground') or 'white'
+    
+    def setup_tooltips(self, tooltips):
+        """Полный текст обрезанных ячеек (имена, контакты) во всплывающей подсказке"""
+        tooltips.attach(self.tree, treeview_cell_resolver(self.tree, self.table.key_for_item))
     
     def setup_bindings(self):
         """Настройка обработчиков событий"""
@@ -144,16 +176,21 @@ class ShelterTab:
     
     def set_default_values(self):
         """Установка значений по умолчанию"""
-        try:
-            cage_numbers = database.get_all_cage_numbers()
-            default_cage = get_default_quarantine_cage(cage_numbers)
-            self.entry_cage.insert(0, default_cage)
-        except RuntimeError:
-            pass  # Если нет свободных клеток
+        # Первая свободная карантинная клетка из реестра (в фоне)
+        self.executor.submit(
+            database.next_free_cage, 'К',
+            on_done=self.set_default_cage,
+            on_error=lambda e: None,  # Если нет свободных клеток
+        )
         
         default_quarantine = (date.today() + timedelta(days=config.DEFAULT_QUARANTINE_DAYS)).isoformat()
         self.entry_quarantine.insert(0, default_quarantine)
     
+    def set_default_cage(self, cage):
+        """Подставляет предложенную клетку, если пользователь ещё ничего не ввёл"""
+        if not self.entry_cage.get().strip():
+            self.entry_cage.insert(0, cage)
+    
     def on_species_selected(self, event):
         """Обработчик выбора вида"""
         species = self.combobox_species.get()
@@ -183,10 +220,7 @@ class ShelterTab:
                 messagebox.showwarning("Ошибка", "Выберите вид")
                 return
             
-            # Проверяем, что клетка не занята
-            if cage in database.get_all_cage_numbers():
-                messagebox.showwarning("Ошибка", f"Клетка {cage} уже занята")
-                return
+            # Занятость клетки проверяет реестр в транзакции записи (см. on_error ниже)
             
             # Формирование полного названия вида
             full_species = format_species_display(species, breed)
@@ -224,30 +258,60 @@ class ShelterTab:
                 messagebox.showwarning("Ошибка", "Неправильный формат даты окончания карантина")
                 return
             
-            # Сохраняем в базу и получаем новый ID
-            new_id = database.add_animal(
+            # Сохраняем в базу в фоне; ID придёт в on_animal_added
+            self.executor.submit(
+                database.add_animal,
                 name, full_species, bdate.isoformat(), est_flag,
-                arrival_date, cage, quarantine_until
+                arrival_date, cage, quarantine_until,
+                on_done=self.on_animal_added,
+                on_error=lambda e: messagebox.showerror(
+                    "Ошибка", f"Не удалось добавить животное: {str(e)}"),
             )
             
-            # Создание папки для документов
-            import os
-            os.makedirs(f"docs/{new_id}", exist_ok=True)
-            
-            messagebox.showinfo("Готово", f"Животное добавлено с ID {new_id}")
-            
-            # Очистка формы и обновление всех списков
-            self.clear_form()
-            self.refresh_all_tabs()
-            
-            # Уведомление медицинской вкладки о новом животном
-            app = self.get_app()
-            if app:
-                app.medical_tab.notify_new_animal(new_id)
-            
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось добавить животное: {str(e)}")
     
+    def on_animal_added(self, new_id):
+        """Животное сохранено: папка документов, сообщение, уведомление медицины"""
+        # Создание папки для документов
+        import os
+        os.makedirs(f"docs/{new_id}", exist_ok=True)
+        
+        messagebox.showinfo("Готово", f"Животное добавлено с ID {new_id}")
+        
+        # Очистка формы; списки обновятся по шине изменений
+        self.clear_form()
+        
+        # Уведомление медицинской вкладки о новом животном
+        app = self.get_app()
+        if app:
+            app.medical_tab.notify_new_animal(new_id)
+    
+    def import_animals(self):
+        """Пакетный импорт животных из CSV/JSONL"""
+        path = filedialog.askopenfilename(
+            title="Выберите файл для импорта",
+            filetypes=[("CSV / JSONL", "*.csv *.jsonl *.ndjson"), ("Все файлы", "*.*")]
+        )
+        if not path:
+            return
+        
+        self.executor.submit(
+            importer.import_animals, path,
+            on_done=self.on_import_done,
+            on_error=lambda e: messagebox.showerror("Ошибка", f"Не удалось импортировать: {str(e)}"),
+        )
+    
+    def on_import_done(self, report):
+        """Итог импорта (списки обновятся по шине изменений, один reload на весь импорт)"""
+        if report.errors:
+            messagebox.showwarning("Импорт завершён", report.format())
+        else:
+            messagebox.showinfo("Импорт завершён", report.format())
+        
+        if report.imported_ids:
+            self.clear_form()
+    
     def clear_form(self):
         """Очистка формы"""
         self.entry_name.delete(0, 'end')
@@ -271,62 +335,101 @@ class ShelterTab:
             app.refresh_all_tabs()
     
     def refresh_list(self):
-        """Обновление списка животных"""
-        # Останавливаем все мигания
-        for item, timer in list(self.blink_timers.items()):
-            self.frame.after_cancel(timer)
-        self.blink_timers.clear()
-        
-        # Очищаем таблицу
-        self.tree.delete(*self.tree.get_children())
-        
-        # Загружаем животных
+        """Обновление списка животных (перечитывается только видимое окно)"""
+        self.table.reload()
+    
+    def on_changes(self, batch):
+        """Точечное обновление таблицы по шине изменений"""
+        if len(batch) > self.RELOAD_THRESHOLD or any(c.topic == changes.RESET for c in batch):
+            self.refresh_list()
+            return
+        self.executor.submit(self.load_changed_rows, batch, on_done=self.apply_changes)
+    
+    @staticmethod
+    def load_changed_rows(batch):
+        """(В рабочем потоке) свежие строки для добавленных и изменённых животных"""
+        return [
+            (change, database.get_animal_by_id(change.id)
+             if change.topic in (changes.ANIMAL_ADDED, changes.ANIMAL_UPDATED) else None)
+            for change in batch
+        ]
+    
+    def apply_changes(self, loaded):
+        """Применяет изменения к таблице"""
+        for change, row in loaded:
+            if change.topic == changes.ANIMAL_ADDED:
+                if row:
+                    self.table.add_row(row[:8])
+            elif change.topic == changes.ANIMAL_UPDATED:
+                if self.table.sort in change.fields:
+                    self.table.reload()  # строка могла сменить место
+                elif row:
+                    self.table.update_row(change.id, row[:8])
+            else:
+                # передано или удалено — из приюта уходит
+                self.table.remove_row(change.id)
+    
+    def on_shown(self):
+        """Вкладку снова открыли — догружаем недостающее"""
+        self.visible = True
+        self.table.render()
+    
+    def on_hidden(self):
+        """Вкладку закрыли — фоновая подгрузка таблицы и мигание больше не нужны"""
+        self.visible = False
+        self.table.cancel_loading()
+        self.app.animation.unregister(self.BLINK_KEY)
+    
+    def make_row(self, row):
+        """Значения и теги строки таблицы для записи из БД"""
+        (id_, name, full_species, bd, est_flag,
+         arr, cage, quarantine_until) = row
         today = date.today()
-        for (id_, name, full_species, bd, est_flag,
-             arr, cage, quarantine_until) in database.get_all_animals():
 
-            # возраст
-            bdate = date.fromisoformat(bd)
-            months = (today.year * 12 + today.month) - (bdate.year * 12 + bdate.month)
-            age_disp = f"~{months}" if est_flag else str(months)
-            bd_disp = f"~{bd}" if est_flag else bd
+        # возраст
+        bdate = date.fromisoformat(bd)
+        months = (today.year * 12 + today.month) - (bdate.year * 12 + bdate.month)
+        age_disp = f"~{months}" if est_flag else str(months)
+        bd_disp = f"~{bd}" if est_flag else bd
 
-            # вычисляем дни до конца карантина и выбираем теги
-            days_left = ""
-            tags = ()
-            if cage.startswith("К") and quarantine_until:
-                try:
-                    qdate = date.fromisoformat(quarantine_until)
-                    days_left = max((qdate - today).days, 0)
-                except:
-                    days_left = ""
-                if days_left > 0:
-                    tags = ('quarantine',)
-                else:
-                    tags = ('expired',)
-            
-            values = (
-                id_, name, full_species,
-                bd_disp, age_disp,
-                arr or "",
-                cage, days_left,"📋", "🤝", "🗑"
-            )
-            item = self.tree.insert('', 'end', values=values, tags=tags)
-
-            # если карантин закончился — запускаем мигание
-            if 'expired' in tags:
-                self.blink_row(item)
-    
-    def blink_row(self, item):
-        """Мигание строки"""
-        current = list(self.tree.item(item, 'tags'))
-        if 'expired' in current:
-            new_tags = [t for t in current if t != 'expired']
-        else:
-            new_tags = current + ['expired']
+        # вычисляем дни до конца карантина и выбираем теги
+        days_left = ""
+        tags = ()
+        if cage and cage.startswith("К") and quarantine_until:
+            try:
+                qdate = date.fromisoformat(quarantine_until)
+                days_left = max((qdate - today).days, 0)
+            except:
+                days_left = ""
+            if days_left > 0:
+                tags = ('quarantine',)
+            else:
+                tags = ('expired',)
         
-        self.tree.item(item, tags=new_tags)
-        self.blink_timers[item] = self.frame.after(500, lambda: self.blink_row(item))
+        values = (
+            id_, name, full_species,
+            bd_disp, age_disp,
+            arr or "",
+            cage, days_left,"📋", "🤝", "🗑"
+        )
+        return values, tags
+    
+    def update_blinking(self):
+        """
+        Мигание строк с закончившимся карантином. Мигает сам тег 'expired'
+        (общие часы меняют его цвет), поэтому на строку не нужно ни таймера,
+        ни перестановки тегов; анимация нужна, только пока такие строки видны.
+        """
+        clock = self.app.animation
+        if self.visible and self.tree.tag_has('expired'):
+            if not clock.is_registered(self.BLINK_KEY):
+                clock.register(self.BLINK_KEY, self.blink_expired, period=self.BLINK_TICKS)
+        else:
+            clock.unregister(self.BLINK_KEY)
+    
+    def blink_expired(self, phase):
+        """Один тик мигания: цвет тега 'expired' для всех строк сразу"""
+        self.tree.tag_configure('expired', background=self.EXPIRED_COLOR if phase else self.plain_color)
     
     def on_tree_click(self, event):
         """Обработчик кликов по таблице"""
@@ -341,7 +444,10 @@ class ShelterTab:
         if not row_id:
             return
         
-        animal_id = int(self.tree.item(row_id)["values"][0])
+        row = self.table.row_for_item(row_id)
+        if row is None:
+            return  # строка ещё загружается
+        animal_id = row[0]
         
         if col_name == "Med":
             # Открыть медицинскую карточку
@@ -354,8 +460,7 @@ class ShelterTab:
         elif col_name == "Del":
             # Удалить животное
             if messagebox.askyesno("Подтверждение", f"Удалить животное с ID {animal_id}?"):
-                database.delete_animal(animal_id)
-                self.refresh_all_tabs()
+                self.executor.submit(database.delete_animal, animal_id)
     
     def on_double_click(self, event):
         """Обработчик двойного клика для редактирования"""
@@ -368,7 +473,7 @@ class ShelterTab:
             return
 
         row_id = self.tree.identify_row(event.y)
-        if not row_id:
+        if not row_id or self.table.row_for_item(row_id) is None:
             return
 
         # Получаем имя поля в БД
@@ -391,11 +496,7 @@ class ShelterTab:
                     messagebox.showwarning("Ошибка", "Номер клетки должен быть вида 'К0000' или 'О0000'")
                     entry.focus()
                     return
-                occupied = database.get_all_cage_numbers()
-                if new_value in occupied and new_value != old_value:
-                    messagebox.showwarning("Ошибка", f"Клетка {new_value} уже занята")
-                    entry.focus()
-                    return
+                # занятость проверит реестр клеток при записи
 
             # Валидация даты окончания карантина
             if field == "quarantine_until":
@@ -408,15 +509,15 @@ class ShelterTab:
 
             # Общий случай — правка любого другого поля
             animal_id = self.tree.item(row_id)["values"][0]
-            database.update_animal_field(animal_id, field, new_value)
             entry.destroy()
-            self.refresh_all_tabs()
+            self.executor.submit(
+                database.update_animal_field, animal_id, field, new_value,
+                on_error=lambda e: messagebox.showwarning("Ошибка", str(e)),
+            )
 
         entry.bind("<Return>", save_edit)
         entry.bind("<FocusOut>", save_edit)
     
     def open_adoption_dialog(self, animal_id):
         """Открытие диалога усыновления"""
-        dialog = AdoptionDialog(self.frame, animal_id)
-        if dialog.result:
-            self.refresh_all_tabs()
+        AdoptionDialog(self.frame, animal_id, self.executor)
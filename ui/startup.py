@@ -0,0 +1,61 @@
+"""
+Замер времени запуска: сколько заняли импорт, база, окно и первая отрисовка
+
+Отчёт печатается в stderr, если задана переменная окружения
+SHELTER_STARTUP_REPORT=1, и дописывается строкой JSON в файл, если
+SHELTER_STARTUP_REPORT=<путь>. Так регрессии времени запуска видны
+без профилировщика: достаточно сравнить строки отчёта.
+"""
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+ENV_VAR = "SHELTER_STARTUP_REPORT"
+
+# Отсчёт — с первого импорта модуля (main.py импортирует его раньше остального)
+_T0 = time.perf_counter()
+
+
+class StartupTimer:
+    """Отметки этапов запуска: mark('этап') — время от старта в мс"""
+
+    def __init__(self, t0: float = _T0):
+        self.t0 = t0
+        self.marks = []      # [(этап, мс от старта)]
+        self.reported = False
+
+    def mark(self, stage: str) -> float:
+        elapsed = (time.perf_counter() - self.t0) * 1000
+        self.marks.append((stage, elapsed))
+        return elapsed
+
+    def format(self) -> str:
+        """Отчёт: этап, время от старта и длительность этапа"""
+        lines = ["Запуск ShelterApp (мс):"]
+        previous = 0.0
+        for stage, elapsed in self.marks:
+            lines.append(f"  {stage:<20} {elapsed:8.1f}  (+{elapsed - previous:.1f})")
+            previous = elapsed
+        return "\n".join(lines)
+
+    def report(self, target=None):
+        """
+        Выводит отчёт один раз. target — '1' (stderr), путь к файлу (JSON-строка)
+        или None — взять из SHELTER_STARTUP_REPORT; пустое значение — не выводить.
+        """
+        if self.reported:
+            return
+        self.reported = True
+        target = os.environ.get(ENV_VAR, "") if target is None else target
+        if not target or target == "0":
+            return
+        if target == "1":
+            print(self.format(), file=sys.stderr)
+            return
+        with open(target, "a", encoding="utf-8") as f:
+            f.write(json.dumps({
+                'time': datetime.now().isoformat(timespec='seconds'),
+                'marks': {stage: round(elapsed, 1) for stage, elapsed in self.marks},
+            }, ensure_ascii=False) + "\n")
@@ -0,0 +1,158 @@
+"""
+Измерение ширины текста с кэшем и подгонка колонок Treeview без полного пересчёта
+
+font.measure — это обращение к Tk; при обновлении таблицы и списка
+медкарт одинаковые строки измерялись тысячи раз. Здесь ширина строки
+запоминается в ограниченном LRU-кэше по ключу (шрифт, текст), а ширины
+колонок хранятся как текущий максимум по строкам и меняются только при
+добавлении, изменении и удалении строк.
+"""
+from collections import Counter
+from tkinter import font as tkfont
+
+from cache import LRUCache
+
+MEASURE_CACHE_SIZE = 8192
+TRUNCATE_CACHE_SIZE = 2048
+ELLIPSIS = '...'
+
+
+class TextMeasurer:
+    """
+    Ширина строк в пикселях через общий кэш.
+    Шрифт — объект tkinter.font.Font или имя шрифта Tk ('TkDefaultFont').
+    """
+
+    def __init__(self, max_size: int = MEASURE_CACHE_SIZE,
+                 truncate_size: int = TRUNCATE_CACHE_SIZE):
+        self.widths = LRUCache(max_size)
+        self.truncated = LRUCache(truncate_size)
+        self.fonts = {}   # имя шрифта -> Font
+
+    def font(self, font=None):
+        """Объект Font по имени (по умолчанию — TkDefaultFont)"""
+        if font is None:
+            font = "TkDefaultFont"
+        if isinstance(font, str):
+            if font not in self.fonts:
+                self.fonts[font] = tkfont.nametofont(font)
+            return self.fonts[font]
+        return font
+
+    def measure(self, text: str, font=None) -> int:
+        """Ширина text в пикселях"""
+        font = self.font(font)
+        return self.widths.get_or_load((str(font), text), lambda: font.measure(text))
+
+    def truncate(self, text: str, max_width: int, font=None) -> str:
+        """text, обрезанный с '...' до ширины max_width"""
+        font = self.font(font)
+        return self.truncated.get_or_load(
+            (str(font), text, max_width), lambda: self._truncate(text, max_width, font))
+
+    def _truncate(self, text: str, max_width: int, font) -> str:
+        if self.measure(text, font) <= max_width:
+            return text
+        # бинарный поиск максимальной длины подстроки, влезающей вместе с '...'
+        lo, hi = 0, len(text)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if font.measure(text[:mid] + ELLIPSIS) <= max_width:
+                lo = mid + 1
+            else:
+                hi = mid
+        # lo — первая неподходящая длина, поэтому обрезаем на lo-1
+        return text[:lo - 1] + ELLIPSIS if lo > 0 else ELLIPSIS
+
+    def clear(self):
+        """Сбросить кэш (например, после смены размера шрифта)"""
+        self.widths.clear()
+        self.truncated.clear()
+
+    def stats(self) -> dict:
+        return {'measure': self.widths.stats(), 'truncate': self.truncated.stats()}
+
+
+# Общий для всех вкладок экземпляр
+measurer = TextMeasurer()
+
+
+class ColumnAutofit:
+    """
+    Ширины колонок Treeview по содержимому, пересчитываемые по изменённым строкам.
+
+    Для каждой колонки хранится счётчик ширин ячеек (ширина -> число строк)
+    и текущий максимум. add/update/remove стоят O(число колонок); максимум
+    пересчитывается только когда удалена последняя ячейка максимальной ширины.
+    apply() меняет в Treeview ширину только тех колонок, у которых она изменилась.
+    """
+
+    def __init__(self, columns, padding: int = 10, font=None, text_measurer=None):
+        self.columns = tuple(columns)
+        self.padding = padding
+        self.font = font
+        self.measurer = text_measurer or measurer
+        self.rows = {}      # ключ строки -> (значения, ширины)
+        self.counts = [Counter() for _ in self.columns]
+        self.maxima = [0] * len(self.columns)
+        self.applied = {}   # колонка -> ширина, выставленная в Treeview
+        self.heading_widths = None
+
+    def headings(self):
+        """Ширины заголовков — нижняя граница колонок (меряются при первом apply)"""
+        if self.heading_widths is None:
+            self.heading_widths = [self.measurer.measure(col, self.font) for col in self.columns]
+        return self.heading_widths
+
+    def update(self, key, values):
+        """Строка добавлена или изменилась"""
+        values = tuple(str(v) for v in values)
+        old = self.rows.get(key)
+        if old is not None and old[0] == values:
+            return
+        widths = tuple(self.measurer.measure(v, self.font) for v in values[:len(self.columns)])
+        if old is not None:
+            self._discard(old[1])
+        self.rows[key] = (values, widths)
+        for i, w in enumerate(widths):
+            self.counts[i][w] += 1
+            if w > self.maxima[i]:
+                self.maxima[i] = w
+
+    add = update
+
+    def remove(self, key):
+        """Строка удалена"""
+        old = self.rows.pop(key, None)
+        if old is not None:
+            self._discard(old[1])
+
+    def _discard(self, widths):
+        for i, w in enumerate(widths):
+            counts = self.counts[i]
+            counts[w] -= 1
+            if counts[w] <= 0:
+                del counts[w]
+                if w == self.maxima[i]:
+                    self.maxima[i] = max(counts, default=0)
+
+    def clear(self):
+        """Все строки перечитываются"""
+        self.rows.clear()
+        self.counts = [Counter() for _ in self.columns]
+        self.maxima = [0] * len(self.columns)
+
+    def widths(self) -> dict:
+        """{колонка: ширина с отступом}"""
+        return {col: max(head, content) + self.padding
+                for col, head, content in zip(self.columns, self.headings(), self.maxima)}
+
+    def apply(self, tree):
+        """Выставляет в tree изменившиеся ширины; возвращает число изменённых колонок"""
+        changed = 0
+        for col, width in self.widths().items():
+            if self.applied.get(col) != width:
+                tree.column(col, width=width)
+                self.applied[col] = width
+                changed += 1
+        return changed
@@ -0,0 +1,118 @@
+"""
+Всплывающие подсказки: одно окно на всё приложение, задержка и кэш текста
+"""
+import tkinter as tk
+
+from cache import LRUCache
+from ui.text_metrics import measurer
+
+TOOLTIP_CACHE_SIZE = 1024
+
+
+class TooltipManager:
+    """
+    Подсказки при наведении мыши.
+
+    Окно подсказки (Toplevel с Label) создаётся один раз и дальше только
+    прячется и показывается в новом месте. Виджет подключается через
+    attach(widget, resolve): resolve(event) -> (ключ, loader) или None,
+    где loader() возвращает текст (None — подсказка не нужна). Пока мышь
+    над тем же ключом, <Motion> ничего не делает; текст по ключу
+    запоминается в LRU-кэше, так что loader вызывается один раз.
+    """
+
+    DELAY_MS = 400
+    OFFSET = 12
+    BACKGROUND = "lightyellow"
+
+    def __init__(self, root, delay_ms: int = DELAY_MS):
+        self.root = root
+        self.delay_ms = delay_ms
+        self.texts = LRUCache(TOOLTIP_CACHE_SIZE)
+        self.window = None
+        self.label = None
+        self.key = None        # ключ, над которым сейчас мышь
+        self.show_job = None
+        self.shown = False
+
+    def attach(self, widget, resolve):
+        """Подсказки для widget; resolve(event) -> (ключ, loader) | None"""
+        widget.bind("<Motion>", lambda e: self.on_motion(e, resolve), add='+')
+        for sequence in ("<Leave>", "<ButtonPress>", "<MouseWheel>", "<Button-4>", "<Button-5>"):
+            widget.bind(sequence, lambda e: self.hide(), add='+')
+
+    def on_motion(self, event, resolve):
+        target = resolve(event)
+        key = target[0] if target else None
+        if key == self.key:
+            if self.shown:
+                self.place(event.x_root, event.y_root)
+            return
+        self.hide()
+        if target is None:
+            return
+        self.key = key
+        x, y = event.x_root, event.y_root
+        self.show_job = self.root.after(self.delay_ms, lambda: self.show(target, x, y))
+
+    def show(self, target, x, y):
+        """Показ после задержки: текст — из кэша или loader()"""
+        self.show_job = None
+        key, loader = target
+        text = self.texts.get_or_load(key, loader)
+        if not text:
+            return
+        if self.window is None:
+            self.window = tk.Toplevel(self.root)
+            self.window.wm_overrideredirect(True)
+            self.window.withdraw()
+            self.label = tk.Label(self.window, background=self.BACKGROUND,
+                                  relief='solid', borderwidth=1, justify='left')
+            self.label.pack()
+        self.label.configure(text=text)
+        self.place(x, y)
+        self.window.deiconify()
+        self.window.lift()
+        self.shown = True
+
+    def place(self, x, y):
+        self.window.geometry(f"+{x + self.OFFSET}+{y + self.OFFSET}")
+
+    def hide(self):
+        """Прячет подсказку (окно остаётся для следующего показа)"""
+        if self.show_job is not None:
+            self.root.after_cancel(self.show_job)
+            self.show_job = None
+        if self.shown:
+            self.window.withdraw()
+            self.shown = False
+        self.key = None
+
+    def forget(self, *keys):
+        """Сбрасывает закэшированный текст (данные изменились)"""
+        self.texts.invalidate(*keys)
+
+    def clear(self):
+        self.texts.clear()
+
+
+def treeview_cell_resolver(tree, row_key=None, padding: int = 10, font=None):
+    """
+    resolve для attach(): подсказка с полным текстом ячейки Treeview,
+    если он не помещается в ширину колонки. row_key(iid) — ключ строки
+    (для виртуальной таблицы — ключ данных, а не элемент пула).
+    """
+    def resolve(event):
+        if tree.identify_region(event.x, event.y) != "cell":
+            return None
+        iid = tree.identify_row(event.y)
+        column = tree.identify_column(event.x)
+        if not iid or not column:
+            return None
+        text = str(tree.set(iid, column))
+        width = int(tree.column(column, 'width'))
+        if not text or measurer.measure(text, font) + padding <= width:
+            return None
+        key = (str(tree), row_key(iid) if row_key else iid, column, text, width)
+        return key, lambda: text
+    return resolve
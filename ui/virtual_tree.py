@@ -0,0 +1,335 @@
+"""
+Виртуальная таблица: ttk.Treeview, в котором существуют только видимые строки
+"""
+from tkinter import ttk
+
+
+class VirtualTreeview:
+    """
+    Таблица с виртуальной прокруткой.
+
+    Данные подгружаются страницами через fetch_page(after, sort) -> (rows, next_after)
+    (см. database.get_animals_page). В Treeview живёт только пул элементов
+    размером с видимое окно: при прокрутке элементам пула присваиваются
+    значения других строк, а не создаются новые.
+
+    Если передан executor (ui.db_executor.DBExecutor), страницы и счётчик
+    читаются в фоне, а ещё не загруженные строки показываются заглушками.
+
+    autofit (ui.text_metrics.ColumnAutofit) — ширины колонок по показанным
+    строкам; пересчитываются только строки, которые изменились.
+    """
+
+    # Сколько строк держать загруженными ниже видимого окна
+    PREFETCH_ROWS = 50
+    WHEEL_STEP = 3
+    DEFAULT_ROW_HEIGHT = 20
+    PLACEHOLDER = "…"
+
+    def __init__(self, parent, columns, fetch_page, count_rows, render_row,
+                 key=lambda row: row[0], sort='id', sort_columns=None, executor=None,
+                 autofit=None):
+        self.frame = ttk.Frame(parent)
+        self.frame.columnconfigure(0, weight=1)
+        self.frame.rowconfigure(0, weight=1)
+
+        self.tree = ttk.Treeview(self.frame, columns=columns, show='headings')
+        self.vsb = ttk.Scrollbar(self.frame, orient='vertical', command=self.on_scrollbar)
+        self.tree.grid(row=0, column=0, sticky='nsew')
+        self.vsb.grid(row=0, column=1, sticky='ns')
+
+        self.fetch_page = fetch_page      # (after, sort) -> (rows, next_after)
+        self.count_rows = count_rows      # () -> int
+        self.render_row = render_row      # row -> (values, tags)
+        self.key = key                    # row -> ключ строки (ID животного)
+        self.sort = sort
+        self.executor = executor
+        self.autofit = autofit
+        self.on_render = None             # вызывается после перерисовки окна
+
+        self.rows = []            # загруженные строки по порядку
+        self.key_index = {}       # ключ -> индекс в self.rows
+        self.next_after = None
+        self.exhausted = False
+        self.loading = False      # запрошена страница, ответа ещё нет
+        self.pending_key = None   # show_key ждёт, пока строка догрузится
+        self.total = 0
+        self.first = 0            # индекс первой видимой строки
+        self.pool = []            # iid элементов Treeview
+        self.item_rows = {}       # iid -> строка
+        self.key_items = {}       # ключ -> iid (строки текущего окна)
+        self.selected_key = None
+        self.rendered_selection = ()  # выделение, выставленное самой render()
+
+        for col, sort_key in (sort_columns or {}).items():
+            self.tree.heading(col, command=lambda s=sort_key: self.sort_by(s))
+
+        self.tree.bind("<Configure>", lambda e: self.render())
+        self.tree.bind("<MouseWheel>", self.on_wheel)
+        self.tree.bind("<Button-4>", self.on_wheel)
+        self.tree.bind("<Button-5>", self.on_wheel)
+        self.tree.bind("<Up>", lambda e: self.on_arrow(-1))
+        self.tree.bind("<Down>", lambda e: self.on_arrow(1))
+        self.tree.bind("<<TreeviewSelect>>", self.on_select, add='+')
+
+    # --- данные ---
+
+    def call(self, fn, on_done, *args):
+        """fn(*args) в фоне через executor (или сразу, если его нет) и on_done(результат)"""
+        if self.executor is None:
+            on_done(fn(*args))
+        else:
+            self.executor.submit(fn, *args, on_done=on_done, group=self)
+
+    def reload(self, keep_position=True):
+        """Сбрасывает загруженные строки и перечитывает окно из БД"""
+        self.cancel_loading()
+        self.rows = []
+        self.key_index.clear()
+        if self.autofit is not None:
+            self.autofit.clear()
+        self.next_after = None
+        self.exhausted = False
+        if not keep_position:
+            self.first = 0
+        self.call(self.count_rows, self.on_count)
+        self.render()
+
+    def cancel_loading(self):
+        """Отменяет фоновые запросы (вкладку закрыли или данные перечитываются)"""
+        if self.executor is not None:
+            self.executor.cancel(self)
+        self.loading = False
+
+    def request_page(self):
+        """Запрашивает следующую страницу, если она нужна и ещё не запрошена"""
+        if self.loading or self.exhausted:
+            return
+        self.loading = True
+        self.call(self.fetch_page, self.on_page, self.next_after, self.sort)
+
+    def on_count(self, total):
+        if not self.exhausted:
+            self.total = total
+            self.update_scrollbar()
+
+    def on_page(self, result):
+        """Страница получена: дописываем строки и перерисовываем окно"""
+        rows, self.next_after = result
+        self.loading = False
+        start = len(self.rows)
+        self.rows.extend(rows)
+        for index, row in enumerate(rows, start):
+            self.key_index[self.key(row)] = index
+        self.exhausted = self.next_after is None
+        if self.exhausted:
+            self.total = len(self.rows)
+
+        if self.pending_key is not None:
+            index = self.index_of(self.pending_key)
+            if index is not None:
+                self.selected_key, self.pending_key = self.pending_key, None
+                self.first = max(0, index - self.visible_count() // 2)
+            elif not self.exhausted:
+                self.request_page()
+                return
+            else:
+                self.pending_key = None
+        self.render()
+
+    def sort_by(self, sort):
+        """Смена сортировки (по клику на заголовок)"""
+        self.sort = sort
+        self.reload(keep_position=False)
+
+    def index_of(self, key):
+        """Индекс загруженной строки с ключом key (None — не загружена)"""
+        return self.key_index.get(key)
+
+    def add_row(self, row):
+        """
+        Новая строка без перечитывания таблицы. При сортировке по ID она
+        последняя: дописываем, если всё уже загружено, иначе её подгрузит
+        следующая страница. При другой сортировке место неизвестно — reload.
+        """
+        if self.sort != 'id':
+            self.reload()
+            return
+        self.total += 1
+        if self.exhausted:
+            self.key_index[self.key(row)] = len(self.rows)
+            self.rows.append(row)
+        self.render()
+
+    def update_row(self, key, row):
+        """Заменяет загруженную строку; перерисовывается только её элемент"""
+        index = self.index_of(key)
+        if index is None:
+            return False
+        self.rows[index] = row
+        iid = self.key_items.get(key)
+        if iid is not None:
+            values, tags = self.render_row(row)
+            self.tree.item(iid, values=values, tags=tags)
+            self.item_rows[iid] = row
+            if self.autofit is not None:
+                self.autofit.update(key, values)
+                self.autofit.apply(self.tree)
+            if self.on_render:
+                self.on_render()
+        return True
+
+    def remove_row(self, key):
+        """Убирает строку (удаление, передача) без перечитывания таблицы"""
+        index = self.index_of(key)
+        if self.autofit is not None:
+            self.autofit.remove(key)
+        if index is not None:
+            del self.rows[index]
+            del self.key_index[key]
+            # строки ниже сдвинулись на одну (правка словаря, без обращений к Tk)
+            for shifted, row in enumerate(self.rows[index:], index):
+                self.key_index[self.key(row)] = shifted
+            self.total = max(0, self.total - 1)
+            if index < self.first:
+                self.first -= 1
+        elif self.exhausted:
+            return  # всё загружено, а строки нет — она не из этой таблицы
+        else:
+            self.call(self.count_rows, self.on_count)
+        if self.selected_key == key:
+            self.selected_key = None
+        self.render()
+
+    def row_for_item(self, iid):
+        """Строка данных, показанная в элементе iid"""
+        return self.item_rows.get(iid)
+
+    def key_for_item(self, iid):
+        """Ключ строки, показанной в элементе iid (для заглушки — сам iid)"""
+        row = self.item_rows.get(iid)
+        return self.key(row) if row is not None else iid
+
+    def show_key(self, key):
+        """Прокручивает к строке с ключом key и выделяет её (при необходимости догрузив страницы)"""
+        index = self.index_of(key)
+        if index is None:
+            if not self.exhausted:
+                self.pending_key = key
+                self.request_page()
+            return
+        self.selected_key = key
+        self.first = max(0, index - self.visible_count() // 2)
+        self.render()
+
+    # --- отрисовка ---
+
+    def visible_count(self):
+        """Сколько строк помещается в видимой области"""
+        height = self.tree.winfo_height()
+        header = 0
+        row_height = self.DEFAULT_ROW_HEIGHT
+        if self.pool:
+            bbox = self.tree.bbox(self.pool[0])
+            if bbox:
+                header, row_height = bbox[1], bbox[3]
+        return max(1, (height - header) // max(1, row_height))
+
+    def render(self):
+        """Заполняет пул элементов строками текущего окна"""
+        count = self.visible_count()
+        if len(self.rows) < self.first + count + self.PREFETCH_ROWS and not self.loading:
+            self.request_page()
+            if self.executor is None and not self.exhausted:
+                return  # страница загружена синхронно, on_page уже перерисовал окно
+        if self.exhausted:
+            self.first = max(0, min(self.first, len(self.rows) - count))
+        window = self.rows[self.first:self.first + count]
+        # ещё не загруженные строки — заглушки
+        placeholders = 0 if self.exhausted else count - len(window)
+
+        while len(self.pool) < len(window) + placeholders:
+            self.pool.append(self.tree.insert('', 'end'))
+        while len(self.pool) > len(window) + placeholders:
+            self.tree.delete(self.pool.pop())
+
+        self.item_rows.clear()
+        self.key_items.clear()
+        selected = ()
+        for iid, row in zip(self.pool, window):
+            key = self.key(row)
+            values, tags = self.render_row(row)
+            self.tree.item(iid, values=values, tags=tags)
+            self.item_rows[iid] = row
+            self.key_items[key] = iid
+            if self.autofit is not None:
+                self.autofit.update(key, values)
+            if self.selected_key is not None and key == self.selected_key:
+                selected = (iid,)
+        for iid in self.pool[len(window):]:
+            self.tree.item(iid, values=(self.PLACEHOLDER,), tags=('loading',))
+        self.rendered_selection = selected
+        self.tree.selection_set(selected)
+        self.tree.yview_moveto(0)
+        self.update_scrollbar()
+        if self.autofit is not None and window:
+            self.autofit.apply(self.tree)
+
+        if self.on_render:
+            self.on_render()
+
+    def update_scrollbar(self):
+        count = self.visible_count()
+        total = max(self.total, len(self.rows), 1)
+        self.vsb.set(self.first / total, min(1.0, (self.first + count) / total))
+
+    def scroll_to(self, first):
+        """Смена первой видимой строки"""
+        last = max(self.total, len(self.rows)) - self.visible_count()
+        first = max(0, min(first, last))
+        if first != self.first:
+            self.first = first
+            self.render()
+
+    # --- обработчики ---
+
+    def on_scrollbar(self, *args):
+        """Команда скроллбара: moveto <доля> / scroll <n> units|pages"""
+        if args[0] == 'moveto':
+            self.scroll_to(int(float(args[1]) * max(self.total, len(self.rows))))
+        elif args[0] == 'scroll':
+            step = int(args[1])
+            if args[2] == 'pages':
+                step *= self.visible_count()
+            self.scroll_to(self.first + step)
+
+    def on_wheel(self, event):
+        """Прокрутка колесом мыши (Windows/macOS — delta, X11 — Button-4/5)"""
+        if event.num == 4 or getattr(event, 'delta', 0) > 0:
+            self.scroll_to(self.first - self.WHEEL_STEP)
+        else:
+            self.scroll_to(self.first + self.WHEEL_STEP)
+        return "break"
+
+    def on_arrow(self, step):
+        """Стрелки на краю окна прокручивают таблицу"""
+        focus = self.tree.focus()
+        if not self.pool or focus not in self.pool:
+            return None
+        edge = self.pool[0] if step < 0 else self.pool[-1]
+        if focus != edge:
+            return None
+        self.scroll_to(self.first + step)
+        row = self.item_rows.get(edge)
+        if row is not None:
+            self.selected_key = self.key(row)
+            self.tree.selection_set(edge)
+        return "break"
+
+    def on_select(self, event=None):
+        """Запоминаем выделенную строку по ключу, а не по элементу пула"""
+        sel = self.tree.selection()
+        if sel == self.rendered_selection:
+            return  # событие от собственной перерисовки
+        row = self.item_rows.get(sel[0]) if sel else None
+        self.selected_key = self.key(row) if row is not None else None
@@ -5,7 +5,6 @@ import re
 import os
 import sys
 from datetime import date, timedelta
-from tkinter import font
 from typing import Optional
 
 
@@ -41,47 +40,54 @@ def subtract_months(from_date: date, months: int) -> date:
     return date(year, month, day)
 
 
-def get_default_quarantine_cage(taken_cages: list) -> str:
-    """Генерирует номер свободной карантинной клетки"""
-    # Таблица замены кириллических букв на латинские
-    CYRILLIC_TO_LATIN = str.maketrans({
-        'А': 'A', 'В': 'B', 'С': 'C', 'Е': 'E',
-        'а': 'a', 'в': 'b', 'с': 'c', 'е': 'e',
-    })
-    
-    used = set()
-    for cn in taken_cages:
-        if cn.startswith("К"):
-            hex_part = cn[1:].translate(CYRILLIC_TO_LATIN)
-            try:
-                num = int(hex_part, 16)
-                used.add(num)
-            except ValueError:
-                print(f"⚠ Некорректный номер клетки: {cn}")
-    
-    # Ищем первый свободный номер
-    for i in range(0x10000):
-        if i not in used:
-            return f"К{i:04X}"
-    
-    raise RuntimeError("Нет свободных карантинных клеток")
+# Таблица замены кириллических букв на латинские
+CYRILLIC_TO_LATIN = str.maketrans({
+    'А': 'A', 'В': 'B', 'С': 'C', 'Е': 'E',
+    'а': 'a', 'в': 'b', 'с': 'c', 'е': 'e',
+})
+
+
+# Серии клеток: К — карантинные, О — обычные
+CAGE_SERIES = ("К", "О")
+
+
+def parse_cage_number(cage_number: Optional[str]) -> Optional[tuple[str, int]]:
+    """
+    Разбирает номер клетки: 'К00А1' -> ('К', 0xA1).
+    Кириллические буквы в шестнадцатеричной части допускаются (старые данные).
+    Для пустых и нестандартных номеров возвращает None.
+    """
+    if not cage_number or cage_number[0] not in CAGE_SERIES:
+        return None
+    hex_part = cage_number[1:].translate(CYRILLIC_TO_LATIN)
+    if not re.fullmatch(r'[0-9A-Fa-f]{4}', hex_part):
+        return None
+    return cage_number[0], int(hex_part, 16)
+
+
+def format_cage_number(series: str, num: int) -> str:
+    """Канонический номер клетки: ('К', 0xA1) -> 'К00A1'"""
+    return f"{series}{num:04X}"
+
+
+def canonical_cage_number(cage_number: str) -> str:
+    """Номер клетки в каноническом виде (нестандартный — как есть)"""
+    parsed = parse_cage_number(cage_number)
+    return format_cage_number(*parsed) if parsed else cage_number
 
 
 def autofit_treeview_columns(tree, columns: list, padding: int = 10):
-    """Автоматически подгоняет ширину колонок Treeview под содержимое"""
-    tv_font = font.nametofont("TkDefaultFont")
-
-    for col in columns:
-        # Измеряем ширину заголовка
-        max_width = tv_font.measure(col)
-        # Измеряем каждую ячейку в этой колонке
-        for item in tree.get_children():
-            cell_text = str(tree.set(item, col))
-            w = tv_font.measure(cell_text)
-            if w > max_width:
-                max_width = w
-        # Устанавливаем ширину + padding
-        tree.column(col, width=max_width + padding)
+    """
+    Автоматически подгоняет ширину колонок Treeview под содержимое.
+    Ширины строк берутся из общего кэша измерений (ui.text_metrics);
+    для таблиц, которые обновляются построчно, — ui.text_metrics.ColumnAutofit.
+    """
+    from ui.text_metrics import ColumnAutofit
+
+    autofit = ColumnAutofit(columns, padding)
+    for item in tree.get_children():
+        autofit.add(item, [tree.set(item, col) for col in columns])
+    autofit.apply(tree)
 
 
 def open_folder_in_explorer(folder_path: str):
@@ -98,20 +104,10 @@ def open_folder_in_explorer(folder_path: str):
 
 
 def truncate_text_for_width(text: str, font_obj, max_width: int) -> str:
-    """Обрезает текст до указанной ширины с добавлением '...'"""
-    if font_obj.measure(text) <= max_width:
-        return text
-    
-    # Бинарный поиск максимальной длины
-    lo, hi = 0, len(text)
-    while lo < hi:
-        mid = (lo + hi) // 2
-        if font_obj.measure(text[:mid] + '...') <= max_width:
-            lo = mid + 1
-        else:
-            hi = mid
-    
-    return text[:lo-1] + '...' if lo > 0 else '...'
+    """Обрезает текст до указанной ширины с добавлением '...' (с кэшем измерений)"""
+    from ui.text_metrics import measurer
+
+    return measurer.truncate(text, max_width, font_obj)
 
 
 def format_species_display(species: str, breed: str) -> str: